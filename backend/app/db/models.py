@@ -2,8 +2,8 @@
 SQLAlchemy models for statsmed: User, DataFile, AnalysisResult.
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, UniqueConstraint
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, ForeignKey, Boolean, UniqueConstraint, Index
+from sqlalchemy.orm import relationship, declarative_base, deferred
 
 Base = declarative_base()
 
@@ -80,6 +80,8 @@ class QualityControlOperation(Base):
     api_key = Column(String(64), nullable=False, unique=True, index=True)
     is_public = Column(Boolean, nullable=False, default=False)
     last_sample_json = Column(Text, nullable=True)
+    # Bumped whenever the operation's functions change; keys the compiled QC plan cache.
+    config_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -94,7 +96,12 @@ class QualityControlOperation(Base):
         "QualityControlRun",
         back_populates="operation",
         cascade="all, delete-orphan",
-        order_by="QualityControlRun.created_at.desc()",
+        order_by="(QualityControlRun.created_at.desc(), QualityControlRun.id.desc())",
+    )
+    jobs = relationship(
+        "QualityControlJob",
+        back_populates="operation",
+        cascade="all, delete-orphan",
     )
 
     __table_args__ = (UniqueConstraint("user_id", "name", name="uq_user_qc_operation_name"),)
@@ -133,12 +140,115 @@ class QualityControlRun(Base):
     sample_date = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_quality_control_runs_operation_created", "operation_id", "created_at"),
+    )
+
     @property
     def effective_date(self) -> datetime:
         """The date to use for charts: sample_date if provided, otherwise created_at."""
         return self.sample_date or self.created_at
 
     operation = relationship("QualityControlOperation", back_populates="runs")
+    chart_points = relationship(
+        "QualityControlChartPoint",
+        back_populates="run",
+        cascade="all, delete-orphan",
+    )
 
     def __repr__(self):
         return f"<QualityControlRun(id={self.id}, operation_id={self.operation_id}, success={self.success})>"
+
+
+class QualityControlChartPoint(Base):
+    """One chart data point extracted from a QC run's results at insert time.
+
+    Chart history is read from this table with one indexed range query instead of
+    decoding every run's results_json. chart_type is the runner's chart_data type;
+    column_key identifies the configured column(s). value/std/n hold the numeric
+    fields of the chart (accepted/total, mean/std/n, count/n or a single value).
+    """
+    __tablename__ = "qc_chart_points"
+
+    id = Column(Integer, primary_key=True, index=True)
+    operation_id = Column(Integer, ForeignKey("quality_control_operations.id", ondelete="CASCADE"), nullable=False)
+    run_id = Column(Integer, ForeignKey("quality_control_runs.id", ondelete="CASCADE"), nullable=False, index=True)
+    chart_type = Column(String(40), nullable=False)
+    column_key = Column(String(512), nullable=False, default="")
+    effective_date = Column(DateTime, nullable=False)
+    value = Column(Float, nullable=True)
+    std = Column(Float, nullable=True)
+    n = Column(Float, nullable=True)
+
+    run = relationship("QualityControlRun", back_populates="chart_points")
+
+    __table_args__ = (
+        Index("ix_qc_chart_points_history", "operation_id", "chart_type", "column_key", "effective_date"),
+    )
+
+    def __repr__(self):
+        return f"<QualityControlChartPoint(id={self.id}, run_id={self.run_id}, chart_type='{self.chart_type}')>"
+
+
+class QualityControlChartState(Base):
+    """Persisted state of one history-based control chart (Laney p'/X'/u', I-MR) of an operation.
+
+    state_json holds the running sums of the history window, its last point and the
+    last successful prospective baseline; chart_json is the ready-to-serve chart_data.
+    The per-point inputs live in qc_chart_points only. seen_run_id is the newest run
+    already taken into account, so new runs are appended instead of recomputing the
+    chart from the whole history.
+    """
+    __tablename__ = "qc_chart_states"
+
+    id = Column(Integer, primary_key=True, index=True)
+    operation_id = Column(Integer, ForeignKey("quality_control_operations.id", ondelete="CASCADE"), nullable=False)
+    chart_type = Column(String(40), nullable=False)
+    column_key = Column(String(512), nullable=False, default="")
+    config_key = Column(String(255), nullable=False)
+    seen_run_id = Column(Integer, nullable=False, default=0)
+    window_start = Column(DateTime, nullable=True)
+    state_json = Column(Text, nullable=False)
+    chart_json = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("operation_id", "chart_type", "column_key", "config_key", name="uq_qc_chart_state"),
+    )
+
+    def __repr__(self):
+        return f"<QualityControlChartState(id={self.id}, operation_id={self.operation_id}, chart_type='{self.chart_type}')>"
+
+
+class QualityControlJob(Base):
+    """Queued asynchronous QC run (POST /api/quality/run/async), processed by a worker.
+
+    status moves queued -> running -> done | failed. The job is marked done in the
+    same transaction that inserts its run (run_id), so a worker that dies afterwards
+    cannot cause the run to be inserted twice. payload_json and result_json are
+    deferred: they are only loaded when the job is executed or its result read.
+    """
+    __tablename__ = "qc_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    operation_id = Column(Integer, ForeignKey("quality_control_operations.id", ondelete="CASCADE"), nullable=False, index=True)
+    status = Column(String(16), nullable=False, default="queued")
+    payload_json = deferred(Column(Text, nullable=False))
+    sample_date = Column(DateTime, nullable=True)
+    run_id = Column(Integer, ForeignKey("quality_control_runs.id", ondelete="SET NULL"), nullable=True)
+    result_json = deferred(Column(Text, nullable=True))
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    operation = relationship("QualityControlOperation", back_populates="jobs")
+
+    __table_args__ = (
+        Index("ix_qc_jobs_status_id", "status", "id"),
+    )
+
+    def __repr__(self):
+        return f"<QualityControlJob(id={self.id}, operation_id={self.operation_id}, status='{self.status}')>"
@@ -4,8 +4,10 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import inspect, text
 
-from .db.database import engine
+from .db.database import engine, SessionLocal
 from .db.models import Base
+from .services.chart_history import backfill_chart_points
+from .services.qc_executor import qc_executor
 from .routers import auth, data, quality
 
 _is_production = os.getenv("ENV", "").lower() == "production"
@@ -44,6 +46,7 @@ def _run_migrations():
         ("quality_control_operations", "is_public", "BOOLEAN NOT NULL DEFAULT FALSE"),
         ("quality_control_operations", "last_sample_json", "TEXT"),
         ("quality_control_runs", "sample_date", "TIMESTAMP"),
+        ("quality_control_operations", "config_version", "INTEGER NOT NULL DEFAULT 0"),
     ]
     with engine.begin() as conn:
         for table, column, col_def in migrations:
@@ -57,10 +60,24 @@ def _run_migrations():
 @app.on_event("startup")
 def on_startup():
     _run_migrations()
+    had_chart_points = "qc_chart_points" in inspect(engine).get_table_names()
     Base.metadata.create_all(bind=engine)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    if not had_chart_points:
+        with SessionLocal() as db:
+            n = backfill_chart_points(db)
+        print(f"  Migration: backfilled {n} qc_chart_points from existing runs")
+    qc_executor.warm_up()
     print("Statsmed API started; database tables ready.")
 
 
+@app.on_event("shutdown")
+def on_shutdown():
+    qc_executor.shutdown()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -1,30 +1,35 @@
 """
 Quality control: operations (name + API key) and functions that run on incoming data.
-CRUD requires auth; POST /run uses API key in header.
+CRUD requires auth; POST /run and POST /run/async (queued, see app.worker) use API key in header.
 """
 import json
-import math
+import os
 import secrets
 from datetime import datetime, timedelta
 from typing import Any, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, insert, select
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
 from ..db.database import get_db
-from ..db.models import User, QualityControlOperation, QualityControlFunction, QualityControlRun
+from ..db.models import User, QualityControlOperation, QualityControlFunction, QualityControlRun, QualityControlJob
 from ..auth import get_current_user
-from ..services.quality_engine import (
-    run_quality_checks,
-    compute_laney_p_chart,
-    compute_laney_x_chart,
-    compute_laney_u_chart,
-    compute_i_mr_chart,
-)
+from ..services.quality_engine import run_quality_checks, run_quality_checks_batch
+from ..services.chart_history import ChartHistory, add_chart_points, insert_chart_points, u_chart_key
+from ..services.chart_state import ChartStates, invalidate_chart_states
+from ..services.public_cache import etag_matches, public_cache
+from ..services.plan_cache import bump_config_version, plan_cache
+from ..services.qc_executor import qc_executor
+from ..services.qc_jobs import DONE, FAILED, enqueue_job, mark_job_done, set_job_result
 
 router = APIRouter(prefix="/api/quality", tags=["quality"])
 
+# POST /run/bulk is synchronous; larger backfills are split across requests.
+BULK_MAX_SAMPLES = int(os.getenv("QC_BULK_MAX_SAMPLES", "1000"))
+
 
 # ----- Schemas -----
 
@@ -74,6 +79,21 @@ class RunPayload(BaseModel):
     date: Optional[str] = None
 
 
+class BulkRunPayload(BaseModel):
+    samples: list[RunPayload]
+
+
+class JobResponse(BaseModel):
+    job_id: int
+    status: str  # "queued", "running", "done", "failed"
+    run_id: Optional[int] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+
 def ensure_user_owns_operation(db: Session, user: User, operation_id: int) -> QualityControlOperation:
     op = db.query(QualityControlOperation).filter(
         QualityControlOperation.id == operation_id,
@@ -175,6 +195,7 @@ def update_operation(
     if body.is_public is not None:
         op.is_public = body.is_public
     db.commit()
+    public_cache.invalidate(op.id)
     db.refresh(op)
     return _op_response(op)
 
@@ -188,6 +209,8 @@ def delete_operation(
     op = ensure_user_owns_operation(db, current_user, operation_id)
     db.delete(op)
     db.commit()
+    public_cache.invalidate(operation_id)
+    plan_cache.invalidate(operation_id)
     return {"success": True}
 
 
@@ -215,7 +238,9 @@ def create_function(
         sort_order=sort_order,
     )
     db.add(fn)
+    bump_config_version(db, op.id)
     db.commit()
+    plan_cache.invalidate(op.id)
     db.refresh(fn)
     return FunctionResponse(
         id=fn.id,
@@ -273,7 +298,10 @@ def update_function(
         fn.config_json = json.dumps(body.config)
     if body.sort_order is not None:
         fn.sort_order = body.sort_order
+    invalidate_chart_states(db, operation_id)
+    bump_config_version(db, operation_id)
     db.commit()
+    plan_cache.invalidate(operation_id)
     db.refresh(fn)
     return FunctionResponse(
         id=fn.id,
@@ -300,45 +328,31 @@ def delete_function(
     if not fn:
         raise HTTPException(status_code=404, detail="Function not found")
     db.delete(fn)
+    invalidate_chart_states(db, operation_id)
+    bump_config_version(db, operation_id)
     db.commit()
+    plan_cache.invalidate(operation_id)
     return {"success": True}
 
 
 # ----- Helpers -----
 
-def _build_acceptance_history(db: Session, operation_id: int) -> list[dict]:
+def _build_acceptance_history(history: ChartHistory) -> list[dict]:
     """Collect acceptance-rate data points from past runs (up to 1 year)."""
-    cutoff = datetime.utcnow() - timedelta(days=365)
-    runs = (
-        db.query(QualityControlRun)
-        .filter(
-            QualityControlRun.operation_id == operation_id,
-            QualityControlRun.created_at >= cutoff,
-        )
-        .order_by(QualityControlRun.created_at.asc())
-        .all()
-    )
     points: list[dict] = []
-    for run in runs:
-        try:
-            results = json.loads(run.results_json)
-        except (json.JSONDecodeError, TypeError):
-            continue
-        for r in results:
-            cd = r.get("chart_data")
-            if cd and cd.get("type") == "acceptance_bar" and cd.get("total", 0) > 0:
-                points.append({
-                    "date": run.effective_date.isoformat(),
-                    "accepted_pct": cd.get("accepted_pct", 0),
-                    "rejected_pct": cd.get("rejected_pct", 0),
-                    "total": cd.get("total", 0),
-                    "run_id": run.id,
-                })
-                break
+    for row in history.points("acceptance_bar"):
+        accepted, total = int(row.value), int(row.n)
+        points.append({
+            "date": row.effective_date.isoformat(),
+            "accepted_pct": round(100 * accepted / total, 1),
+            "rejected_pct": round(100 * (total - accepted) / total, 1),
+            "total": total,
+            "run_id": row.run_id,
+        })
     return points
 
 
-def _enrich_acceptance_history(results: list[dict], db: Session, operation_id: int) -> list[dict]:
+def _enrich_acceptance_history(results: list[dict], history: ChartHistory) -> list[dict]:
     """If any result has type acceptance_history, inject the actual history points."""
     needs_history = any(
         r.get("chart_data", {}).get("type") == "acceptance_history"
@@ -346,45 +360,14 @@ def _enrich_acceptance_history(results: list[dict], db: Session, operation_id: i
     )
     if not needs_history:
         return results
-    points = _build_acceptance_history(db, operation_id)
+    points = _build_acceptance_history(history)
     for r in results:
         if r.get("chart_data", {}).get("type") == "acceptance_history":
             r["chart_data"]["points"] = points
     return results
 
 
-def _build_laney_p_history(db: Session, operation_id: int) -> list[dict]:
-    """Collect accepted/total data points from past runs for Laney p' computation."""
-    cutoff = datetime.utcnow() - timedelta(days=365)
-    runs = (
-        db.query(QualityControlRun)
-        .filter(
-            QualityControlRun.operation_id == operation_id,
-            QualityControlRun.created_at >= cutoff,
-        )
-        .order_by(QualityControlRun.created_at.asc())
-        .all()
-    )
-    points: list[dict] = []
-    for run in runs:
-        try:
-            results = json.loads(run.results_json)
-        except (json.JSONDecodeError, TypeError):
-            continue
-        for r in results:
-            cd = r.get("chart_data")
-            if cd and cd.get("type") == "acceptance_bar" and cd.get("total", 0) > 0:
-                points.append({
-                    "date": run.effective_date.isoformat(),
-                    "accepted": cd.get("accepted", 0),
-                    "total": cd.get("total", 0),
-                    "run_id": run.id,
-                })
-                break
-    return points
-
-
-def _enrich_laney_p_chart(results: list[dict], db: Session, operation_id: int) -> list[dict]:
+def _enrich_laney_p_chart(results: list[dict], charts: ChartStates) -> list[dict]:
     """If any result has type laney_p_chart, compute and inject the actual chart data."""
     needs_laney = any(
         r.get("chart_data", {}).get("type") == "laney_p_chart"
@@ -392,58 +375,15 @@ def _enrich_laney_p_chart(results: list[dict], db: Session, operation_id: int) -
     )
     if not needs_laney:
         return results
-    history = _build_laney_p_history(db, operation_id)
     for r in results:
         cd = r.get("chart_data", {})
         if cd.get("type") == "laney_p_chart":
             k = cd.get("k", 3.0)
-            r["chart_data"] = compute_laney_p_chart(history, k=k)
+            r["chart_data"] = charts.chart("laney_p_chart", "", k)
     return results
 
 
-def _build_laney_x_history(db: Session, operation_id: int, column: str) -> list[dict]:
-    """Collect per-run summary stats from past laney_x_chart results."""
-    cutoff = datetime.utcnow() - timedelta(days=365)
-    runs = (
-        db.query(QualityControlRun)
-        .filter(
-            QualityControlRun.operation_id == operation_id,
-            QualityControlRun.created_at >= cutoff,
-        )
-        .order_by(QualityControlRun.created_at.asc())
-        .all()
-    )
-    points: list[dict] = []
-    for run in runs:
-        try:
-            results = json.loads(run.results_json)
-        except (json.JSONDecodeError, TypeError):
-            continue
-        for r in results:
-            cd = r.get("chart_data")
-            if cd and cd.get("type") == "laney_x_chart" and cd.get("column") == column:
-                run_mean = cd.get("run_mean")
-                run_std = cd.get("run_std", 0)
-                run_n = cd.get("run_n")
-                if (
-                    run_mean is not None
-                    and run_n is not None
-                    and run_n >= 2
-                    and math.isfinite(float(run_mean))
-                    and math.isfinite(float(run_std))
-                ):
-                    points.append({
-                        "date": run.effective_date.isoformat(),
-                        "mean": run_mean,
-                        "std": run_std,
-                        "n": run_n,
-                        "run_id": run.id,
-                    })
-                break
-    return points
-
-
-def _enrich_laney_x_chart(results: list[dict], db: Session, operation_id: int) -> list[dict]:
+def _enrich_laney_x_chart(results: list[dict], charts: ChartStates) -> list[dict]:
     """If any result has type laney_x_chart, compute and inject the actual chart data."""
     needs_laney_x = any(
         r.get("chart_data", {}).get("type") == "laney_x_chart"
@@ -457,8 +397,7 @@ def _enrich_laney_x_chart(results: list[dict], db: Session, operation_id: int) -
             k = cd.get("k", 3.0)
             column = cd.get("column", "")
             try:
-                history = _build_laney_x_history(db, operation_id, column)
-                r["chart_data"] = compute_laney_x_chart(history, k=k)
+                r["chart_data"] = charts.chart("laney_x_chart", column, k)
             except Exception as exc:
                 print(f"[Laney X' enrich] {type(exc).__name__}: {exc}")
                 r["chart_data"] = {
@@ -469,47 +408,7 @@ def _enrich_laney_x_chart(results: list[dict], db: Session, operation_id: int) -
     return results
 
 
-def _build_laney_u_history(db: Session, operation_id: int, count_column: str, n_column: str) -> list[dict]:
-    """Collect per-run count/n data from past laney_u_chart results."""
-    cutoff = datetime.utcnow() - timedelta(days=365)
-    runs = (
-        db.query(QualityControlRun)
-        .filter(
-            QualityControlRun.operation_id == operation_id,
-            QualityControlRun.created_at >= cutoff,
-        )
-        .order_by(QualityControlRun.created_at.asc())
-        .all()
-    )
-    points: list[dict] = []
-    for run in runs:
-        try:
-            results = json.loads(run.results_json)
-        except (json.JSONDecodeError, TypeError):
-            continue
-        for r in results:
-            cd = r.get("chart_data")
-            if cd and cd.get("type") == "laney_u_chart" and cd.get("count_column") == count_column and cd.get("n_column") == n_column:
-                run_count = cd.get("run_count")
-                run_n = cd.get("run_n")
-                if (
-                    run_count is not None
-                    and run_n is not None
-                    and run_n > 0
-                    and math.isfinite(float(run_count))
-                    and math.isfinite(float(run_n))
-                ):
-                    points.append({
-                        "date": run.effective_date.isoformat(),
-                        "count": run_count,
-                        "n": run_n,
-                        "run_id": run.id,
-                    })
-                break
-    return points
-
-
-def _enrich_laney_u_chart(results: list[dict], db: Session, operation_id: int) -> list[dict]:
+def _enrich_laney_u_chart(results: list[dict], charts: ChartStates) -> list[dict]:
     """If any result has type laney_u_chart, compute and inject the actual chart data."""
     needs_laney_u = any(
         r.get("chart_data", {}).get("type") == "laney_u_chart"
@@ -524,8 +423,7 @@ def _enrich_laney_u_chart(results: list[dict], db: Session, operation_id: int) -
             count_column = cd.get("count_column", "")
             n_column = cd.get("n_column", "")
             try:
-                history = _build_laney_u_history(db, operation_id, count_column, n_column)
-                r["chart_data"] = compute_laney_u_chart(history, k=k)
+                r["chart_data"] = charts.chart("laney_u_chart", u_chart_key(count_column, n_column), k)
             except Exception as exc:
                 print(f"[Laney U' enrich] {type(exc).__name__}: {exc}")
                 r["chart_data"] = {
@@ -536,39 +434,19 @@ def _enrich_laney_u_chart(results: list[dict], db: Session, operation_id: int) -
     return results
 
 
-def _build_success_history(db: Session, operation_id: int, column: str) -> list[dict]:
+def _build_success_history(history: ChartHistory, column: str) -> list[dict]:
     """Collect binary values from past runs for the success history chart."""
-    cutoff = datetime.utcnow() - timedelta(days=365)
-    runs = (
-        db.query(QualityControlRun)
-        .filter(
-            QualityControlRun.operation_id == operation_id,
-            QualityControlRun.created_at >= cutoff,
-        )
-        .order_by(QualityControlRun.created_at.asc())
-        .all()
-    )
-    points: list[dict] = []
-    for run in runs:
-        try:
-            results = json.loads(run.results_json)
-        except (json.JSONDecodeError, TypeError):
-            continue
-        for r in results:
-            cd = r.get("chart_data")
-            if cd and cd.get("type") == "success_history" and cd.get("column") == column:
-                run_value = cd.get("run_value")
-                if run_value is not None and run_value in (0, 1, 0.0, 1.0):
-                    points.append({
-                        "date": run.effective_date.isoformat(),
-                        "value": int(run_value),
-                        "run_id": run.id,
-                    })
-                break
-    return points
+    return [
+        {
+            "date": row.effective_date.isoformat(),
+            "value": int(row.value),
+            "run_id": row.run_id,
+        }
+        for row in history.points("success_history", column)
+    ]
 
 
-def _enrich_success_history(results: list[dict], db: Session, operation_id: int) -> list[dict]:
+def _enrich_success_history(results: list[dict], history: ChartHistory) -> list[dict]:
     """If any result has type success_history, inject the actual history points."""
     needs = any(
         r.get("chart_data", {}).get("type") == "success_history"
@@ -580,44 +458,12 @@ def _enrich_success_history(results: list[dict], db: Session, operation_id: int)
         cd = r.get("chart_data", {})
         if cd.get("type") == "success_history":
             column = cd.get("column", "")
-            points = _build_success_history(db, operation_id, column)
+            points = _build_success_history(history, column)
             r["chart_data"] = {"type": "success_history", "points": points}
     return results
 
 
-def _build_i_mr_history(db: Session, operation_id: int, column: str) -> list[dict]:
-    """Collect individual continuous values from past runs for the I-MR chart."""
-    cutoff = datetime.utcnow() - timedelta(days=365)
-    runs = (
-        db.query(QualityControlRun)
-        .filter(
-            QualityControlRun.operation_id == operation_id,
-            QualityControlRun.created_at >= cutoff,
-        )
-        .order_by(QualityControlRun.created_at.asc())
-        .all()
-    )
-    points: list[dict] = []
-    for run in runs:
-        try:
-            results = json.loads(run.results_json)
-        except (json.JSONDecodeError, TypeError):
-            continue
-        for r in results:
-            cd = r.get("chart_data")
-            if cd and cd.get("type") == "i_mr_chart" and cd.get("column") == column:
-                run_value = cd.get("run_value")
-                if run_value is not None and math.isfinite(float(run_value)):
-                    points.append({
-                        "date": run.effective_date.isoformat(),
-                        "value": float(run_value),
-                        "run_id": run.id,
-                    })
-                break
-    return points
-
-
-def _enrich_i_mr_chart(results: list[dict], db: Session, operation_id: int) -> list[dict]:
+def _enrich_i_mr_chart(results: list[dict], charts: ChartStates) -> list[dict]:
     """If any result has type i_mr_chart, compute and inject the actual chart data."""
     needs = any(
         r.get("chart_data", {}).get("type") == "i_mr_chart"
@@ -631,8 +477,7 @@ def _enrich_i_mr_chart(results: list[dict], db: Session, operation_id: int) -> l
             k = cd.get("k", 3.0)
             column = cd.get("column", "")
             try:
-                history = _build_i_mr_history(db, operation_id, column)
-                r["chart_data"] = compute_i_mr_chart(history, k=k)
+                r["chart_data"] = charts.chart("i_mr_chart", column, k)
             except Exception as exc:
                 print(f"[I-MR enrich] {type(exc).__name__}: {exc}")
                 r["chart_data"] = {
@@ -642,6 +487,29 @@ def _enrich_i_mr_chart(results: list[dict], db: Session, operation_id: int) -> l
     return results
 
 
+def _enrich_charts(
+    results: list[dict],
+    db: Session,
+    operation_id: int,
+    latest_run_id: int,
+    lock: bool = False,
+) -> list[dict]:
+    """Inject history-based chart data, reading the operation's history once for all charts.
+
+    Control charts come from their persisted state (see services.chart_state); the
+    caller commits the state updates.
+    """
+    history = ChartHistory(db, operation_id)
+    charts = ChartStates(db, operation_id, latest_run_id, history, lock=lock)
+    results = _enrich_acceptance_history(results, history)
+    results = _enrich_laney_p_chart(results, charts)
+    results = _enrich_laney_x_chart(results, charts)
+    results = _enrich_laney_u_chart(results, charts)
+    results = _enrich_success_history(results, history)
+    results = _enrich_i_mr_chart(results, charts)
+    return results
+
+
 # ----- Run (API key auth) -----
 
 def get_operation_by_api_key(
@@ -656,46 +524,47 @@ def get_operation_by_api_key(
     return op
 
 
-@router.post("/run")
-def run_quality(
-    body: RunPayload,
-    operation: QualityControlOperation = Depends(get_operation_by_api_key),
-    db: Session = Depends(get_db),
-):
-    """Run this operation's functions on the provided data. Authenticate with header: X-API-Key: <your-key>."""
+def _parse_run_payload(body: RunPayload) -> tuple[Any, Optional[datetime]]:
     data = body.data
     if not data:
         raise HTTPException(status_code=400, detail="'data' is required")
     if not isinstance(data, (list, dict)):
         raise HTTPException(status_code=400, detail="'data' must be a list of objects or a dict of lists")
-    fns = (
-        db.query(QualityControlFunction)
-        .filter(QualityControlFunction.operation_id == operation.id)
-        .order_by(QualityControlFunction.sort_order, QualityControlFunction.id)
-        .all()
-    )
-    function_specs = []
-    for f in fns:
-        config = json.loads(f.config_json) if f.config_json else None
-        function_specs.append((f.name, f.function_type, config or {}))
-    results = run_quality_checks(data, function_specs)
-    all_passed = all(r["passed"] for r in results)
-
-    MAX_SAMPLE_ROWS = 100
-    if isinstance(data, list):
-        sample = data[:MAX_SAMPLE_ROWS]
-        row_count = len(data)
-    else:
-        sample = {k: v[:MAX_SAMPLE_ROWS] if isinstance(v, list) else v for k, v in data.items()}
-        row_count = max((len(v) for v in data.values() if isinstance(v, list)), default=0)
-    operation.last_sample_json = json.dumps(sample)
-
     sample_date = None
     if body.date:
         try:
             sample_date = datetime.fromisoformat(body.date)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid date format — use ISO 8601 (e.g. 2024-06-15 or 2024-06-15T10:30:00)")
+    return data, sample_date
+
+
+def _sample_and_row_count(data: Any) -> tuple[Any, int]:
+    MAX_SAMPLE_ROWS = 100
+    if isinstance(data, list):
+        return data[:MAX_SAMPLE_ROWS], len(data)
+    sample = {k: v[:MAX_SAMPLE_ROWS] if isinstance(v, list) else v for k, v in data.items()}
+    return sample, max((len(v) for v in data.values() if isinstance(v, list)), default=0)
+
+
+def execute_run(
+    db: Session,
+    operation: QualityControlOperation,
+    data: Any,
+    sample_date: Optional[datetime],
+    job: Optional[QualityControlJob] = None,
+) -> dict:
+    """Run the operation's functions on data, store the run and return the response body.
+
+    Shared by POST /run and the job worker (app.worker). For a job, the job is
+    marked done in the transaction that inserts the run.
+    """
+    plan = plan_cache.get(db, operation)
+    results = run_quality_checks(data, plan, qc_executor)
+    all_passed = all(r["passed"] for r in results)
+
+    sample, row_count = _sample_and_row_count(data)
+    operation.last_sample_json = json.dumps(sample)
 
     run_record = QualityControlRun(
         operation_id=operation.id,
@@ -705,88 +574,267 @@ def run_quality(
         sample_date=sample_date,
     )
     db.add(run_record)
+    db.flush()
+    add_chart_points(db, run_record, results)
+    response = {
+        "operation_id": operation.id,
+        "operation_name": operation.name,
+        "success": all_passed,
+        "results": results,
+    }
+    if job is not None:
+        mark_job_done(db, job, run_record.id, response)
+    db.commit()
+
+    try:
+        results = _enrich_charts(results, db, operation.id, run_record.id, lock=True)
+        response = {**response, "results": results}
+        if job is not None:
+            set_job_result(db, job.id, response)
+        db.commit()
+        if job is None:
+            # A worker process serves no public requests, so only the API fills its cache.
+            public_cache.put(operation.id, run_record.id, _public_operation_payload(operation, run_record, results))
+    except Exception as exc:
+        db.rollback()
+        public_cache.invalidate(operation.id)
+        print(f"[QC enrich] {type(exc).__name__}: {exc}")
+
+    return response
+
+
+@router.post("/run")
+def run_quality(
+    body: RunPayload,
+    operation: QualityControlOperation = Depends(get_operation_by_api_key),
+    db: Session = Depends(get_db),
+):
+    """Run this operation's functions on the provided data. Authenticate with header: X-API-Key: <your-key>."""
+    data, sample_date = _parse_run_payload(body)
+    return execute_run(db, operation, data, sample_date)
+
+
+@router.post("/run/bulk")
+def run_quality_bulk(
+    body: BulkRunPayload,
+    operation: QualityControlOperation = Depends(get_operation_by_api_key),
+    db: Session = Depends(get_db),
+):
+    """Backfill many dated samples at once. Authenticate with header: X-API-Key: <your-key>.
+
+    Stores the same runs as one POST /run per sample in the given order, but evaluates
+    the samples together, inserts the runs and their chart points with one bulk INSERT
+    each in a single transaction and updates the charts once, for the last sample,
+    instead of after every sample. At most QC_BULK_MAX_SAMPLES samples per request.
+    Returns the run ids and outcomes of all samples and the POST /run results of the
+    last one.
+    """
+    if not body.samples:
+        raise HTTPException(status_code=400, detail="'samples' is required")
+    if len(body.samples) > BULK_MAX_SAMPLES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BULK_MAX_SAMPLES} samples per request; split the backfill into several requests",
+        )
+    samples = []
+    for i, sample_body in enumerate(body.samples):
+        try:
+            samples.append(_parse_run_payload(sample_body))
+        except HTTPException as exc:
+            raise HTTPException(status_code=exc.status_code, detail=f"samples[{i}]: {exc.detail}")
+
+    plan = plan_cache.get(db, operation)
+    all_results = run_quality_checks_batch([data for data, _ in samples], plan, qc_executor)
+
+    # Distinct, increasing timestamps as with one POST /run per sample: the latest
+    # run is the last sample, and undated samples keep their order on the charts.
+    start = datetime.utcnow()
+    run_rows = []
+    for i, ((data, sample_date), results) in enumerate(zip(samples, all_results)):
+        run_rows.append({
+            "operation_id": operation.id,
+            "success": all(r["passed"] for r in results),
+            "results_json": json.dumps(results),
+            "row_count": _sample_and_row_count(data)[1],
+            "sample_date": sample_date,
+            "created_at": start + timedelta(microseconds=i),
+        })
+    run_ids = db.execute(
+        insert(QualityControlRun).returning(QualityControlRun.id, sort_by_parameter_order=True),
+        run_rows,
+    ).scalars().all()
+    insert_chart_points(db, operation.id, [
+        (run_id, row["sample_date"] or row["created_at"], results)
+        for run_id, row, results in zip(run_ids, run_rows, all_results)
+    ])
+    operation.last_sample_json = json.dumps(_sample_and_row_count(samples[-1][0])[0])
     db.commit()
 
+    latest_run = db.get(QualityControlRun, run_ids[-1])
+    results = all_results[-1]
     try:
-        results = _enrich_acceptance_history(results, db, operation.id)
-        results = _enrich_laney_p_chart(results, db, operation.id)
-        results = _enrich_laney_x_chart(results, db, operation.id)
-        results = _enrich_laney_u_chart(results, db, operation.id)
-        results = _enrich_success_history(results, db, operation.id)
-        results = _enrich_i_mr_chart(results, db, operation.id)
+        results = _enrich_charts(results, db, operation.id, latest_run.id, lock=True)
+        db.commit()
+        public_cache.put(operation.id, latest_run.id, _public_operation_payload(operation, latest_run, results))
     except Exception as exc:
+        db.rollback()
+        public_cache.invalidate(operation.id)
         print(f"[QC enrich] {type(exc).__name__}: {exc}")
 
     return {
         "operation_id": operation.id,
         "operation_name": operation.name,
-        "success": all_passed,
+        "success": all(row["success"] for row in run_rows),
+        "runs": [
+            {
+                "run_id": run_id,
+                "success": row["success"],
+                "sample_date": row["sample_date"].isoformat() if row["sample_date"] else None,
+            }
+            for run_id, row in zip(run_ids, run_rows)
+        ],
         "results": results,
     }
 
 
+def _job_response(job: QualityControlJob) -> JobResponse:
+    return JobResponse(
+        job_id=job.id,
+        status=job.status,
+        run_id=job.run_id,
+        attempts=job.attempts or 0,
+        error=job.error,
+        created_at=job.created_at.isoformat(),
+        started_at=job.started_at.isoformat() if job.started_at else None,
+        finished_at=job.finished_at.isoformat() if job.finished_at else None,
+    )
+
+
+def _get_operation_job(db: Session, operation: QualityControlOperation, job_id: int) -> QualityControlJob:
+    job = db.query(QualityControlJob).filter(
+        QualityControlJob.id == job_id,
+        QualityControlJob.operation_id == operation.id,
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/run/async", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+def enqueue_quality_run(
+    body: RunPayload,
+    operation: QualityControlOperation = Depends(get_operation_by_api_key),
+    db: Session = Depends(get_db),
+):
+    """Queue a run of this operation's functions and return its job id immediately.
+
+    A worker (python -m backend.app.worker) executes it; poll GET /jobs/{job_id}
+    and fetch the same body as POST /run from GET /jobs/{job_id}/result.
+    """
+    data, sample_date = _parse_run_payload(body)
+    job = enqueue_job(db, operation.id, data, sample_date)
+    db.commit()
+    db.refresh(job)
+    return _job_response(job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(
+    job_id: int,
+    operation: QualityControlOperation = Depends(get_operation_by_api_key),
+    db: Session = Depends(get_db),
+):
+    """Status of a queued run. Authenticate with the operation's X-API-Key."""
+    return _job_response(_get_operation_job(db, operation, job_id))
+
+
+@router.get("/jobs/{job_id}/result")
+def get_job_result(
+    job_id: int,
+    operation: QualityControlOperation = Depends(get_operation_by_api_key),
+    db: Session = Depends(get_db),
+):
+    """Result of a queued run: the POST /run body once done, 202 with the job status while pending."""
+    job = _get_operation_job(db, operation, job_id)
+    if job.status == DONE:
+        return Response(content=job.result_json, media_type="application/json")
+    if job.status == FAILED:
+        raise HTTPException(status_code=409, detail=f"Job failed: {job.error}")
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=_job_response(job).model_dump())
+
+
 # ----- Public read-only endpoints (no auth) -----
 
 @router.get("/public")
 def list_public_operations(db: Session = Depends(get_db)):
-    """List all QC operations marked as public, with summary of their latest run."""
-    ops = (
-        db.query(QualityControlOperation)
-        .filter(QualityControlOperation.is_public == True)  # noqa: E712
-        .order_by(QualityControlOperation.name)
-        .all()
+    """List all QC operations marked as public, with summary of their latest run.
+
+    One query regardless of the number of operations: owners are joined,
+    function counts aggregated and the latest run picked with a window function.
+    """
+    Op, Run, Fn = QualityControlOperation, QualityControlRun, QualityControlFunction
+    public_ids = select(Op.id).where(Op.is_public == True)  # noqa: E712
+    fn_counts = (
+        select(Fn.operation_id, func.count(Fn.id).label("function_count"))
+        .group_by(Fn.operation_id)
+        .subquery()
+    )
+    ranked_runs = (
+        select(
+            Run.operation_id,
+            Run.id,
+            Run.success,
+            Run.row_count,
+            Run.created_at,
+            func.row_number().over(
+                partition_by=Run.operation_id,
+                order_by=(Run.created_at.desc(), Run.id.desc()),
+            ).label("rank"),
+        )
+        .where(Run.operation_id.in_(public_ids))
+        .subquery()
     )
-    result = []
-    for op in ops:
-        latest_run = (
-            db.query(QualityControlRun)
-            .filter(QualityControlRun.operation_id == op.id)
-            .order_by(QualityControlRun.created_at.desc())
-            .first()
+    stmt = (
+        select(
+            Op.id,
+            Op.name,
+            Op.created_at,
+            User.username,
+            func.coalesce(fn_counts.c.function_count, 0).label("function_count"),
+            ranked_runs.c.id.label("run_id"),
+            ranked_runs.c.success,
+            ranked_runs.c.row_count,
+            ranked_runs.c.created_at.label("run_created_at"),
         )
-        result.append({
-            "id": op.id,
-            "name": op.name,
-            "owner": op.user.username,
-            "created_at": op.created_at.isoformat(),
-            "function_count": len(op.functions),
+        .join(User, User.id == Op.user_id)
+        .outerjoin(fn_counts, fn_counts.c.operation_id == Op.id)
+        .outerjoin(ranked_runs, (ranked_runs.c.operation_id == Op.id) & (ranked_runs.c.rank == 1))
+        .where(Op.is_public == True)  # noqa: E712
+        .order_by(Op.name)
+    )
+    return [
+        {
+            "id": row.id,
+            "name": row.name,
+            "owner": row.username,
+            "created_at": row.created_at.isoformat(),
+            "function_count": row.function_count,
             "latest_run": {
-                "id": latest_run.id,
-                "success": latest_run.success,
-                "row_count": latest_run.row_count,
-                "created_at": latest_run.created_at.isoformat(),
-            } if latest_run else None,
-        })
-    return result
+                "id": row.run_id,
+                "success": row.success,
+                "row_count": row.row_count,
+                "created_at": row.run_created_at.isoformat(),
+            } if row.run_id is not None else None,
+        }
+        for row in db.execute(stmt)
+    ]
 
 
-@router.get("/public/{operation_id}")
-def get_public_operation(operation_id: int, db: Session = Depends(get_db)):
-    """Get a single public QC operation with only its latest run results (read-only)."""
-    op = db.query(QualityControlOperation).filter(
-        QualityControlOperation.id == operation_id,
-        QualityControlOperation.is_public == True,  # noqa: E712
-    ).first()
-    if not op:
-        raise HTTPException(status_code=404, detail="Operation not found or not public")
-    latest_run = (
-        db.query(QualityControlRun)
-        .filter(QualityControlRun.operation_id == op.id)
-        .order_by(QualityControlRun.created_at.desc())
-        .first()
-    )
-    latest_results = json.loads(latest_run.results_json) if latest_run else []
-    if latest_run:
-        try:
-            latest_results = _enrich_acceptance_history(latest_results, db, op.id)
-            latest_results = _enrich_laney_p_chart(latest_results, db, op.id)
-            latest_results = _enrich_laney_x_chart(latest_results, db, op.id)
-            latest_results = _enrich_laney_u_chart(latest_results, db, op.id)
-            latest_results = _enrich_success_history(latest_results, db, op.id)
-            latest_results = _enrich_i_mr_chart(latest_results, db, op.id)
-        except Exception as exc:
-            print(f"[QC public enrich] {type(exc).__name__}: {exc}")
-
+def _public_operation_payload(
+    op: QualityControlOperation,
+    latest_run: Optional[QualityControlRun],
+    latest_results: list[dict],
+) -> dict:
     return {
         "id": op.id,
         "name": op.name,
@@ -800,3 +848,47 @@ def get_public_operation(operation_id: int, db: Session = Depends(get_db)):
             "created_at": latest_run.created_at.isoformat(),
         } if latest_run else None,
     }
+
+
+@router.get("/public/{operation_id}")
+def get_public_operation(
+    operation_id: int,
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+):
+    """Get a single public QC operation with only its latest run results (read-only).
+
+    Served from a per-operation response cache with an ETag; a matching
+    If-None-Match returns 304 Not Modified.
+    """
+    op = db.query(QualityControlOperation).filter(
+        QualityControlOperation.id == operation_id,
+        QualityControlOperation.is_public == True,  # noqa: E712
+    ).first()
+    if not op:
+        raise HTTPException(status_code=404, detail="Operation not found or not public")
+    latest_run_id = (
+        db.query(QualityControlRun.id)
+        .filter(QualityControlRun.operation_id == op.id)
+        .order_by(QualityControlRun.created_at.desc(), QualityControlRun.id.desc())
+        .limit(1)
+        .scalar()
+    )
+
+    def build() -> dict:
+        latest_run = db.get(QualityControlRun, latest_run_id) if latest_run_id is not None else None
+        latest_results = json.loads(latest_run.results_json) if latest_run else []
+        if latest_run:
+            try:
+                latest_results = _enrich_charts(latest_results, db, op.id, latest_run.id)
+                db.commit()
+            except Exception as exc:
+                db.rollback()
+                print(f"[QC public enrich] {type(exc).__name__}: {exc}")
+        return _public_operation_payload(op, latest_run, latest_results)
+
+    cached = public_cache.get_or_build(op.id, latest_run_id, build)
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
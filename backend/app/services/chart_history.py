@@ -0,0 +1,173 @@
+"""
+Chart history for quality control operations.
+
+Each run's chart-relevant numbers are written to qc_chart_points when the run is
+inserted, so history is one indexed range query on
+(operation_id, chart_type, column_key, effective_date) instead of decoding the
+results_json of every run in the window.
+"""
+import json
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from ..db.models import QualityControlRun, QualityControlChartPoint
+
+HISTORY_DAYS = 365
+
+
+def u_chart_key(count_column: str, n_column: str) -> str:
+    """column_key for a Laney U' chart, which is identified by two columns."""
+    return json.dumps([count_column, n_column])
+
+
+def _finite(val) -> bool:
+    try:
+        return math.isfinite(float(val))
+    except (TypeError, ValueError):
+        return False
+
+
+def extract_chart_points(results: list[dict]) -> list[dict[str, Any]]:
+    """Extract the chart points of one run from its results.
+
+    Mirrors what the history charts used to read from results_json: for each chart
+    type (and column) the first matching result counts, and it contributes a point
+    only if its values are usable.
+    """
+    points: list[dict[str, Any]] = []
+    seen: set[tuple[str, str]] = set()
+    for r in results:
+        cd = r.get("chart_data")
+        if not cd:
+            continue
+        ctype = cd.get("type")
+        if ctype == "acceptance_bar":
+            if ("acceptance_bar", "") in seen or not cd.get("total", 0) > 0:
+                continue
+            seen.add(("acceptance_bar", ""))
+            points.append({"chart_type": ctype, "column_key": "", "value": cd.get("accepted", 0), "std": None, "n": cd.get("total", 0)})
+        elif ctype == "laney_x_chart":
+            key = cd.get("column") or ""
+            if (ctype, key) in seen:
+                continue
+            seen.add((ctype, key))
+            run_mean, run_std, run_n = cd.get("run_mean"), cd.get("run_std", 0), cd.get("run_n")
+            if run_mean is not None and run_n is not None and run_n >= 2 and _finite(run_mean) and _finite(run_std):
+                points.append({"chart_type": ctype, "column_key": key, "value": run_mean, "std": run_std, "n": run_n})
+        elif ctype == "laney_u_chart":
+            key = u_chart_key(cd.get("count_column"), cd.get("n_column"))
+            if (ctype, key) in seen:
+                continue
+            seen.add((ctype, key))
+            run_count, run_n = cd.get("run_count"), cd.get("run_n")
+            if run_count is not None and run_n is not None and run_n > 0 and _finite(run_count) and _finite(run_n):
+                points.append({"chart_type": ctype, "column_key": key, "value": run_count, "std": None, "n": run_n})
+        elif ctype in ("success_history", "i_mr_chart"):
+            key = cd.get("column") or ""
+            if (ctype, key) in seen:
+                continue
+            seen.add((ctype, key))
+            run_value = cd.get("run_value")
+            if ctype == "success_history":
+                ok = run_value is not None and run_value in (0, 1, 0.0, 1.0)
+            else:
+                ok = run_value is not None and _finite(run_value)
+            if ok:
+                points.append({"chart_type": ctype, "column_key": key, "value": run_value, "std": None, "n": None})
+    return points
+
+
+def chart_point_rows(run: QualityControlRun, results: list[dict]) -> list[dict[str, Any]]:
+    """Rows for qc_chart_points of a flushed run (id and effective_date must be set)."""
+    return [
+        {
+            "operation_id": run.operation_id,
+            "run_id": run.id,
+            "effective_date": run.effective_date,
+            **pt,
+        }
+        for pt in extract_chart_points(results)
+    ]
+
+
+def add_chart_points(db: Session, run: QualityControlRun, results: list[dict]) -> None:
+    """Write the chart points of a run; call after the run has been flushed."""
+    for row in chart_point_rows(run, results):
+        db.add(QualityControlChartPoint(**row))
+
+
+def insert_chart_points(db: Session, operation_id: int, runs: list[tuple[int, datetime, list[dict]]]) -> None:
+    """Bulk-insert the chart points of many runs given as (run_id, effective_date, results)."""
+    rows = [
+        {"operation_id": operation_id, "run_id": run_id, "effective_date": effective_date, **pt}
+        for run_id, effective_date, results in runs
+        for pt in extract_chart_points(results)
+    ]
+    if rows:
+        db.execute(insert(QualityControlChartPoint), rows)
+
+
+def history_cutoff(now: Optional[datetime] = None) -> datetime:
+    return (now or datetime.utcnow()) - timedelta(days=HISTORY_DAYS)
+
+
+class ChartHistory:
+    """Request-scoped chart history of one operation.
+
+    All points in the history window are fetched with a single query on first use
+    and indexed by (chart_type, column_key), so every chart enricher of a request
+    reads from the same in-memory index.
+    """
+
+    def __init__(self, db: Session, operation_id: int, since: Optional[datetime] = None):
+        self.db = db
+        self.operation_id = operation_id
+        self.since = since or history_cutoff()
+        self._index: Optional[dict[tuple[str, str], list]] = None
+
+    def _load(self) -> dict[tuple[str, str], list]:
+        P = QualityControlChartPoint
+        stmt = (
+            select(P.chart_type, P.column_key, P.effective_date, P.run_id, P.value, P.std, P.n)
+            .where(P.operation_id == self.operation_id, P.effective_date >= self.since)
+            .order_by(P.effective_date, P.run_id)
+        )
+        index: dict[tuple[str, str], list] = defaultdict(list)
+        for row in self.db.execute(stmt):
+            index[(row.chart_type, row.column_key)].append(row)
+        return index
+
+    def points(self, chart_type: str, column_key: str = "") -> list:
+        """Points of one chart ordered by effective date.
+
+        Rows have attributes effective_date, run_id, value, std and n.
+        """
+        if self._index is None:
+            self._index = self._load()
+        return self._index.get((chart_type, column_key), [])
+
+
+def backfill_chart_points(db: Session, batch_size: int = 500) -> int:
+    """Populate qc_chart_points from the results_json of existing runs.
+
+    Used once when the table is created on a database that already holds runs.
+    Returns the number of points written.
+    """
+    written = 0
+    runs = db.execute(select(QualityControlRun).execution_options(yield_per=batch_size)).scalars()
+    for run in runs:
+        try:
+            results = json.loads(run.results_json)
+        except (json.JSONDecodeError, TypeError):
+            continue
+        rows = chart_point_rows(run, results)
+        if rows:
+            db.execute(insert(QualityControlChartPoint), rows)
+            written += len(rows)
+    db.commit()
+    return written
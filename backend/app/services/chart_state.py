@@ -0,0 +1,592 @@
+"""
+Persisted incremental state of the history-based control charts.
+
+Laney p', X', u' and I-MR charts use a prospective baseline: point i of the history
+window is judged against limits computed from the window's points before it. Each
+chart of an operation has a row in qc_chart_states: chart_json is the ready-to-serve
+chart_data and state_json the running sums of the window (Σx, Σn for p̄ and ū;
+Σn, Σn·x̄, Σ(n−1), Σ(n−1)s² for x̄̄ and the pooled s; Σx, Σ|Δx| for the I-MR mean
+and MR-bar), the last point and the last successful baseline. The per-point inputs
+are stored only once, in qc_chart_points.
+
+A run dated after the last charted point is appended: its baseline comes from the
+running sums in O(1). Laney sigma_z is the mean moving range of the z-scores about
+the new centre line, which has no running-sum form; it takes one vectorised pass
+over the window's inputs (the request's ChartHistory), O(window).
+
+When points leave the window, the baseline of every later point changes, so the
+chart is recomputed from the window's inputs: prefix sums for everything but
+sigma_z, which comes from a sorted sweep over the moving ranges, O(n log² n) numpy
+work in total instead of one statsmed baseline per point. The same recomputation
+runs when the state is missing or its config (k, columns) changed, after a run was
+deleted, when a run is dated before the last charted point, and while the chart has
+fewer than three points. The output equals statsmed's prospective computation up to
+floating-point rounding.
+"""
+import json
+from datetime import datetime
+from typing import Callable, Optional
+
+import numpy as np
+from sqlalchemy import delete, event, insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..db.models import QualityControlRun, QualityControlChartPoint, QualityControlChartState
+from .chart_history import ChartHistory
+from .quality_engine import (
+    _safe_float,
+    compute_laney_p_chart,
+    compute_laney_x_chart,
+    compute_laney_u_chart,
+    compute_i_mr_chart,
+)
+
+MIN_BASELINE = 2
+
+
+# ----- Vectorised baselines -----
+
+def _prefix(values: np.ndarray) -> np.ndarray:
+    """Exclusive prefix sums: out[i] = values[:i].sum(), accumulated in order."""
+    out = np.zeros(len(values) + 1)
+    np.cumsum(values, out=out[1:])
+    return out
+
+
+def _moving_range_terms(y: np.ndarray, n: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(a, b) with z_j - z_{j-1} = (a_j - centre * b_j) / scale for z_j = (y_j - centre) * sqrt(n_j) / scale."""
+    root_n = np.sqrt(n)
+    a, b = np.zeros(len(y)), np.zeros(len(y))
+    a[1:] = np.diff(y * root_n)
+    b[1:] = np.diff(root_n)
+    return a, b
+
+
+def _dominated_sums(t: np.ndarray, q: np.ndarray, weights: list[np.ndarray]) -> list[np.ndarray]:
+    """For every i, the sums of weights[j] over j < i with t[j] <= q[i].
+
+    Bottom-up divide and conquer: at each level the keys of every left half are
+    sorted and the queries of the matching right half find their prefix by binary
+    search, so each pair j < i is counted exactly once in O(n log² n).
+    """
+    m = len(t)
+    out = [np.zeros(m) for _ in weights]
+    ordered = np.sort(t)
+    # t[j] <= q[i] exactly when the rank of t[j] is at most the rank of q[i].
+    rank_t = np.searchsorted(ordered, t, "right")
+    rank_q = np.searchsorted(ordered, q, "right")
+    idx = np.arange(m)
+    size = 1
+    while size < m:
+        block = idx // (2 * size)
+        left = idx % (2 * size) < size
+        right = ~left
+        keys = block[left] * (m + 1) + rank_t[left]
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        hi = np.searchsorted(keys, block[right] * (m + 1) + rank_q[right], "right")
+        lo = np.searchsorted(keys, block[right] * (m + 1), "left")
+        for total, w in zip(out, weights):
+            sums = _prefix(w[left][order])
+            total[right] += sums[hi] - sums[lo]
+        size *= 2
+    return out
+
+
+def _abs_dev_sums(a: np.ndarray, b: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """S[i] = sum over j < i of |a_j - q_i * b_j|, for every i at once."""
+    flat = b == 0
+    s_flat = _prefix(np.where(flat, np.abs(a), 0.0))[:-1]
+    w = np.where(flat, 0.0, np.abs(b))
+    c = np.where(flat, 0.0, np.sign(b) * a)  # = w * t
+    t = np.where(flat, 0.0, a / np.where(flat, 1.0, b))
+    w_total, c_total = _prefix(w)[:-1], _prefix(c)[:-1]
+    w_le, c_le = _dominated_sums(t, q, [w, c])
+    # |b|·|t - q| summed: (c - q·w) where t > q, (q·w - c) where t <= q.
+    return s_flat + c_total - 2 * c_le + q * (2 * w_le - w_total)
+
+
+# ----- Per-chart definitions -----
+
+class _Chart:
+    """Running sums, baseline and point layout of one chart type.
+
+    baseline() works on scalars (an appended point) and on arrays (every point of
+    the window at once); dev(centre) returns the summed absolute moving ranges
+    of the numerators of the z-scores about centre.
+    """
+
+    chart_type: str
+    source: str
+    compute: Callable
+    header_keys: tuple[str, ...]
+    # Laney sigma_z depends on every point of the window, not only on running sums.
+    needs_window = True
+
+    def arrays(self, rows: list) -> dict:
+        raise NotImplementedError
+
+    def terms(self, a: dict) -> dict:
+        raise NotImplementedError
+
+    def moving_ranges(self, a: dict) -> Optional[tuple[np.ndarray, np.ndarray]]:
+        return None
+
+    def baseline(self, s: dict, count, dev: Callable, n_point, k: float) -> dict:
+        raise NotImplementedError
+
+    def fallback(self, s_all: dict, s_prev: dict, count: int) -> dict:
+        raise NotImplementedError
+
+    def point(self, a: dict, i: int, bl: dict) -> dict:
+        raise NotImplementedError
+
+    def to_input(self, row) -> dict:
+        raise NotImplementedError
+
+
+def _individual_limits(point: dict, bl: dict) -> dict:
+    point["ucl_individual"] = _safe_float(bl["ucl_ind"]) if bl["valid"] else None
+    point["lcl_individual"] = _safe_float(bl["lcl_ind"]) if bl["valid"] else None
+    return point
+
+
+def _limit(bl: dict, key: str):
+    return _safe_float(bl[key]) if bl["valid"] else None
+
+
+def _laney_ooc(value, bl: dict) -> bool:
+    return bool(bl["valid"] and ((value > bl["ucl_ind"]) or (value < bl["lcl_ind"])))
+
+
+class _LaneyP(_Chart):
+    chart_type, source, compute = "laney_p_chart", "acceptance_bar", staticmethod(compute_laney_p_chart)
+    header_keys = ("pbar", "sigma_z")
+
+    def arrays(self, rows):
+        x = np.array([r.value for r in rows], dtype=float)
+        n = np.array([r.n for r in rows], dtype=float)
+        return {"x": x, "n": n, "y": x / n}
+
+    def terms(self, a):
+        return {"x": a["x"], "n": a["n"]}
+
+    def moving_ranges(self, a):
+        return _moving_range_terms(a["y"], a["n"])
+
+    def baseline(self, s, count, dev, n_point, k):
+        pbar = s["x"] / s["n"]
+        valid = (count >= MIN_BASELINE) & ~np.isclose(pbar, 0.0) & ~np.isclose(pbar, 1.0)
+        var = pbar * (1.0 - pbar)
+        sigma_z = dev(pbar) / np.sqrt(var) / (count - 1) / 1.128
+        delta = k * sigma_z * np.sqrt(var / (s["n"] / count))
+        delta_ind = k * sigma_z * np.sqrt(var / n_point)
+        return {
+            "valid": valid, "pbar": pbar, "sigma_z": sigma_z,
+            "ucl": np.clip(pbar + delta, 0.0, 1.0), "lcl": np.clip(pbar - delta, 0.0, 1.0),
+            "ucl_ind": np.clip(pbar + delta_ind, 0.0, 1.0), "lcl_ind": np.clip(pbar - delta_ind, 0.0, 1.0),
+        }
+
+    def fallback(self, s_all, s_prev, count):
+        return {"pbar": float(s_prev["x"] / s_prev["n"]), "sigma_z": 1.0}
+
+    def point(self, a, i, bl):
+        p = a["y"][i]
+        point = {
+            "date": a["date"][i],
+            "p": _safe_float(p),
+            "lcl": _limit(bl, "lcl"),
+            "ucl": _limit(bl, "ucl"),
+            "n": int(a["n"][i]),
+            "out_of_control": _laney_ooc(p, bl),
+            "run_id": a["run_id"][i],
+        }
+        return _individual_limits(point, bl)
+
+    def to_input(self, row):
+        return {"date": row.effective_date.isoformat(), "accepted": int(row.value), "total": int(row.n), "run_id": row.run_id}
+
+
+class _LaneyX(_Chart):
+    chart_type, source, compute = "laney_x_chart", "laney_x_chart", staticmethod(compute_laney_x_chart)
+    header_keys = ("x_bar_bar", "s_pooled", "sigma_z")
+
+    def arrays(self, rows):
+        return {
+            "y": np.array([r.value for r in rows], dtype=float),
+            "s": np.array([r.std for r in rows], dtype=float),
+            "n": np.array([r.n for r in rows], dtype=float),
+        }
+
+    def terms(self, a):
+        n = a["n"]
+        return {"w": n, "wx": a["y"] * n, "df": n - 1.0, "ss": (n - 1.0) * a["s"] ** 2}
+
+    def moving_ranges(self, a):
+        return _moving_range_terms(a["y"], a["n"])
+
+    def baseline(self, s, count, dev, n_point, k):
+        x_bar_bar = s["wx"] / s["w"]
+        s_pooled = np.sqrt(s["ss"] / s["df"])
+        valid = (count >= MIN_BASELINE) & (s["df"] > 0) & ~np.isclose(s_pooled, 0.0)
+        sigma_z = dev(x_bar_bar) / s_pooled / (count - 1) / 1.128
+        delta = k * sigma_z * s_pooled / np.sqrt(s["w"] / count)
+        delta_ind = k * sigma_z * s_pooled / np.sqrt(n_point)
+        return {
+            "valid": valid, "x_bar_bar": x_bar_bar, "s_pooled": s_pooled, "sigma_z": sigma_z,
+            "ucl": x_bar_bar + delta, "lcl": x_bar_bar - delta,
+            "ucl_ind": x_bar_bar + delta_ind, "lcl_ind": x_bar_bar - delta_ind,
+        }
+
+    def fallback(self, s_all, s_prev, count):
+        return {"x_bar_bar": float(s_all["wx"] / s_all["w"]), "s_pooled": 0.0, "sigma_z": 1.0}
+
+    def point(self, a, i, bl):
+        x_bar = a["y"][i]
+        point = {
+            "date": a["date"][i],
+            "x_bar": _safe_float(x_bar),
+            "s": _safe_float(a["s"][i]),
+            "lcl": _limit(bl, "lcl"),
+            "ucl": _limit(bl, "ucl"),
+            "n": int(a["n"][i]),
+            "out_of_control": _laney_ooc(x_bar, bl),
+            "run_id": a["run_id"][i],
+        }
+        return _individual_limits(point, bl)
+
+    def to_input(self, row):
+        return {"date": row.effective_date.isoformat(), "mean": row.value, "std": row.std, "n": int(row.n), "run_id": row.run_id}
+
+
+class _LaneyU(_Chart):
+    chart_type, source, compute = "laney_u_chart", "laney_u_chart", staticmethod(compute_laney_u_chart)
+    header_keys = ("ubar", "sigma_z")
+
+    def arrays(self, rows):
+        c = np.array([r.value for r in rows], dtype=float)
+        n = np.array([r.n for r in rows], dtype=float)
+        return {"c": c, "n": n, "y": c / n}
+
+    def terms(self, a):
+        return {"c": a["c"], "n": a["n"]}
+
+    def moving_ranges(self, a):
+        return _moving_range_terms(a["y"], a["n"])
+
+    def baseline(self, s, count, dev, n_point, k):
+        ubar = s["c"] / s["n"]
+        valid = (count >= MIN_BASELINE) & ~np.isclose(ubar, 0.0)
+        sigma_z = dev(ubar) / np.sqrt(ubar) / (count - 1) / 1.128
+        delta = k * sigma_z * np.sqrt(ubar / (s["n"] / count))
+        delta_ind = k * sigma_z * np.sqrt(ubar / n_point)
+        return {
+            "valid": valid, "ubar": ubar, "sigma_z": sigma_z,
+            "ucl": ubar + delta, "lcl": np.maximum(ubar - delta, 0.0),
+            "ucl_ind": ubar + delta_ind, "lcl_ind": np.maximum(ubar - delta_ind, 0.0),
+        }
+
+    def fallback(self, s_all, s_prev, count):
+        return {"ubar": float(s_prev["c"] / s_prev["n"]), "sigma_z": 1.0}
+
+    def point(self, a, i, bl):
+        u = a["y"][i]
+        point = {
+            "date": a["date"][i],
+            "u": _safe_float(u),
+            "lcl": _limit(bl, "lcl"),
+            "ucl": _limit(bl, "ucl"),
+            "n": _safe_float(a["n"][i]),
+            "count": _safe_float(a["c"][i]),
+            "out_of_control": _laney_ooc(u, bl),
+            "run_id": a["run_id"][i],
+        }
+        return _individual_limits(point, bl)
+
+    def to_input(self, row):
+        return {"date": row.effective_date.isoformat(), "count": row.value, "n": row.n, "run_id": row.run_id}
+
+
+class _IMR(_Chart):
+    chart_type, source, compute = "i_mr_chart", "i_mr_chart", staticmethod(compute_i_mr_chart)
+    header_keys = ("x_bar", "mr_bar", "sigma")
+    needs_window = False
+
+    def arrays(self, rows):
+        x = np.array([float(r.value) for r in rows], dtype=float)
+        mr = np.full(len(x), np.nan)  # the first point has no moving range
+        mr[1:] = np.abs(np.diff(x))
+        return {"x": x, "mr": mr}
+
+    def terms(self, a):
+        return {"x": a["x"], "mr": np.nan_to_num(a["mr"])}
+
+    def baseline(self, s, count, dev, n_point, k):
+        x_bar = s["x"] / count
+        mr_bar = s["mr"] / (count - 1)
+        sigma = mr_bar / 1.128
+        valid = (count >= MIN_BASELINE) & ~np.isclose(sigma, 0.0)
+        return {
+            "valid": valid, "x_bar": x_bar, "mr_bar": mr_bar, "sigma": sigma,
+            "ucl": x_bar + k * sigma, "lcl": x_bar - k * sigma,
+        }
+
+    def fallback(self, s_all, s_prev, count):
+        return {"x_bar": float(s_all["x"] / count), "mr_bar": 0.0, "sigma": 0.0}
+
+    def point(self, a, i, bl):
+        x = a["x"][i]
+        return {
+            "date": a["date"][i],
+            "x": _safe_float(x),
+            "mr": _safe_float(a["mr"][i]),
+            "lcl": _limit(bl, "lcl"),
+            "ucl": _limit(bl, "ucl"),
+            "out_of_control": bool(bl["valid"] and ((x > bl["ucl"]) or (x < bl["lcl"]))),
+            "run_id": a["run_id"][i],
+        }
+
+    def to_input(self, row):
+        return {"date": row.effective_date.isoformat(), "value": float(row.value), "run_id": row.run_id}
+
+
+CHART_SPECS: dict[str, _Chart] = {spec.chart_type: spec for spec in (_LaneyP(), _LaneyX(), _LaneyU(), _IMR())}
+
+
+# ----- State transitions -----
+
+def _chart_data(chart_type: str, header: dict, points: list[dict], k: float) -> dict:
+    return {
+        "type": chart_type,
+        **{key: _safe_float(val) or 0 for key, val in header.items()},
+        "k": _safe_float(k) or k,
+        "points": points,
+    }
+
+
+def _arrays(spec: _Chart, rows: list) -> dict:
+    a = spec.arrays(rows)
+    a["date"] = [r.effective_date.isoformat() for r in rows]
+    a["run_id"] = [r.run_id for r in rows]
+    return a
+
+
+def _last(a: dict, spec: _Chart) -> dict:
+    last = {"date": a["date"][-1], "run_id": a["run_id"][-1]}
+    if not spec.needs_window:
+        last["x"] = float(a["x"][-1])
+    return last
+
+
+def _rebuild(spec: _Chart, rows: list, k: float) -> tuple[dict, dict]:
+    """Compute a chart over the window's points in one vectorised pass; returns (state, chart_data)."""
+    a = _arrays(spec, rows)
+    m = len(rows)
+    prefix = {key: _prefix(v) for key, v in spec.terms(a).items()}
+    state = {
+        "count": m,
+        "sums": {key: float(v[-1]) for key, v in prefix.items()},
+        "last": _last(a, spec) if m else None,
+        "header": None,
+    }
+    if m <= MIN_BASELINE:
+        return state, spec.compute([spec.to_input(r) for r in rows], k=k)
+
+    idx = np.arange(m)
+    at = {key: v[:-1] for key, v in prefix.items()}  # sums over the points before each point
+    terms = spec.moving_ranges(a)
+    with np.errstate(all="ignore"):
+        dev = (lambda centre: _abs_dev_sums(*terms, centre)) if terms else None
+        bl = spec.baseline(at, idx, dev, a.get("n"), k)
+    bl["valid"] = np.asarray(bl["valid"]) & (idx >= MIN_BASELINE)
+    points = [spec.point(a, i, {key: v[i] for key, v in bl.items()}) for i in range(m)]
+    valid = np.flatnonzero(bl["valid"])
+    if valid.size:
+        state["header"] = {key: float(bl[key][valid[-1]]) for key in spec.header_keys}
+    header = state["header"] or spec.fallback(
+        state["sums"], {key: float(v[-2]) for key, v in prefix.items()}, m
+    )
+    return state, _chart_data(spec.chart_type, header, points, k)
+
+
+def _append(spec: _Chart, state: dict, chart: dict, window: Optional[dict], new_rows: list, k: float) -> tuple[dict, dict]:
+    """Add points dated after the last charted one from the running sums.
+
+    window holds the arrays of the whole history window (ending with the new points)
+    for Laney charts, whose sigma_z needs the window's moving ranges.
+    """
+    a = _arrays(spec, new_rows)
+    m = state["count"]
+    sums = dict(state["sums"])
+    header = state["header"]
+    points = list(chart["points"])
+    terms = spec.terms(a)
+    moving = spec.moving_ranges(window) if window is not None else None
+    for t in range(len(new_rows)):
+        if not spec.needs_window:
+            a["mr"][t] = abs(a["x"][t] - (a["x"][t - 1] if t else state["last"]["x"]))
+            terms["mr"][t] = a["mr"][t]
+        count = m + t
+        if moving is not None:
+            ma, mb = moving[0][:count], moving[1][:count]
+            dev = lambda centre: float(np.abs(ma - centre * mb).sum())
+        else:
+            dev = None
+        with np.errstate(all="ignore"):
+            bl = spec.baseline(sums, count, dev, a["n"][t] if "n" in a else None, k)
+        points.append(spec.point(a, t, bl))
+        if bl["valid"]:
+            header = {key: float(bl[key]) for key in spec.header_keys}
+        prev = dict(sums)
+        for key, v in terms.items():
+            sums[key] += float(v[t])
+    state = {"count": m + len(new_rows), "sums": sums, "last": _last(a, spec), "header": header}
+    return state, _chart_data(spec.chart_type, header or spec.fallback(sums, prev, state["count"]), points, k)
+
+
+def _sort_key(date: str, run_id: int) -> tuple[datetime, int]:
+    return datetime.fromisoformat(date), run_id
+
+
+# ----- Store -----
+
+_DIALECT_INSERTS = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
+
+
+def _insert_state_if_missing(db: Session, values: dict) -> None:
+    """INSERT ... ON CONFLICT DO NOTHING, so concurrent first uses of a chart do not collide."""
+    T = QualityControlChartState
+    dialect_insert = _DIALECT_INSERTS.get(db.get_bind().dialect.name)
+    if dialect_insert is not None:
+        db.execute(dialect_insert(T).values(**values).on_conflict_do_nothing())
+        return
+    try:
+        with db.begin_nested():
+            db.execute(insert(T).values(**values))
+    except IntegrityError:
+        pass
+
+
+class ChartStates:
+    """Persisted chart states of one operation, brought up to date on access.
+
+    latest_run_id is the newest run of the operation; states that have not seen it
+    yet pick up the chart points of the newer runs (one query for all charts).
+    Changes are added to the session; the caller commits.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        operation_id: int,
+        latest_run_id: int,
+        history: ChartHistory,
+        lock: bool = False,
+    ):
+        self.db = db
+        self.operation_id = operation_id
+        self.latest_run_id = latest_run_id
+        self.history = history
+        self.lock = lock
+        self.cutoff = history.since
+        self._states: Optional[dict[tuple[str, str, str], QualityControlChartState]] = None
+        self._new_points: Optional[dict[tuple[str, str], list]] = None
+
+    def _select(self):
+        stmt = select(QualityControlChartState).where(QualityControlChartState.operation_id == self.operation_id)
+        return stmt.with_for_update() if self.lock else stmt
+
+    def _load_states(self) -> dict[tuple[str, str, str], QualityControlChartState]:
+        return {(s.chart_type, s.column_key, s.config_key): s for s in self.db.execute(self._select()).scalars()}
+
+    def _create_state(self, chart_type: str, column_key: str, config_key: str) -> QualityControlChartState:
+        """Row of a chart used for the first time, created empty (or by a concurrent request) and locked."""
+        T = QualityControlChartState
+        _insert_state_if_missing(self.db, {
+            "operation_id": self.operation_id,
+            "chart_type": chart_type,
+            "column_key": column_key,
+            "config_key": config_key,
+            "seen_run_id": 0,
+            "state_json": "{}",
+            "chart_json": "{}",
+        })
+        return self.db.execute(
+            self._select().where(T.chart_type == chart_type, T.column_key == column_key, T.config_key == config_key)
+        ).scalar_one()
+
+    def _points_since(self, chart_type: str, column_key: str, run_id: int) -> list:
+        if self._new_points is None:
+            since = min((s.seen_run_id for s in self._states.values() if s.seen_run_id), default=0)
+            P = QualityControlChartPoint
+            stmt = (
+                select(P.chart_type, P.column_key, P.effective_date, P.run_id, P.value, P.std, P.n)
+                .where(P.operation_id == self.operation_id, P.run_id > since, P.effective_date >= self.cutoff)
+                .order_by(P.effective_date, P.run_id)
+            )
+            self._new_points = {}
+            for row in self.db.execute(stmt):
+                self._new_points.setdefault((row.chart_type, row.column_key), []).append(row)
+        return [row for row in self._new_points.get((chart_type, column_key), []) if row.run_id > run_id]
+
+    def _update(self, spec: _Chart, column_key: str, row: QualityControlChartState, k: float) -> tuple[dict, dict, Optional[datetime]]:
+        """(state, chart_data, window_start) of a chart whose state has not seen the latest run."""
+        state = json.loads(row.state_json)
+        if "count" in state and (row.window_start is None or row.window_start >= self.cutoff):
+            new_rows = self._points_since(spec.source, column_key, row.seen_run_id)
+            if not new_rows:
+                return state, json.loads(row.chart_json), row.window_start
+            in_order = state["last"] is not None and (
+                _sort_key(new_rows[0].effective_date.isoformat(), new_rows[0].run_id)
+                > _sort_key(state["last"]["date"], state["last"]["run_id"])
+            )
+            if in_order and state["count"] > MIN_BASELINE:
+                window = None
+                if spec.needs_window:
+                    rows = self.history.points(spec.source, column_key)
+                    # The window must be the charted points followed by the new ones.
+                    if len(rows) != state["count"] + len(new_rows) or rows[-1].run_id != new_rows[-1].run_id:
+                        return (*_rebuild(spec, rows, k), rows[0].effective_date if rows else None)
+                    window = _arrays(spec, rows)
+                state, chart = _append(spec, state, json.loads(row.chart_json), window, new_rows, k)
+                return state, chart, row.window_start
+        # New, reconfigured or out-of-order chart, or points left the window.
+        rows = self.history.points(spec.source, column_key)
+        return (*_rebuild(spec, rows, k), rows[0].effective_date if rows else None)
+
+    def chart(self, chart_type: str, column_key: str, k: float) -> dict:
+        """chart_data of one chart over the history window."""
+        if self._states is None:
+            self._states = self._load_states()
+        spec = CHART_SPECS[chart_type]
+        config_key = json.dumps({"k": k})
+        row = self._states.get((chart_type, column_key, config_key))
+        if row is None:
+            row = self._states[(chart_type, column_key, config_key)] = self._create_state(chart_type, column_key, config_key)
+        elif row.seen_run_id >= self.latest_run_id and (row.window_start is None or row.window_start >= self.cutoff):
+            return json.loads(row.chart_json)
+
+        state, chart, window_start = self._update(spec, column_key, row, k)
+        last = state["last"]
+        row.seen_run_id = max(self.latest_run_id, row.seen_run_id or 0, last["run_id"] if last else 0)
+        row.window_start = window_start
+        row.state_json = json.dumps(state)
+        row.chart_json = json.dumps(chart)
+        return chart
+
+
+def invalidate_chart_states(db: Session, operation_id: int) -> None:
+    """Drop the persisted charts of an operation; they are rebuilt on next access."""
+    db.execute(delete(QualityControlChartState).where(QualityControlChartState.operation_id == operation_id))
+
+
+@event.listens_for(QualityControlRun, "after_delete")
+def _invalidate_on_run_delete(mapper, connection, target):
+    connection.execute(
+        delete(QualityControlChartState.__table__).where(
+            QualityControlChartState.__table__.c.operation_id == target.operation_id
+        )
+    )
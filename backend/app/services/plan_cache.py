@@ -0,0 +1,73 @@
+"""
+Compiled QC execution plans, cached per operation.
+
+run_quality needs an operation's functions with decoded configs and resolved
+runners. A QCPlan holds exactly that plus the payload columns the checks read,
+and is compiled once per (operation, config_version). Function create, update
+and delete bump quality_control_operations.config_version, so every worker sees
+a changed configuration on the operation row it already loads to authenticate
+the request; the endpoints also drop this process's entry right away.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from ..db.models import QualityControlOperation, QualityControlFunction
+from .quality_engine import QCPlan
+
+MAX_ENTRIES = int(os.getenv("QC_PLAN_CACHE_MAX_ENTRIES", "1024"))
+
+
+def load_plan(db: Session, operation_id: int, version: int) -> QCPlan:
+    F = QualityControlFunction
+    rows = db.execute(
+        select(F.name, F.function_type, F.config_json)
+        .where(F.operation_id == operation_id)
+        .order_by(F.sort_order, F.id)
+    )
+    functions = [
+        (row.name, row.function_type, json.loads(row.config_json) if row.config_json else None)
+        for row in rows
+    ]
+    return QCPlan(functions, version)
+
+
+class PlanCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._plans: OrderedDict[int, QCPlan] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, operation: QualityControlOperation) -> QCPlan:
+        """Plan for the operation's current config_version, compiled on a miss."""
+        version = operation.config_version or 0
+        with self._lock:
+            plan = self._plans.get(operation.id)
+            if plan is not None and plan.version == version:
+                self._plans.move_to_end(operation.id)
+                return plan
+        # Compiling twice under a race is harmless; the later plan simply replaces the earlier.
+        plan = load_plan(db, operation.id, version)
+        with self._lock:
+            self._plans[operation.id] = plan
+            self._plans.move_to_end(operation.id)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+        return plan
+
+    def invalidate(self, operation_id: int) -> None:
+        with self._lock:
+            self._plans.pop(operation_id, None)
+
+
+def bump_config_version(db: Session, operation_id: int) -> None:
+    """Mark the operation's functions as changed; the caller commits."""
+    Op = QualityControlOperation
+    db.execute(update(Op).where(Op.id == operation_id).values(config_version=Op.config_version + 1))
+
+
+plan_cache = PlanCache()
@@ -0,0 +1,112 @@
+"""
+Response cache for the public QC dashboard endpoint (GET /api/quality/public/{id}).
+
+One entry per operation holds the serialised response for its latest run and an
+ETag. run_quality writes the new payload through after committing a run, so
+dashboard polls are served from memory; concurrent misses for the same operation
+and run are coalesced into a single computation. Entries expire after
+PUBLIC_CACHE_MAX_AGE seconds so charts follow the moving history window. The
+cache is per process: with several workers each keeps its own copy, and a
+worker that did not handle the run notices the new latest run id and rebuilds.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from sqlalchemy import event
+
+from ..db.models import QualityControlRun
+
+MAX_ENTRIES = int(os.getenv("PUBLIC_CACHE_MAX_ENTRIES", "1024"))
+MAX_AGE = float(os.getenv("PUBLIC_CACHE_MAX_AGE", "600"))
+BUILD_WAIT = 30.0
+
+
+class CachedResponse:
+    __slots__ = ("run_id", "body", "etag", "stored_at")
+
+    def __init__(self, run_id: Optional[int], body: bytes, etag: str, stored_at: float):
+        self.run_id = run_id
+        self.body = body
+        self.etag = etag
+        self.stored_at = stored_at
+
+
+def _serialise(payload: dict) -> bytes:
+    # Same settings as Starlette's JSONResponse.
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class PublicOperationCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_age: float = MAX_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: OrderedDict[int, CachedResponse] = OrderedDict()
+        self._inflight: dict[tuple[int, Optional[int]], threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, operation_id: int, run_id: Optional[int]) -> Optional[CachedResponse]:
+        entry = self._entries.get(operation_id)
+        if entry is None or entry.run_id != run_id or time.monotonic() - entry.stored_at > self.max_age:
+            return None
+        self._entries.move_to_end(operation_id)
+        return entry
+
+    def put(self, operation_id: int, run_id: Optional[int], payload: dict) -> CachedResponse:
+        body = _serialise(payload)
+        etag = f'"{operation_id}-{run_id}-{hashlib.sha1(body).hexdigest()[:16]}"'
+        entry = CachedResponse(run_id, body, etag, time.monotonic())
+        with self._lock:
+            current = self._entries.get(operation_id)
+            if current is None or current.run_id is None or run_id is None or run_id >= current.run_id:
+                self._entries[operation_id] = entry
+                self._entries.move_to_end(operation_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, operation_id: int) -> None:
+        with self._lock:
+            self._entries.pop(operation_id, None)
+
+    def get_or_build(self, operation_id: int, run_id: Optional[int], build: Callable[[], dict]) -> CachedResponse:
+        """Cached response for (operation, latest run); only one caller builds a missing entry."""
+        key = (operation_id, run_id)
+        while True:
+            with self._lock:
+                entry = self._fresh(operation_id, run_id)
+                if entry is not None:
+                    return entry
+                waiter = self._inflight.get(key)
+                leader = waiter is None
+                if leader:
+                    waiter = self._inflight[key] = threading.Event()
+            if not leader:
+                # Re-check after the leader finished; if it failed, one waiter takes over.
+                waiter.wait(BUILD_WAIT)
+                continue
+            try:
+                return self.put(operation_id, run_id, build())
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                waiter.set()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+public_cache = PublicOperationCache()
+
+
+@event.listens_for(QualityControlRun, "after_delete")
+def _invalidate_on_run_delete(mapper, connection, target):
+    public_cache.invalidate(target.operation_id)
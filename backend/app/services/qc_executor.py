@@ -0,0 +1,342 @@
+"""
+Concurrent execution of a QC plan's functions.
+
+Functions of a run are independent, so they are submitted together: vectorized
+checks and chart runners to a bounded thread pool sharing the request's
+ColumnStore, statsmed tests to worker processes (they are CPU-bound Python,
+redirect sys.stdout and may draw with pyplot, none of which is safe to share
+between threads). Results are collected in the configured order.
+
+Each function has a timeout: config["timeout"] in seconds, else
+QC_FUNCTION_TIMEOUT, counted from the moment the function starts running, not
+from submission, so time spent queued behind other requests does not count. A
+function that misses it is recorded as failed and nothing else is affected: a
+statsmed test runs in a worker process of its own, which is killed and replaced;
+a thread cannot be stopped, so it runs on in the background while the work
+queued behind it moves to a fresh thread pool. A function that has not started
+QC_QUEUE_TIMEOUT seconds after submission is recorded as failed and never runs.
+
+Up to QC_PROCESS_WORKERS tests run at once (at least one). Each is handed to an
+idle worker process by a dispatcher thread, which starts its clock once the
+worker has the test.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from typing import Optional
+
+from .quality_engine import ColumnStore, QCPlan, run_statsmed_on_frame
+
+THREAD_WORKERS = int(os.getenv("QC_THREAD_WORKERS", "4"))
+# One core stays with the web workers, but tests always need a process that can be killed.
+PROCESS_WORKERS = int(os.getenv("QC_PROCESS_WORKERS", str(min(4, (os.cpu_count() or 1) - 1))))
+FUNCTION_TIMEOUT = float(os.getenv("QC_FUNCTION_TIMEOUT", "60"))
+QUEUE_TIMEOUT = float(os.getenv("QC_QUEUE_TIMEOUT", "60"))
+# Starting a worker imports pandas, matplotlib and statsmed; this is not part of a test's time.
+WORKER_START_TIMEOUT = 120.0
+
+
+def _timeout(config: dict, default: float) -> float:
+    try:
+        timeout = float(config.get("timeout", default))
+    except (TypeError, ValueError):
+        return default
+    return timeout if timeout > 0 else default
+
+
+def _serve(conn: Connection) -> None:
+    """Worker process loop: run (func, args) messages until None or the pipe closes."""
+    conn.send("ready")
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        func, args = message
+        try:
+            result = func(*args)
+        except Exception as exc:
+            result = (False, str(exc))
+        conn.send(result)
+
+
+class _WorkerProcess:
+    def __init__(self):
+        # Forking a multi-threaded server is unsafe; workers start fresh.
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_serve, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.ready = False
+
+    def wait_ready(self) -> bool:
+        if not self.ready and self.conn.poll(WORKER_START_TIMEOUT):
+            try:
+                self.ready = self.conn.recv() == "ready"
+            except EOFError:
+                pass
+        return self.ready
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+QUEUED, RUNNING, DONE = "queued", "running", "done"
+
+
+class _Task:
+    """A submitted function. It may be queued on several pools; whichever picks it up first runs it."""
+
+    __slots__ = ("call", "pool", "submitted", "start", "state", "outcome", "error", "started", "done", "_lock")
+
+    def __init__(self, call: tuple):
+        self.call = call
+        self.pool: Optional[ThreadPoolExecutor] = None
+        self.submitted = time.monotonic()
+        self.start = 0.0
+        self.state = QUEUED
+        self.outcome: Optional[tuple] = None
+        self.error: Optional[BaseException] = None
+        self.started = threading.Event()
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def claim(self) -> bool:
+        """Mark the task running; False if it already ran, is running or was given up."""
+        with self._lock:
+            if self.state != QUEUED:
+                return False
+            self.state = RUNNING
+            self.start = time.monotonic()
+        self.started.set()
+        return True
+
+    def give_up(self, outcome: tuple) -> bool:
+        """Record outcome for a task that never started; False if it has started."""
+        with self._lock:
+            if self.state != QUEUED:
+                return False
+            self.state = DONE
+        self.finish(outcome)
+        return True
+
+    def finish(self, outcome: Optional[tuple] = None, error: Optional[BaseException] = None) -> None:
+        self.outcome, self.error = outcome, error
+        self.started.set()
+        self.done.set()
+
+    def result(self) -> tuple:
+        if self.error is not None:
+            raise self.error
+        return self.outcome
+
+
+class QCExecutor:
+    def __init__(
+        self,
+        thread_workers: int = THREAD_WORKERS,
+        process_workers: int = PROCESS_WORKERS,
+        timeout: float = FUNCTION_TIMEOUT,
+        queue_timeout: float = QUEUE_TIMEOUT,
+    ):
+        self.thread_workers = max(thread_workers, 1)
+        self.process_workers = max(process_workers, 1)
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._dispatchers: Optional[ThreadPoolExecutor] = None
+        self._idle: list[_WorkerProcess] = []
+        self._queued: set[_Task] = set()
+        self._lock = threading.Lock()
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(self.thread_workers, thread_name_prefix="qc")
+            return self._threads
+
+    def _replace_thread_pool(self, stuck: ThreadPoolExecutor) -> None:
+        """Leave a thread that missed its timeout behind and move the work queued behind it to a new pool."""
+        with self._lock:
+            if self._threads is not stuck:
+                return
+            self._threads = None
+        stuck.shutdown(wait=False)
+        with self._lock:
+            moved = [task for task in self._queued if task.pool is stuck]
+        for task in moved:
+            # The copy left on the old pool finds the task claimed and does nothing.
+            self._enqueue(task)
+
+    def _enqueue(self, task: _Task) -> None:
+        while True:
+            pool = task.pool = self._thread_pool()
+            with self._lock:
+                self._queued.add(task)
+            try:
+                pool.submit(self._run_in_thread, task)
+                return
+            except RuntimeError:
+                continue  # the pool was replaced meanwhile
+
+    def _dispatch_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._dispatchers is None:
+                self._dispatchers = ThreadPoolExecutor(self.process_workers, thread_name_prefix="qc-proc")
+            return self._dispatchers
+
+    def _take_worker(self) -> _WorkerProcess:
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.conn.close()  # e.g. killed by the OS while idle
+        return _WorkerProcess()
+
+    def _return_worker(self, worker: _WorkerProcess) -> None:
+        with self._lock:
+            if self._dispatchers is not None:
+                self._idle.append(worker)
+                return
+        worker.stop()
+
+    def _claim(self, task: _Task) -> bool:
+        with self._lock:
+            self._queued.discard(task)
+        return task.claim()
+
+    def _run_in_process(self, task: _Task) -> None:
+        """Dispatcher thread: run the test in an idle worker, killing only that worker on timeout."""
+        if not self._claim(task):
+            return
+        timeout, func, args = task.call
+        worker = self._take_worker()
+        if not worker.wait_ready():
+            worker.kill()
+            task.finish((False, "Worker process failed to start"))
+            return
+        try:
+            worker.conn.send((func, args))
+            if not worker.conn.poll(timeout):
+                worker.kill()
+                task.finish((False, f"Timed out after {timeout:g} s"))
+                return
+            result = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.kill()
+            task.finish((False, "Worker process stopped before the test finished"))
+            return
+        self._return_worker(worker)
+        task.finish(result)
+
+    def _run_in_thread(self, task: _Task) -> None:
+        if not self._claim(task):
+            return
+        runner, store, config = task.call
+        try:
+            outcome = runner(store, config)
+        except BaseException as exc:
+            task.finish(error=exc)
+        else:
+            task.finish(outcome)
+
+    def _submit(self, store: ColumnStore, func_type: str, config: dict, runner, timeout: float) -> _Task:
+        if func_type == "statsmed_test" and config.get("test_id") and not store.empty:
+            try:
+                df = store.frame()
+            except Exception:
+                pass  # the runner reports the error
+            else:
+                task = _Task((timeout, run_statsmed_on_frame, (df, config["test_id"], config.get("params") or {})))
+                with self._lock:
+                    self._queued.add(task)
+                self._dispatch_pool().submit(self._run_in_process, task)
+                return task
+        task = _Task((runner, store, config))
+        self._enqueue(task)
+        return task
+
+    def run(self, store: ColumnStore, plan: QCPlan) -> list[tuple]:
+        """Outcomes of the plan's runners, in plan order."""
+        return self.run_many([store], plan)[0]
+
+    def run_many(self, stores: list[ColumnStore], plan: QCPlan) -> list[list[tuple]]:
+        """Outcomes of the plan's runners for each store.
+
+        The functions of up to thread_workers + process_workers stores are submitted
+        together, so a large batch keeps the pools busy without queueing work long
+        enough to reach the queue timeout.
+        """
+        timeouts = [_timeout(config, self.timeout) for _, _, config, _ in plan.steps]
+        chunk = self.thread_workers + self.process_workers
+        outcomes = []
+        for i in range(0, len(stores), chunk):
+            submitted = [
+                [
+                    self._submit(store, func_type, config, runner, timeout)
+                    for (_, func_type, config, runner), timeout in zip(plan.steps, timeouts)
+                ]
+                for store in stores[i:i + chunk]
+            ]
+            outcomes.extend(self._collect(tasks, timeouts) for tasks in submitted)
+        return outcomes
+
+    def _collect(self, tasks: list[_Task], timeouts: list[float]) -> list[tuple]:
+        outcomes = []
+        for timeout, task in zip(timeouts, tasks):
+            if not task.started.wait(max(task.submitted + self.queue_timeout - time.monotonic(), 0)):
+                with self._lock:
+                    self._queued.discard(task)
+                task.give_up((False, f"Not started within {self.queue_timeout:g} s: all QC workers are busy"))
+            if task.pool is None:
+                # The dispatcher enforces the timeout and always finishes the task.
+                task.done.wait()
+            elif not task.done.wait(max(task.start + timeout - time.monotonic(), 0)):
+                self._replace_thread_pool(task.pool)
+                outcomes.append((False, f"Timed out after {timeout:g} s"))
+                continue
+            outcomes.append(task.result())
+        return outcomes
+
+    def warm_up(self) -> None:
+        """Start the worker processes in the background so the first test does not wait for them."""
+        self._dispatch_pool()
+        with self._lock:
+            missing = self.process_workers - len(self._idle)
+            self._idle.extend(_WorkerProcess() for _ in range(missing))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            threads, dispatchers, idle, queued = self._threads, self._dispatchers, self._idle, self._queued
+            self._threads = self._dispatchers = None
+            self._idle, self._queued = [], set()
+        for task in queued:
+            task.give_up((False, "Cancelled: the QC executor is shutting down"))
+        if threads is not None:
+            threads.shutdown(wait=False, cancel_futures=True)
+        if dispatchers is not None:
+            dispatchers.shutdown(wait=False, cancel_futures=True)
+        for worker in idle:
+            worker.stop()
+
+
+qc_executor = QCExecutor()
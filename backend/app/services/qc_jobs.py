@@ -0,0 +1,125 @@
+"""
+Queue of asynchronous QC runs.
+
+POST /api/quality/run/async stores the payload as a qc_jobs row and returns its id.
+Worker processes (python -m backend.app.worker; any number, on any node, sharing
+the database) claim queued jobs with SELECT ... FOR UPDATE SKIP LOCKED, so
+concurrent workers neither take the same job nor wait on each other's locks.
+SQLite has no row locks; there the conditional UPDATE that marks the job running
+decides which worker gets it, which is enough for tests and local use.
+
+A running job whose worker died is claimed again once its lease has expired, up
+to MAX_ATTEMPTS claims; after that it is marked failed.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.orm import Session
+
+from ..db.models import QualityControlJob
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+LEASE_SECONDS = float(os.getenv("QC_JOB_LEASE", "900"))
+MAX_ATTEMPTS = int(os.getenv("QC_JOB_MAX_ATTEMPTS", "3"))
+RETENTION_DAYS = float(os.getenv("QC_JOB_RETENTION_DAYS", "7"))
+
+
+def enqueue_job(db: Session, operation_id: int, data: Any, sample_date: Optional[datetime]) -> QualityControlJob:
+    """Add a queued job for the payload; the caller commits."""
+    job = QualityControlJob(
+        operation_id=operation_id,
+        status=QUEUED,
+        payload_json=json.dumps(data),
+        sample_date=sample_date,
+    )
+    db.add(job)
+    return job
+
+
+def claim_job(db: Session, worker: str) -> Optional[QualityControlJob]:
+    """Claim the oldest claimable job for this worker and commit; None if the queue is empty."""
+    J = QualityControlJob
+    now = datetime.utcnow()
+    expired = and_(J.status == RUNNING, J.started_at < now - timedelta(seconds=LEASE_SECONDS))
+    db.execute(
+        update(J)
+        .where(expired, J.attempts >= MAX_ATTEMPTS)
+        .values(status=FAILED, finished_at=now, error=f"Worker stopped responding ({MAX_ATTEMPTS} attempts)")
+        .execution_options(synchronize_session=False)
+    )
+    claimable = or_(J.status == QUEUED, expired)
+    while True:
+        job_id = db.execute(
+            select(J.id).where(claimable).order_by(J.id).limit(1).with_for_update(skip_locked=True)
+        ).scalar()
+        if job_id is None:
+            db.commit()
+            return None
+        claimed = db.execute(
+            update(J)
+            .where(J.id == job_id, claimable)
+            .values(status=RUNNING, worker=worker, started_at=now, attempts=J.attempts + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.get(J, job_id)
+
+
+class JobLost(Exception):
+    """The job was reclaimed by another worker after this worker's lease expired."""
+
+
+def mark_job_done(db: Session, job: QualityControlJob, run_id: int, result: dict) -> None:
+    """Record the job's run and result in the caller's transaction (the one inserting the run).
+
+    Raises JobLost if this worker no longer holds the job; the caller must roll back.
+    """
+    J = QualityControlJob
+    done = db.execute(
+        update(J)
+        .where(J.id == job.id, J.status == RUNNING, J.worker == job.worker)
+        .values(status=DONE, run_id=run_id, result_json=json.dumps(result), finished_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not done:
+        raise JobLost(f"job {job.id} was taken over by another worker")
+
+
+def set_job_result(db: Session, job_id: int, result: dict) -> None:
+    """Replace a done job's result (e.g. with chart data added); the caller commits."""
+    J = QualityControlJob
+    db.execute(
+        update(J).where(J.id == job_id).values(result_json=json.dumps(result)).execution_options(synchronize_session=False)
+    )
+
+
+def fail_job(db: Session, job_id: int, error: str) -> None:
+    J = QualityControlJob
+    db.execute(
+        update(J)
+        .where(J.id == job_id, J.status == RUNNING)
+        .values(status=FAILED, error=error, finished_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def purge_finished_jobs(db: Session, days: float = RETENTION_DAYS) -> int:
+    """Delete done and failed jobs older than the retention period; returns the number deleted."""
+    J = QualityControlJob
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = db.execute(
+        delete(J)
+        .where(J.status.in_((DONE, FAILED)), J.finished_at < cutoff)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return deleted
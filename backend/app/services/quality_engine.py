@@ -2,9 +2,14 @@
 Quality control run engine: execute a list of functions on incoming data.
 Each function has a type (missing, range, statsmed_test, ...) and config; returns pass/fail and message.
 
-Runners return (passed, message) or (passed, message, figure_base64) when a figure is produced.
+The payload is converted once per request into a ColumnStore (typed NumPy columns with
+validity masks) that every runner reads from.
+
+Runners return (passed, message) or (passed, message, extra), where extra is a
+figure_base64 string, a chart_data dict or a list of offending row indices.
 """
 import io
+import itertools
 import math
 import base64
 from typing import Any
@@ -15,7 +20,7 @@ matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import pandas as pd
 
-from .run_analysis import run_test_with_df
+from .run_analysis import TESTS, run_test_with_df
 from statsmed.statsmed import laney_p_chart as _statsmed_laney_p_chart
 from statsmed.statsmed import laney_x_chart as _statsmed_laney_x_chart
 from statsmed.statsmed import laney_u_chart as _statsmed_laney_u_chart
@@ -38,25 +43,126 @@ def _safe_float(val, ndigits: int = 4):
     return None
 
 
-def run_missing(rows: list[dict], config: dict) -> tuple[bool, str]:
+class ColumnStore:
+    """Columnar view of a QC payload, built once per request and shared by all runners.
+
+    Accepts a list of row dicts or a dict of lists (a scalar value counts as a
+    one-element column). Columns are converted lazily on first use and cached:
+
+    - raw(col): object array of the original values, padded with None to n_rows
+    - present(col): value is not None
+    - missing(col): None, a float NaN or an empty string
+    - numeric(col): float array, NaN where absent or not convertible
+    - convertible(col): present and float(value) succeeds
+    - frame(): pandas DataFrame of the payload (built once)
+
+    If columns is given (see QCPlan.columns), the DataFrame only holds those columns.
+    """
+
+    def __init__(self, data: list[dict[str, Any]] | dict[str, Any], columns: frozenset[str] | None = None):
+        self.data = data
+        self.columns = columns
+        self.empty = not data
+        if isinstance(data, dict):
+            self.n_rows = max((len(v) for v in data.values() if isinstance(v, list)), default=0)
+        else:
+            self.n_rows = len(data)
+        self._raw: dict[str, np.ndarray] = {}
+        self._types: dict[str, np.ndarray] = {}
+        self._numeric: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._frame: pd.DataFrame | None = None
+
+    def raw(self, col: str) -> np.ndarray:
+        arr = self._raw.get(col)
+        if arr is None:
+            if isinstance(self.data, dict):
+                vals = self.data.get(col)
+                if vals is None:
+                    vals = []
+                elif not isinstance(vals, list):
+                    vals = [vals]
+                n = max(self.n_rows, len(vals))
+                values = itertools.chain(vals, itertools.repeat(None, n - len(vals)))
+            else:
+                n = self.n_rows
+                values = (row.get(col) for row in self.data)
+            arr = np.fromiter(values, dtype=object, count=n)
+            self._raw[col] = arr
+        return arr
+
+    def _type_codes(self, col: str) -> np.ndarray:
+        types = self._types.get(col)
+        if types is None:
+            raw = self.raw(col)
+            types = np.fromiter(map(type, raw), dtype=object, count=len(raw))
+            self._types[col] = types
+        return types
+
+    def present(self, col: str) -> np.ndarray:
+        return self._type_codes(col) != type(None)
+
+    def missing(self, col: str) -> np.ndarray:
+        types = self._type_codes(col)
+        numeric, _ = self._numeric_pair(col)
+        return (types == type(None)) | ((types == float) & np.isnan(numeric)) | ((types == str) & (self.raw(col) == ""))
+
+    def _numeric_pair(self, col: str) -> tuple[np.ndarray, np.ndarray]:
+        pair = self._numeric.get(col)
+        if pair is None:
+            raw = self.raw(col)
+            present = self.present(col)
+            try:
+                # float() semantics per element; None becomes NaN.
+                numeric = np.array(raw, dtype=float)
+                convertible = present
+            except (TypeError, ValueError):
+                numeric = np.full(len(raw), np.nan)
+                convertible = np.zeros(len(raw), dtype=bool)
+                for i in np.flatnonzero(present):
+                    try:
+                        numeric[i] = float(raw[i])
+                        convertible[i] = True
+                    except (TypeError, ValueError):
+                        pass
+            pair = (numeric, convertible)
+            self._numeric[col] = pair
+        return pair
+
+    def numeric(self, col: str) -> np.ndarray:
+        return self._numeric_pair(col)[0]
+
+    def convertible(self, col: str) -> np.ndarray:
+        return self._numeric_pair(col)[1]
+
+    def frame(self) -> pd.DataFrame:
+        if self._frame is None:
+            if self.columns is None:
+                self._frame = pd.DataFrame(self.data)
+            elif isinstance(self.data, dict):
+                self._frame = pd.DataFrame({k: v for k, v in self.data.items() if k in self.columns})
+            else:
+                # Only columns that occur in the payload, as in the unrestricted frame.
+                present = [c for c in self.columns if any(c in row for row in self.data)]
+                self._frame = pd.DataFrame(self.data, columns=present)
+        return self._frame
+
+
+def run_missing(data: ColumnStore, config: dict) -> tuple[bool, str] | tuple[bool, str, list]:
     """Check for missing/null values in specified columns."""
     columns = config.get("columns") or []
     if not columns:
         return False, "No columns specified"
-    n = len(rows)
-    missing_count = 0
-    for row in rows:
-        for col in columns:
-            val = row.get(col)
-            if val is None or (isinstance(val, float) and str(val) == "nan") or val == "":
-                missing_count += 1
-                break
-    if missing_count == 0:
+    n = data.n_rows
+    mask = np.zeros(n, dtype=bool)
+    for col in columns:
+        mask |= data.missing(col)[:n]
+    missing_rows = np.flatnonzero(mask).tolist()
+    if not missing_rows:
         return True, f"All {n} rows have no missing values in {columns}"
-    return False, f"{missing_count} of {n} rows have missing values in {columns}"
+    return False, f"{len(missing_rows)} of {n} rows have missing values in {columns}", missing_rows
 
 
-def run_range(rows: list[dict], config: dict) -> tuple[bool, str]:
+def run_range(data: ColumnStore, config: dict) -> tuple[bool, str] | tuple[bool, str, list]:
     """Check that values in column are within min/max (inclusive)."""
     column = config.get("column")
     min_val = config.get("min")
@@ -65,40 +171,44 @@ def run_range(rows: list[dict], config: dict) -> tuple[bool, str]:
         return False, "No column specified"
     if min_val is None and max_val is None:
         return False, "Specify at least min or max"
-    out_of_range = []
-    for i, row in enumerate(rows):
-        val = row.get(column)
-        if val is None:
-            continue
-        try:
-            v = float(val)
-        except (TypeError, ValueError):
-            out_of_range.append((i, val))
-            continue
-        if min_val is not None and v < min_val:
-            out_of_range.append((i, val))
-        elif max_val is not None and v > max_val:
-            out_of_range.append((i, val))
-    if not out_of_range:
+    v = data.numeric(column)
+    bad = ~data.convertible(column)
+    if min_val is not None:
+        bad |= v < min_val
+    if max_val is not None:
+        bad |= v > max_val
+    out_rows = np.flatnonzero(bad & data.present(column)).tolist()
+    if not out_rows:
         return True, f"All values in '{column}' within range"
-    return False, f"{len(out_of_range)} value(s) out of range: {out_of_range[:5]}{'...' if len(out_of_range) > 5 else ''}"
+    raw = data.raw(column)
+    out_of_range = [(i, raw[i]) for i in out_rows[:5]]
+    return False, f"{len(out_rows)} value(s) out of range: {out_of_range}{'...' if len(out_rows) > 5 else ''}", out_rows
 
 
-def run_custom(rows: list[dict], config: dict) -> tuple[bool, str]:
+def run_custom(data: ColumnStore, config: dict) -> tuple[bool, str]:
     """Placeholder for custom logic; can be extended later."""
     return True, "Custom check not implemented (placeholder)"
 
 
-def run_statsmed_test(rows: list[dict], config: dict) -> tuple[bool, str]:
+def run_statsmed_test(data: ColumnStore, config: dict) -> tuple[bool, str]:
     """Run a statsmed test (from TESTS) with column mapping. config: { test_id, params }."""
     test_id = config.get("test_id")
     params = config.get("params") or {}
     if not test_id:
         return False, "No test_id in config"
-    if not rows:
+    if data.empty:
         return True, "n=0"
     try:
-        df = pd.DataFrame(rows)
+        # Tests may convert columns in place, so each gets its own copy of the shared frame.
+        df = data.frame().copy()
+    except Exception as e:
+        return False, str(e)
+    return run_statsmed_on_frame(df, test_id, params)
+
+
+def run_statsmed_on_frame(df: pd.DataFrame, test_id: str, params: dict) -> tuple[bool, str]:
+    """Run a statsmed test on a DataFrame it may modify; module-level so worker processes can run it."""
+    try:
         text, _ = run_test_with_df(df, test_id, params)
         passed = "Error:" not in text
         return passed, text
@@ -114,28 +224,21 @@ def _fig_to_base64() -> str:
     return base64.b64encode(buf.read()).decode("utf-8")
 
 
-def run_acceptance_bar(rows: list[dict], config: dict) -> tuple[bool, str, dict]:
+def run_acceptance_bar(data: ColumnStore, config: dict) -> tuple[bool, str, dict]:
     """Acceptance/rejection bar for a binary column. Returns structured chart_data for frontend CSS rendering."""
     column = config.get("column")
     if not column:
         return False, "No column specified", {}
-    if not rows:
+    if data.empty:
         return True, "n=0", {}
 
-    values = []
-    for row in rows:
-        v = row.get(column)
-        if v is not None:
-            try:
-                values.append(float(v))
-            except (TypeError, ValueError):
-                pass
+    values = data.numeric(column)[data.convertible(column)]
 
-    if not values:
+    if not values.size:
         return False, f"No numeric values found in '{column}'", {}
 
-    accepted = sum(1 for v in values if v == 1)
-    rejected = sum(1 for v in values if v == 0)
+    accepted = int(np.count_nonzero(values == 1))
+    rejected = int(np.count_nonzero(values == 0))
     n = accepted + rejected
     if n == 0:
         return False, f"No 0/1 values in '{column}'", {}
@@ -160,12 +263,12 @@ def run_acceptance_bar(rows: list[dict], config: dict) -> tuple[bool, str, dict]
     return True, message, chart_data
 
 
-def run_acceptance_history(rows: list[dict], config: dict) -> tuple[bool, str, dict]:
+def run_acceptance_history(data: ColumnStore, config: dict) -> tuple[bool, str, dict]:
     """Placeholder runner; actual history data is injected by the router after the run is saved."""
     return True, "Acceptance history chart", {"type": "acceptance_history", "points": []}
 
 
-def run_laney_p_chart(rows: list[dict], config: dict) -> tuple[bool, str, dict]:
+def run_laney_p_chart(data: ColumnStore, config: dict) -> tuple[bool, str, dict]:
     """Placeholder runner; actual Laney p' chart data is injected by the router from historical runs."""
     k = config.get("k", 3.0)
     return True, "Laney p\u2032 chart", {"type": "laney_p_chart", "pbar": 0, "sigma_z": 0, "k": k, "points": []}
@@ -258,7 +361,7 @@ def compute_laney_p_chart(
     }
 
 
-def run_laney_x_chart(data, config: dict) -> tuple[bool, str, dict]:
+def run_laney_x_chart(data: ColumnStore, config: dict) -> tuple[bool, str, dict]:
     """Compute mean/std/n for a continuous column (stored per run) and act as
     placeholder for the Laney X' chart which is injected by the router from
     historical runs."""
@@ -266,25 +369,11 @@ def run_laney_x_chart(data, config: dict) -> tuple[bool, str, dict]:
     k = config.get("k", 3.0)
     if not column:
         return False, "No column specified", {}
-    if not data:
+    if data.empty:
         return False, "No data rows", {}
 
-    if isinstance(data, dict):
-        raw = data.get(column, [])
-        if not isinstance(raw, list):
-            raw = [raw]
-    else:
-        raw = [row.get(column) for row in data]
-
-    values = []
-    for v in raw:
-        if v is not None:
-            try:
-                f = float(v)
-                if math.isfinite(f):
-                    values.append(f)
-            except (TypeError, ValueError):
-                pass
+    numeric = data.numeric(column)
+    values = numeric[data.convertible(column) & np.isfinite(numeric)]
 
     nd = int(config.get("decimals", 2))
     n = len(values)
@@ -305,9 +394,8 @@ def run_laney_x_chart(data, config: dict) -> tuple[bool, str, dict]:
         message = f"n = {n} (< 2 finite values in '{column}', skipped for chart computation)"
         return True, message, chart_data
 
-    arr = np.array(values)
-    mean_val = float(np.mean(arr))
-    std_val = float(np.std(arr, ddof=1))
+    mean_val = float(np.mean(values))
+    std_val = float(np.std(values, ddof=1))
 
     message = (
         f"n = {n}, "
@@ -429,7 +517,7 @@ def compute_laney_x_chart(
     }
 
 
-def run_laney_u_chart(data, config: dict) -> tuple[bool, str, dict]:
+def run_laney_u_chart(data: ColumnStore, config: dict) -> tuple[bool, str, dict]:
     """Compute count/n for a count column and area-of-opportunity column
     (stored per run) and act as placeholder for the Laney U' chart which
     is injected by the router from historical runs."""
@@ -438,32 +526,21 @@ def run_laney_u_chart(data, config: dict) -> tuple[bool, str, dict]:
     k = config.get("k", 3.0)
     if not count_column or not n_column:
         return False, "count_column and n_column must be specified", {}
-    if not data:
+    if data.empty:
         return False, "No data rows", {}
 
-    if isinstance(data, dict):
-        raw_c = data.get(count_column, [])
-        raw_n = data.get(n_column, [])
-        if not isinstance(raw_c, list):
-            raw_c = [raw_c]
-        if not isinstance(raw_n, list):
-            raw_n = [raw_n]
-    else:
-        raw_c = [row.get(count_column) for row in data]
-        raw_n = [row.get(n_column) for row in data]
-
-    counts = []
-    areas = []
-    for vc, vn in zip(raw_c, raw_n):
-        if vc is not None and vn is not None:
-            try:
-                fc = float(vc)
-                fn = float(vn)
-                if math.isfinite(fc) and math.isfinite(fn) and fc >= 0 and fn > 0:
-                    counts.append(fc)
-                    areas.append(fn)
-            except (TypeError, ValueError):
-                pass
+    fc = data.numeric(count_column)
+    fn = data.numeric(n_column)
+    m = min(len(fc), len(fn))
+    fc, fn = fc[:m], fn[:m]
+    with np.errstate(invalid="ignore"):
+        ok = (
+            data.convertible(count_column)[:m] & data.convertible(n_column)[:m]
+            & np.isfinite(fc) & np.isfinite(fn) & (fc >= 0) & (fn > 0)
+        )
+    # Python's left-to-right sum keeps the stored totals identical to earlier runs.
+    counts = fc[ok].tolist()
+    areas = fn[ok].tolist()
 
     nd = int(config.get("decimals", 4))
     nrows = len(counts)
@@ -597,33 +674,17 @@ def compute_laney_u_chart(
     }
 
 
-def run_success_history(data, config: dict) -> tuple[bool, str, dict]:
+def run_success_history(data: ColumnStore, config: dict) -> tuple[bool, str, dict]:
     """Extract a binary column value (0/1) from the current run.
     Actual history is injected by the router from past runs."""
     column = config.get("column")
     if not column:
         return False, "No column specified", {}
-    if not data:
+    if data.empty:
         return False, "No data rows", {}
 
-    if isinstance(data, dict):
-        raw = data.get(column)
-        if raw is None:
-            raw = []
-        elif not isinstance(raw, list):
-            raw = [raw]
-    else:
-        raw = [row.get(column) for row in data]
-
-    values = []
-    for v in raw:
-        if v is not None:
-            try:
-                f = float(v)
-                if f in (0.0, 1.0):
-                    values.append(int(f))
-            except (TypeError, ValueError):
-                pass
+    numeric = data.numeric(column)
+    values = numeric[data.convertible(column) & ((numeric == 0) | (numeric == 1))].astype(int).tolist()
 
     if not values:
         chart_data = {
@@ -647,34 +708,18 @@ def run_success_history(data, config: dict) -> tuple[bool, str, dict]:
     return True, message, chart_data
 
 
-def run_i_mr_chart(data, config: dict) -> tuple[bool, str, dict]:
+def run_i_mr_chart(data: ColumnStore, config: dict) -> tuple[bool, str, dict]:
     """Extract a single continuous value from the current run for the I-MR
     chart, which is computed from historical runs by the router."""
     column = config.get("column")
     k = config.get("k", 3.0)
     if not column:
         return False, "No column specified", {}
-    if not data:
+    if data.empty:
         return False, "No data rows", {}
 
-    if isinstance(data, dict):
-        raw = data.get(column)
-        if raw is None:
-            raw = []
-        elif not isinstance(raw, list):
-            raw = [raw]
-    else:
-        raw = [row.get(column) for row in data]
-
-    values = []
-    for v in raw:
-        if v is not None:
-            try:
-                f = float(v)
-                if math.isfinite(f):
-                    values.append(f)
-            except (TypeError, ValueError):
-                pass
+    numeric = data.numeric(column)
+    values = numeric[data.convertible(column) & np.isfinite(numeric)].tolist()
 
     nd = int(config.get("decimals", 4))
 
@@ -791,19 +836,96 @@ FUNCTION_RUNNERS = {
 }
 
 
+def _statsmed_columns(config: dict) -> set[str]:
+    test = TESTS.get(config.get("test_id"))
+    if test is None:
+        return set()
+    params = config.get("params") or {}
+    cols: set[str] = set()
+    for inp in test["inputs"]:
+        val = params.get(inp["name"])
+        if inp["type"] == "column" and isinstance(val, str):
+            cols.add(val)
+        elif inp["type"] == "multi_column":
+            vals = val if isinstance(val, list) else [val]
+            cols.update(v for v in vals if isinstance(v, str))
+    cols.update(c for c in params.get("convert_multi_col") or [] if isinstance(c, str))
+    return cols
+
+
+def required_columns(func_type: str, config: dict) -> set[str]:
+    """Payload columns a function reads."""
+    if func_type == "missing":
+        keys = config.get("columns") or []
+    elif func_type == "laney_u_chart":
+        keys = [config.get("count_column"), config.get("n_column")]
+    elif func_type == "statsmed_test":
+        return _statsmed_columns(config)
+    else:
+        keys = [config.get("column")]
+    return {k for k in keys if isinstance(k, str)}
+
+
+class QCPlan:
+    """Compiled list of functions: decoded configs, resolved runners and the
+    payload columns they read.
+
+    Plans are cached and shared between requests (see services.plan_cache), so
+    runners must treat configs as read-only.
+    """
+
+    __slots__ = ("version", "steps", "columns")
+
+    def __init__(self, functions: list[tuple[str, str, dict]], version: int | None = None):
+        self.version = version
+        self.steps = [
+            (name, func_type, config or {}, FUNCTION_RUNNERS.get(func_type, run_custom))
+            for name, func_type, config in functions
+        ]
+        columns: set[str] = set()
+        for _, func_type, config, _ in self.steps:
+            columns |= required_columns(func_type, config)
+        self.columns = frozenset(columns)
+
+
 def run_quality_checks(
-    data: list[dict[str, Any]] | dict[str, Any],
-    functions: list[tuple[str, str, dict]],
+    data: "list[dict[str, Any]] | dict[str, Any] | ColumnStore",
+    functions: "list[tuple[str, str, dict]] | QCPlan",
+    executor=None,
 ) -> list[dict]:
     """
     Run a list of quality control functions on the data.
-    functions: list of (name, function_type, config_dict)
-    Returns list of { "name", "function_type", "passed", "message", optional "figure" }.
+    functions: list of (name, function_type, config_dict) or a compiled QCPlan
+    data may be the raw payload or a ColumnStore already built from it.
+    executor: optional services.qc_executor.QCExecutor to run the functions
+    concurrently with per-function timeouts; without it they run in sequence.
+    Returns list of { "name", "function_type", "passed", "message", optional "figure",
+    "chart_data" or "failed_rows" } in the order of functions.
     """
+    plan = functions if isinstance(functions, QCPlan) else QCPlan(functions)
+    store = data if isinstance(data, ColumnStore) else ColumnStore(data, plan.columns)
+    if executor is None:
+        outcomes = (runner(store, config) for _, _, config, runner in plan.steps)
+    else:
+        outcomes = executor.run(store, plan)
+    return _results(plan, outcomes)
+
+
+def run_quality_checks_batch(samples: list, plan: QCPlan, executor=None) -> list[list[dict]]:
+    """
+    run_quality_checks for many samples; returns one result list per sample.
+    With an executor the functions of several samples run together, so samples
+    are evaluated concurrently rather than one after another.
+    """
+    stores = [ColumnStore(data, plan.columns) for data in samples]
+    if executor is None:
+        return [run_quality_checks(store, plan) for store in stores]
+    return [_results(plan, outcomes) for outcomes in executor.run_many(stores, plan)]
+
+
+def _results(plan: QCPlan, outcomes) -> list[dict]:
     results = []
-    for name, func_type, config in functions:
-        runner = FUNCTION_RUNNERS.get(func_type, run_custom)
-        outcome = runner(data, config or {})
+    for (name, func_type, _, _), outcome in zip(plan.steps, outcomes):
         passed, message = outcome[0], outcome[1]
         extra = outcome[2] if len(outcome) > 2 else None
         entry: dict[str, Any] = {
@@ -816,5 +938,7 @@ def run_quality_checks(
             entry["figure"] = extra
         elif isinstance(extra, dict) and extra:
             entry["chart_data"] = extra
+        elif isinstance(extra, list) and extra:
+            entry["failed_rows"] = extra
         results.append(entry)
     return results
@@ -0,0 +1,79 @@
+"""
+Worker for queued QC runs (POST /api/quality/run/async).
+
+    python -m backend.app.worker
+
+Run one or more of these next to the API, on this node or others, against the
+same DATABASE_URL. Each claims jobs from qc_jobs (see services.qc_jobs), runs
+them like POST /run would and stores the result for GET /api/quality/jobs/{id}/result.
+The API creates the tables; start it once before the workers.
+"""
+import json
+import os
+import signal
+import socket
+import time
+from datetime import datetime
+
+from .db.database import SessionLocal
+from .db.models import QualityControlOperation
+from .routers.quality import execute_run
+from .services.qc_executor import qc_executor
+from .services.qc_jobs import JobLost, claim_job, fail_job, purge_finished_jobs
+
+POLL_INTERVAL = float(os.getenv("QC_JOB_POLL_INTERVAL", "1.0"))
+PURGE_INTERVAL = 3600.0
+
+
+def process_next_job(worker: str) -> bool:
+    """Claim and run one job; False if the queue was empty."""
+    with SessionLocal() as db:
+        job = claim_job(db, worker)
+        if job is None:
+            return False
+        try:
+            operation = db.get(QualityControlOperation, job.operation_id)
+            if operation is None:
+                raise LookupError("operation no longer exists")
+            execute_run(db, operation, json.loads(job.payload_json), job.sample_date, job=job)
+        except JobLost as exc:
+            db.rollback()
+            print(f"[QC worker] {exc}")
+        except Exception as exc:
+            db.rollback()
+            fail_job(db, job.id, f"{type(exc).__name__}: {exc}")
+            print(f"[QC worker] job {job.id} failed: {type(exc).__name__}: {exc}")
+        return True
+
+
+def main() -> None:
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    qc_executor.warm_up()
+    print(f"QC worker {worker} started.")
+    last_purge = 0.0
+    while not stopping:
+        try:
+            if time.monotonic() - last_purge > PURGE_INTERVAL:
+                with SessionLocal() as db:
+                    purge_finished_jobs(db)
+                last_purge = time.monotonic()
+            if not process_next_job(worker):
+                time.sleep(POLL_INTERVAL)
+        except Exception as exc:
+            # e.g. the database is unreachable; keep polling.
+            print(f"[QC worker] {datetime.utcnow().isoformat()} {type(exc).__name__}: {exc}")
+            time.sleep(POLL_INTERVAL)
+    qc_executor.shutdown()
+    print(f"QC worker {worker} stopped.")
+
+
+if __name__ == "__main__":
+    main()
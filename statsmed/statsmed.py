@@ -14,6 +14,7 @@ from sklearn.metrics import roc_auc_score, roc_curve, auc
 
 from scipy.stats import chi2_contingency
 from statsmodels.stats.contingency_tables import mcnemar
+from statsmodels.stats.multitest import multipletests
 
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
@@ -230,18 +231,201 @@ def corr_two_gr(x,y,N_of_decimals = 2,mode = 'choose',Np_of_decimals = 3, quiet
             if not quiet: print(f'The Spearman correlation with 95%-confidence interval is: r = {a[0,1]:.{N_of_decimals}f} (CI: {a[0,3]:.{N_of_decimals}f} - {a[0,4]:.{N_of_decimals}f}; ' + report_p_value(a[0,2],Np_of_decimals) + ')')
             return np.stack([a[0,0],np.round(a[0,1],N_of_decimals),np.round(a[0,2],Np_of_decimals),np.round(a[0,3],N_of_decimals),np.round(a[0,4],N_of_decimals)],axis = 0)
 
+def _corr_complete(A, B):
+    """Pearson correlations between the columns of two NaN-free blocks via one matrix product."""
+    n = A.shape[0]
+    Az = A - A.mean(axis=0)
+    Bz = B - B.mean(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        Az = Az / np.sqrt(np.sum(Az ** 2, axis=0))
+        Bz = Bz / np.sqrt(np.sum(Bz ** 2, axis=0))
+    if n == 0:
+        return np.full((A.shape[1], B.shape[1]), np.nan)
+    return np.clip(Az.T @ Bz, -1, 1)
+
+
+def _corr_pairwise(X, M):
+    """Pearson correlation and pairwise-complete n of all columns of X.
+
+    M is the validity mask of X.  Per-pair sums over the rows where both
+    columns are valid are obtained from masked matrix products, so the
+    result equals pearsonr on each pair with its NaN rows dropped.
+    """
+    W = M.astype(float)
+    Xc = np.where(M, X - np.nanmean(X, axis=0), 0.0)
+    n = W.T @ W
+    sx = Xc.T @ W
+    sxx = (Xc ** 2).T @ W
+    sxy = Xc.T @ Xc
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sx.T / n
+        var_x = sxx - sx ** 2 / n
+        r = cov / np.sqrt(var_x * var_x.T)
+    return np.clip(r, -1, 1), n
+
+
+def _spearman_pairwise(X, M):
+    """Spearman correlation of all columns of X with pairwise-complete ranking.
+
+    Columns are grouped by missingness pattern; for every pair of patterns
+    the shared complete rows are ranked once and all coefficients of the
+    block come from one matrix product.  Without NaN this is a single block.
+    """
+    p = X.shape[1]
+    r = np.full((p, p), np.nan)
+    patterns, labels = np.unique(M.T, axis=0, return_inverse=True)
+    labels = np.ravel(labels)
+    groups = [np.flatnonzero(labels == g) for g in range(len(patterns))]
+    for a in range(len(patterns)):
+        for b in range(a, len(patterns)):
+            rows = patterns[a] & patterns[b]
+            ranks_a = _rank_columns(X[np.ix_(rows, groups[a])])[0]
+            ranks_b = _rank_columns(X[np.ix_(rows, groups[b])])[0] if a != b else ranks_a
+            block = _corr_complete(ranks_a, ranks_b)
+            r[np.ix_(groups[a], groups[b])] = block
+            r[np.ix_(groups[b], groups[a])] = block.T
+    return r
+
+
+def corr_matrix(df, columns=None, method='auto', N_of_decimals=2, Np_of_decimals=3, quiet=False):
+    """Correlation matrix of many variables with p-values and 95%-confidence intervals.
+
+    All-pairs counterpart of corr_two_gr: every column is standardised and
+    ranked once and all Pearson and Spearman coefficients are obtained from
+    matrix products.  The p-values, the Fisher-z interval of the Pearson
+    correlation and the Bonett-Wright interval of the Spearman correlation
+    use the same formulas as corr_two_gr.  NaN values are excluded pairwise
+    (each pair uses the rows where both variables are present).
+
+    Parameters
+    ----------
+    df : DataFrame
+        Data with one variable per column.
+    columns : list of str or None, default None
+        Columns to correlate.  When None all numeric columns are used.
+    method : str, default 'auto'
+        'pearson' (or 'normal distribution'), 'spearman' (or 'no normal
+        distribution'), 'all' to return both, or 'auto' (any other value,
+        like mode='choose' in corr_two_gr): Pearson for pairs where
+        stdnorm_test finds no deviation from normality for both variables,
+        Spearman otherwise.  Normality is tested once per column on all of
+        its non-missing values.
+    N_of_decimals : int, default 2
+        Number of decimals of the printed r-values.
+    Np_of_decimals : int, default 3
+        Number of decimals for significant p values (printed output).
+    quiet : bool, default False
+        Suppress printed output.
+
+    Returns
+    -------
+    dict with keys 'columns', 'n' (pairwise sample sizes), 'normal' (Series
+    of bool per column, only for 'auto'), and per coefficient 'pearson' /
+    'spearman' a dict of DataFrames 'r', 'p', 'ci_low', 'ci_high'.  For
+    'auto' the chosen values are also given directly as 'r', 'p', 'ci_low',
+    'ci_high' and 'method' (0 = Pearson, 1 = Spearman as in corr_two_gr).
+    """
+    if columns is None:
+        columns = [c for c in df.columns if df[c].dtype.kind in 'iufb']
+    columns = list(columns)
+    if len(columns) < 2:
+        raise ValueError('corr_matrix needs at least two columns.')
+    X = df[columns].to_numpy(dtype=float)
+    M = ~np.isnan(X)
+    if method in ('pearson', 'normal distribution'):
+        kinds = ['pearson']
+    elif method in ('spearman', 'no normal distribution'):
+        kinds = ['spearman']
+    else:
+        kinds = ['pearson', 'spearman']
+
+    r_p, n = _corr_pairwise(X, M)
+    z = scipy.stats.norm.ppf(0.975)
+    res = {'columns': columns, 'n': pd.DataFrame(n.astype(int), index=columns, columns=columns)}
+
+    def _frames(r, lo, hi):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = r * np.sqrt((n - 2) / (1 - r ** 2))
+            p = 2 * scipy.stats.t.sf(np.abs(t), n - 2)
+        p[n < 3] = np.nan
+        return {key: pd.DataFrame(val, index=columns, columns=columns) for key, val in (('r', r), ('p', p), ('ci_low', lo), ('ci_high', hi))}
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if 'pearson' in kinds:
+            se = 1 / np.sqrt(n - 3)
+            zr = np.arctanh(r_p)
+            res['pearson'] = _frames(r_p, np.tanh(zr - z * se), np.tanh(zr + z * se))
+        if 'spearman' in kinds:
+            r_s = _spearman_pairwise(X, M)
+            s2 = (1 + np.power(r_s, 2) / 2) / (n - 3)
+            zr = np.arctanh(r_s)
+            res['spearman'] = _frames(r_s, np.tanh(zr - np.sqrt(s2) * z), np.tanh(zr + np.sqrt(s2) * z))
+
+    shown = kinds
+    if method not in ('pearson', 'normal distribution', 'spearman', 'no normal distribution', 'all'):
+        normal = np.array([stdnorm_test(X[M[:, j], j], quiet=True)[0] == 0 if M[:, j].sum() >= 3 else False for j in range(len(columns))])
+        use_spearman = ~(normal[:, None] & normal[None, :])
+        res['normal'] = pd.Series(normal, index=columns)
+        res['method'] = pd.DataFrame(use_spearman.astype(int), index=columns, columns=columns)
+        for key in ('r', 'p', 'ci_low', 'ci_high'):
+            res[key] = res['spearman'][key].where(use_spearman, res['pearson'][key])
+        shown = ['chosen']
+
+    if not quiet:
+        for kind in shown:
+            if kind == 'chosen':
+                n_sp = int(np.triu(use_spearman, 1).sum())
+                n_pairs = len(columns) * (len(columns) - 1) // 2
+                print(f'Correlation matrix ({n_pairs - n_sp} pairs Pearson, {n_sp} pairs Spearman depending on the normality of both variables):')
+                r = res['r']
+            else:
+                print(f'{kind.capitalize()} correlation matrix:')
+                r = res[kind]['r']
+            print(r.round(N_of_decimals).to_string())
+        if np.any(n < len(X)):
+            print(f'NaN values excluded pairwise (n per pair between {int(n.min())} and {int(n.max())}).')
+    return res
+
+
 def func_fit(x,a,b):
     return a*x+b
 
+def _ols_line(x, y):
+    """Closed-form least-squares line y = a*x + b along the last axis.
+
+    Returns (a, b, se_a, se_b) with the same covariance scaling as
+    curve_fit(func_fit, x, y) (residual variance with n - 2 degrees of
+    freedom).  x and y may be batched (..., n); NaN entries are ignored.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    w = ~(np.isnan(x) | np.isnan(y))
+    n = np.sum(w, axis=-1)
+    xw = np.where(w, x, 0.0)
+    yw = np.where(w, y, 0.0)
+    mx = _safe_div(np.sum(xw, axis=-1), n)
+    my = _safe_div(np.sum(yw, axis=-1), n)
+    dx = np.where(w, x - mx[..., None], 0.0)
+    dy = np.where(w, y - my[..., None], 0.0)
+    sxx = np.sum(dx ** 2, axis=-1)
+    a = _safe_div(np.sum(dx * dy, axis=-1), sxx)
+    b = my - a * mx
+    rss = np.sum(np.where(w, (dy - a[..., None] * dx) ** 2, 0.0), axis=-1)
+    s2 = _safe_div(rss, n - 2)
+    se_a = np.sqrt(_safe_div(s2, sxx))
+    se_b = np.sqrt(s2 * (_safe_div(1, n) + _safe_div(mx ** 2, sxx)))
+    return a, b, se_a, se_b
+
 def corr_scatter_figure(x,y,fig_x,title='',x_label='',y_label='', color = 'green',N_of_decimals = 2,mode = 'choose',Np_of_decimals = 3,quiet = False):
     """Makes a scatter plot of the x and y data with a linear regression for visualization and gives the correlations (Spearman and Pearson).
 
     Input: two arrays of test-data (x and y) - please exclude NaN or None Values; Figure; Title; Label of x-axis; Label of y-axis; color; Number of decimals; mode (what to return); Number of decimals for significant p values.
     """
     plt.scatter(x,y, color = color,s=10, alpha=0.2)
-    popt, pcov = scipy.optimize.curve_fit(func_fit, x, y)
+    a, b, se_a, se_b = _ols_line(x, y)
+    popt = np.array([a, b])
     plt.plot(x,func_fit(x,*popt), color = color,linewidth=3)
-    sigma = np.sqrt(np.diagonal(pcov))
+    sigma = np.array([se_a, se_b])
     bound_upper = func_fit(np.linspace(np.min(x), np.max(x), 1000), *(popt + sigma))
     bound_lower = func_fit(np.linspace(np.min(x), np.max(x), 1000), *(popt - sigma))
     plt.fill_between(np.linspace(np.min(x), np.max(x), 1000), bound_lower, bound_upper,color = 'green', alpha = 0.15)
@@ -369,6 +553,239 @@ def comp_two_gr_continuous(x,y,independent,alternative='two-sided', N_of_decimal
                 return res
 
 
+# ---- Mass univariate screening of many features ----
+
+def _rank_columns(X):
+    """Average ranks of every column of X with one argsort per column.
+
+    NaN values are ignored and keep NaN as rank.  Returns (ranks, tie_term)
+    where tie_term[j] = sum(t**3 - t) over the tie groups of column j, as
+    needed for the tie-corrected variance of rank statistics.
+    """
+    X = np.asarray(X, dtype=float)
+    n, m = X.shape
+    order = np.argsort(X, axis=0, kind='mergesort')
+    S = np.take_along_axis(X, order, axis=0)
+    valid = ~np.isnan(S)
+    start = np.ones((n, m), dtype=bool)
+    start[1:] = S[1:] != S[:-1]
+    gid = np.cumsum(start, axis=0) - 1 + n * np.arange(m)[None, :]
+    pos = np.broadcast_to(np.arange(n, dtype=float)[:, None], (n, m))
+    size = np.bincount(gid.ravel(), minlength=n * m).astype(float)
+    pos_sum = np.bincount(gid.ravel(), weights=pos.ravel(), minlength=n * m)
+    mean_pos = _safe_div(pos_sum, size)
+    ranks_sorted = mean_pos[gid] + 1
+    ranks_sorted[~valid] = np.nan
+    ranks = np.empty((n, m))
+    np.put_along_axis(ranks, order, ranks_sorted, axis=0)
+    first = start & valid
+    t = size[gid]
+    tie_term = np.sum(np.where(first, t ** 3 - t, 0.0), axis=0)
+    return ranks, tie_term
+
+
+def _fdr_bh(p):
+    """Benjamini-Hochberg adjusted p-values; NaN entries stay NaN."""
+    p = np.asarray(p, dtype=float)
+    out = np.full(p.shape, np.nan)
+    ok = ~np.isnan(p)
+    if np.any(ok):
+        out[ok] = multipletests(p[ok], method='fdr_bh')[1]
+    return out
+
+
+def _p_from_z(z, alternative):
+    if alternative == 'two-sided':
+        return np.minimum(2 * scipy.stats.norm.sf(np.abs(z)), 1.0)
+    if alternative == 'greater':
+        return scipy.stats.norm.sf(z)
+    return scipy.stats.norm.cdf(z)
+
+
+def _p_from_t(t, df, alternative):
+    if alternative == 'two-sided':
+        return np.minimum(2 * scipy.stats.t.sf(np.abs(t), df), 1.0)
+    if alternative == 'greater':
+        return scipy.stats.t.sf(t, df)
+    return scipy.stats.t.cdf(t, df)
+
+
+def screen_two_groups(df, group_col, feature_cols, paired=False, alternative='two-sided', groups=None, id_col=None, alpha=0.05, quiet=False):
+    """Screen many continuous features for a difference between two groups.
+
+    Array-oriented counterpart of comp_two_gr_continuous for thousands of
+    columns: all statistics are computed for every feature at once, without
+    normality tests or descriptive printing per column.  NaN values are
+    excluded per feature (per pair if paired).
+
+    Independent groups: Welch t-test, Mann-Whitney U test (normal
+    approximation with tie and continuity correction), Hedges' g and the
+    rank-biserial correlation.
+    Paired groups: paired t-test, Wilcoxon signed-rank test (zeros dropped,
+    normal approximation with tie correction), Cohen's d_z and the
+    matched-pairs rank-biserial correlation.
+    All p-values are also reported adjusted by Benjamini-Hochberg FDR.
+
+    Parameters
+    ----------
+    df : DataFrame
+        One row per observation.
+    group_col : str
+        Column with the group label; must contain exactly two groups unless
+        groups is given.
+    feature_cols : list of str
+        Continuous feature columns to screen.
+    paired : bool, default False
+        If True the i-th row of the first group is paired with the i-th row
+        of the second group (or matched by id_col).
+    alternative : str, default 'two-sided'
+        'two-sided', 'less' or 'greater' (first group vs second group).
+    groups : list or None, default None
+        The two group labels as (first, second).  When None the sorted
+        unique values of group_col are used.
+    id_col : str or None, default None
+        Only for paired=True: column identifying the subject to match pairs.
+    alpha : float, default 0.05
+        Significance level used for the printed summary and 'significant'.
+    quiet : bool, default False
+        Suppress printed output.
+
+    Returns
+    -------
+    DataFrame indexed by feature.  Independent: n1, n2, mean1, mean2, sd1,
+    sd2, median1, median2, t, t_df, t_p, t_p_fdr, hedges_g, U, U_p, U_p_fdr,
+    rank_biserial.  Paired: n, mean_diff, sd_diff, median_diff, t, t_df, t_p,
+    t_p_fdr, cohen_dz, W, W_p, W_p_fdr, rank_biserial.  Plus significant_t /
+    significant_rank (FDR-adjusted p < alpha).
+    """
+    if alternative not in ('two-sided', 'less', 'greater'):
+        raise ValueError("alternative must be 'two-sided', 'less' or 'greater'.")
+    feature_cols = list(feature_cols)
+    if groups is None:
+        groups = sorted(df[group_col].dropna().unique())
+    if len(groups) != 2:
+        raise ValueError(f"group_col must contain exactly two groups (found {len(groups)}).")
+    d1 = df.loc[df[group_col] == groups[0]]
+    d2 = df.loc[df[group_col] == groups[1]]
+    if paired and id_col is not None:
+        d1 = d1.set_index(id_col)
+        d2 = d2.set_index(id_col)
+        if d1.index.has_duplicates or d2.index.has_duplicates:
+            raise ValueError('id_col must be unique within each group.')
+        common = d1.index.intersection(d2.index)
+        d1 = d1.loc[common]
+        d2 = d2.loc[common]
+    X1 = d1[feature_cols].to_numpy(dtype=float)
+    X2 = d2[feature_cols].to_numpy(dtype=float)
+
+    if paired:
+        if X1.shape[0] != X2.shape[0]:
+            raise ValueError('For paired=True both groups must have the same number of rows.')
+        D = X1 - X2
+        n = np.sum(~np.isnan(D), axis=0).astype(float)
+        mean_d = np.nanmean(D, axis=0) if D.shape[0] else np.full(len(feature_cols), np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sd_d = np.sqrt(_safe_div(np.nansum((D - mean_d) ** 2, axis=0), n - 1))
+        t = _safe_div(mean_d, _safe_div(sd_d, np.sqrt(n)))
+        t_df = n - 1
+        t_p = _p_from_t(t, t_df, alternative)
+        cohen_dz = _safe_div(mean_d, sd_d)
+
+        Dnz = np.where(D == 0, np.nan, D)
+        ranks, tie_term = _rank_columns(np.abs(Dnz))
+        n_r = np.sum(~np.isnan(Dnz), axis=0).astype(float)
+        r_plus = np.nansum(np.where(Dnz > 0, ranks, 0.0), axis=0)
+        r_minus = n_r * (n_r + 1) / 2 - r_plus
+        mn = n_r * (n_r + 1) / 4
+        se = np.sqrt(n_r * (n_r + 1) * (2 * n_r + 1) / 24 - tie_term / 48)
+        z = _safe_div(r_plus - mn, se)
+        W = np.minimum(r_plus, r_minus) if alternative == 'two-sided' else r_plus
+        W_p = _p_from_z(z, alternative)
+        rank_biserial = _safe_div(r_plus - r_minus, r_plus + r_minus)
+
+        res = pd.DataFrame({
+            'n': n.astype(int),
+            'mean_diff': mean_d,
+            'sd_diff': sd_d,
+            'median_diff': np.nanmedian(D, axis=0) if D.shape[0] else np.nan,
+            't': t,
+            't_df': t_df,
+            't_p': t_p,
+            't_p_fdr': _fdr_bh(t_p),
+            'cohen_dz': cohen_dz,
+            'W': W,
+            'W_p': W_p,
+            'W_p_fdr': _fdr_bh(W_p),
+            'rank_biserial': rank_biserial,
+        }, index=pd.Index(feature_cols, name='feature'))
+        res['significant_t'] = res['t_p_fdr'] < alpha
+        res['significant_rank'] = res['W_p_fdr'] < alpha
+    else:
+        n1 = np.sum(~np.isnan(X1), axis=0).astype(float)
+        n2 = np.sum(~np.isnan(X2), axis=0).astype(float)
+        m1 = _safe_div(np.nansum(X1, axis=0), n1)
+        m2 = _safe_div(np.nansum(X2, axis=0), n2)
+        v1 = _safe_div(np.nansum((X1 - m1) ** 2, axis=0), n1 - 1)
+        v2 = _safe_div(np.nansum((X2 - m2) ** 2, axis=0), n2 - 1)
+        se1 = _safe_div(v1, n1)
+        se2 = _safe_div(v2, n2)
+        t = _safe_div(m1 - m2, np.sqrt(se1 + se2))
+        t_df = _safe_div(np.power(se1 + se2, 2), _safe_div(np.power(se1, 2), n1 - 1) + _safe_div(np.power(se2, 2), n2 - 1))
+        t_p = _p_from_t(t, t_df, alternative)
+        sd_pooled = np.sqrt(_safe_div((n1 - 1) * v1 + (n2 - 1) * v2, n1 + n2 - 2))
+        hedges_g = _safe_div(m1 - m2, sd_pooled) * (1 - _safe_div(3, 4 * (n1 + n2) - 9))
+
+        ranks, tie_term = _rank_columns(np.vstack([X1, X2]))
+        R1 = np.nansum(ranks[:X1.shape[0]], axis=0)
+        U1 = R1 - n1 * (n1 + 1) / 2
+        U2 = n1 * n2 - U1
+        N = n1 + n2
+        mu = n1 * n2 / 2
+        s = np.sqrt(n1 * n2 / 12 * ((N + 1) - _safe_div(tie_term, N * (N - 1))))
+        if alternative == 'two-sided':
+            U = np.maximum(U1, U2)
+        elif alternative == 'greater':
+            U = U1
+        else:
+            U = U2
+        z = _safe_div(U - mu - 0.5, s)
+        U_p = _p_from_z(z, 'greater')
+        if alternative == 'two-sided':
+            U_p = np.minimum(2 * U_p, 1.0)
+        rank_biserial = _safe_div(2 * U1, n1 * n2) - 1
+
+        with np.errstate(invalid='ignore'):
+            res = pd.DataFrame({
+                'n1': n1.astype(int),
+                'n2': n2.astype(int),
+                'mean1': m1,
+                'mean2': m2,
+                'sd1': np.sqrt(v1),
+                'sd2': np.sqrt(v2),
+                'median1': np.nanmedian(X1, axis=0) if X1.shape[0] else np.nan,
+                'median2': np.nanmedian(X2, axis=0) if X2.shape[0] else np.nan,
+                't': t,
+                't_df': t_df,
+                't_p': t_p,
+                't_p_fdr': _fdr_bh(t_p),
+                'hedges_g': hedges_g,
+                'U': U1,
+                'U_p': U_p,
+                'U_p_fdr': _fdr_bh(U_p),
+                'rank_biserial': rank_biserial,
+            }, index=pd.Index(feature_cols, name='feature'))
+        res['significant_t'] = res['t_p_fdr'] < alpha
+        res['significant_rank'] = res['U_p_fdr'] < alpha
+
+    if not quiet:
+        rank_test = 'Wilcoxon signed-rank' if paired else 'Mann-Whitney U'
+        t_test = 'Paired t-test' if paired else 'Welch t-test'
+        print(f'Screened {len(feature_cols)} features: {groups[0]} vs {groups[1]} ({"paired" if paired else "independent"})')
+        print(f'{t_test}: {int(res["significant_t"].sum())} significant after FDR correction (q < {alpha})')
+        print(f'{rank_test}: {int(res["significant_rank"].sum())} significant after FDR correction (q < {alpha})')
+    return res
+
+
 def bland_altman_plot(x, y, fig_x,title='',x_label='Mean of raters',y_label='Difference in seconds between raters'):
     """Makes a Bland-Altman plot of the x and y data.
 
@@ -518,6 +935,161 @@ def boxplot_figure(x,data,independent,mode = 'choose',title='',x_label='',y_labe
 
 
 
+# ---- Vectorized confusion-matrix core shared by the accuracy functions ----
+
+ACC_SENS_LABELS = [
+    'Size of total population',
+    'Number of positives',
+    'Number of negatives',
+    'Number of predicted positives',
+    'Number of predicted negatives',
+    'Number of true positives',
+    'Number of true negatives',
+    'Number of false positives',
+    'Number of false negatives',
+    'Prevalence',
+    'Accuracy',
+    'Positive Predictive Value / Precision (PPV)',
+    'Negative Predictive Value (NPV)',
+    'False Omission Rate (FOR)',
+    'False Discovery Rate (FDR)',
+    'True Positive Rate / Sensitivity / Recall (TPR)',
+    'True Negative Rate / Specificity (TNR)',
+    'False Positive Rate (FPR)',
+    'False Negative Rate (FNR)',
+    "Informedness / Youden's J statistic",
+    'Prevalence threshold',
+    'Balanced accuracy',
+    'F1 score',
+    'Positive likelihood ratio',
+    'Negative likelihood ratio',
+    'Diagnostics Odds Ratio (DOR)',
+    'Jaccard Index',
+]
+
+
+def _safe_div(a, b):
+    """Element-wise a / b that returns NaN wherever b is zero."""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    a, b = np.broadcast_arrays(a, b)
+    out = np.full(a.shape, np.nan)
+    np.divide(a, b, out=out, where=(b != 0))
+    return out
+
+
+def _proportion_confint_arr(count, nobs, method='wilson', alpha=0.05):
+    """Array-valued confidence intervals for binomial proportions.
+
+    Wilson and Clopper-Pearson ('beta') intervals are evaluated in closed form
+    on whole arrays; every other method is forwarded to statsmodels'
+    proportion_confint in a single call.  Entries with nobs == 0 give NaN.
+    """
+    count = np.asarray(count, dtype=float)
+    nobs = np.asarray(nobs, dtype=float)
+    count, nobs = np.broadcast_arrays(count, nobs)
+    lo = np.full(count.shape, np.nan)
+    hi = np.full(count.shape, np.nan)
+    ok = nobs > 0
+    if not np.any(ok):
+        return lo, hi
+    c = count[ok]
+    m = nobs[ok]
+    if method == 'wilson':
+        q = c / m
+        crit = scipy.stats.norm.isf(alpha / 2)
+        crit2 = crit ** 2
+        denom = 1 + crit2 / m
+        center = (q + crit2 / (2 * m)) / denom
+        dist = crit * np.sqrt(q * (1 - q) / m + crit2 / (4 * m ** 2)) / denom
+        lo[ok] = center - dist
+        hi[ok] = center + dist
+    elif method == 'beta':
+        with np.errstate(invalid='ignore'):
+            lo_ok = scipy.stats.beta.ppf(alpha / 2, c, m - c + 1)
+            hi_ok = scipy.stats.beta.isf(alpha / 2, c + 1, m - c)
+        lo[ok] = np.where(c == 0, 0.0, lo_ok)
+        hi[ok] = np.where(c == m, 1.0, hi_ok)
+    else:
+        lo_ok, hi_ok = proportion_confint(c, m, alpha=alpha, method=method)
+        lo[ok] = lo_ok
+        hi[ok] = hi_ok
+    return lo, hi
+
+
+def _acc_sens_counts(gt, x):
+    """3x3 confusion tables of gt against one or many predictions.
+
+    Labels other than 0 and 1 fall into a third 'other' category so that the
+    marginal counts match those of acc_sens.  x may be 1-D (n,) or 2-D
+    (n_raters, n); the result has shape (..., 3, 3) indexed [gt, x].
+    """
+    gt = np.asarray(gt)
+    x = np.asarray(x)
+    if x.shape[-1] != gt.shape[-1]:
+        raise ValueError('Length of ground truth and evaluation parameter are not equal')
+    g3 = np.where(gt == 1, 1, np.where(gt == 0, 0, 2))
+    x3 = np.where(x == 1, 1, np.where(x == 0, 0, 2))
+    codes = g3 * 3 + x3
+    if codes.ndim == 1:
+        return np.bincount(codes, minlength=9).reshape(3, 3)
+    n_raters = codes.shape[0]
+    codes = codes + 9 * np.arange(n_raters)[:, None]
+    return np.bincount(codes.ravel(), minlength=9 * n_raters).reshape(n_raters, 3, 3)
+
+
+def _acc_sens_from_counts(total_population, p, n, pp, pn, tp, tn, fp, fn, method='wilson'):
+    """All 27 acc_sens metrics with confidence intervals from count arrays.
+
+    Inputs broadcast against each other.  Returns (values, ci_low, ci_high),
+    each with shape (..., 27) in the order of ACC_SENS_LABELS; metrics that
+    are not binomial proportions have NaN intervals.
+    """
+    total_population, p, n, pp, pn, tp, tn, fp, fn = np.broadcast_arrays(
+        *[np.asarray(v, dtype=float) for v in (total_population, p, n, pp, pn, tp, tn, fp, fn)])
+    # numerator / denominator of the ten proportion metrics (indices 9 - 18)
+    num = np.stack([p, tp + tn, tp, tn, fn, fp, tp, tn, fp, fn], axis=-1)
+    den = np.stack([total_population, total_population, pp, pn, pn, pp, p, n, n, p], axis=-1)
+    props = _safe_div(num, den)
+    prop_lc, prop_uc = _proportion_confint_arr(num, den, method=method)
+    prevalence, accuracy, ppv, npv, false_omission_rate, false_discovery_rate, tpr, tnr, fpr, fnr = np.moveaxis(props, -1, 0)
+    informedness_youdenJ = tpr + tnr - 1
+    with np.errstate(invalid='ignore'):
+        prevalence_threshold = _safe_div(np.sqrt(tpr * fpr) - fpr, tpr - fpr)
+    balanced_accuracy = (tpr + tnr) / 2
+    f1_score = _safe_div(2 * ppv * tpr, ppv + tpr)
+    LRpos = _safe_div(tpr, fpr)
+    LRneg = _safe_div(fnr, tnr)
+    DiagOddsRatio = _safe_div(LRpos, LRneg)
+    JaccardIndex = _safe_div(tp, tp + fn + fp)
+    values = np.concatenate([
+        np.stack([total_population, p, n, pp, pn, tp, tn, fp, fn], axis=-1),
+        props,
+        np.stack([informedness_youdenJ, prevalence_threshold, balanced_accuracy, f1_score,
+                  LRpos, LRneg, DiagOddsRatio, JaccardIndex], axis=-1),
+    ], axis=-1)
+    ci_low = np.full(values.shape, np.nan)
+    ci_high = np.full(values.shape, np.nan)
+    ci_low[..., 9:19] = prop_lc
+    ci_high[..., 9:19] = prop_uc
+    return values, ci_low, ci_high
+
+
+def _acc_sens_core(gt, x, method='wilson'):
+    """Build the confusion table with one bincount and derive all metrics."""
+    table = _acc_sens_counts(gt, x)
+    total_population = np.full(table.shape[:-2], np.asarray(gt).shape[-1])
+    p = table[..., 1, :].sum(axis=-1)
+    n = table[..., 0, :].sum(axis=-1)
+    pp = table[..., :, 1].sum(axis=-1)
+    pn = table[..., :, 0].sum(axis=-1)
+    tp = table[..., 1, 1]
+    tn = table[..., 0, 0]
+    fp = table[..., 0, 1]
+    fn = table[..., 1, 0]
+    return _acc_sens_from_counts(total_population, p, n, pp, pn, tp, tn, fp, fn, method=method)
+
+
 def acc_sens(gt,x,N_of_decimals = 2,method = 'wilson',quiet = False):
     """Classification accuracy and sensitivity analysis.
 
@@ -549,6 +1121,8 @@ def acc_sens(gt,x,N_of_decimals = 2,method = 'wilson',quiet = False):
     24: Negative likelihood ratio
     25: Diagnostics Odds Ratio (DOR)
     26: Jaccard Index
+
+    For many raters or classifiers against one ground truth use acc_sens_batch.
     """
     if np.sum(((gt != 1).astype(int) + (gt != 0).astype(int)) != 1) > 0:
         print('Ground truth is not indicated by ones and zeros')
@@ -556,63 +1130,38 @@ def acc_sens(gt,x,N_of_decimals = 2,method = 'wilson',quiet = False):
         print('Evaluation parameter is not indicated by ones and zeros')
     if len(gt) != len(x):
         print('Length of ground truth and evaluation parameter are not equal')
-    total_population = len(gt)
+    res, lc, uc = _acc_sens_core(gt, x, method=method)
+    [total_population,p,n,pp,pn,tp,tn,fp,fn,prevalence,accuracy,ppv,npv,false_omission_rate,false_discovery_rate,tpr,tnr,fpr,fnr,informedness_youdenJ,prevalence_threshold,balanced_accuracy,f1_score,LRpos,LRneg,DiagOddsRatio,JaccardIndex] = res
+    [prevalence_lc,accuracy_lc,ppv_lc,npv_lc,false_omission_rate_lc,false_discovery_rate_lc,tpr_lc,tnr_lc,fpr_lc,fnr_lc] = lc[9:19]
+    [prevalence_uc,accuracy_uc,ppv_uc,npv_uc,false_omission_rate_uc,false_discovery_rate_uc,tpr_uc,tnr_uc,fpr_uc,fnr_uc] = uc[9:19]
     if not quiet: print(f'Size of total population: {total_population:.{0}f}')
-    p = np.sum(gt == 1)
     if not quiet: print(f'Number of positives: {p:.{0}f}')
-    n = np.sum(gt == 0)
     if not quiet: print(f'Number of negatives: {n:.{0}f}')
-    pp = np.sum(x == 1)
     if not quiet: print(f'Number of predicted positives: {pp:.{0}f}')
-    pn = np.sum(x == 0)
     if not quiet: print(f'Number of predicted negatives: {pn:.{0}f}')
-    tp = np.sum((gt == 1) & (x == 1))
     if not quiet: print(f'Number of true positives: {tp:.{0}f}')
-    tn = np.sum((gt == 0) & (x == 0))
     if not quiet: print(f'Number of true negatives: {tn:.{0}f}')
-    fp = np.sum((gt == 0) & (x == 1))
     if not quiet: print(f'Number of false positives: {fp:.{0}f}')
-    fn = np.sum((gt == 1) & (x == 0))
     if not quiet: print(f'Number of false negatives: {fn:.{0}f}')
-    prevalence = np.nan
-    if total_population != 0:
-        prevalence = p/total_population
-        prevalence_lc, prevalence_uc = proportion_confint(p, total_population, method=method)
-    else:
+    if total_population == 0:
         print('Prevalence cannot be calculated as the size of total population is zero')
     if not quiet: print(f'Prevalence: {prevalence * 100:.{N_of_decimals}f}% (CI: {prevalence_lc * 100:.{N_of_decimals}f}% - {prevalence_uc * 100:.{N_of_decimals}f}%)')
-    accuracy = np.nan
-    if total_population != 0:
-        accuracy = (tp + tn)/total_population
-        accuracy_lc, accuracy_uc = proportion_confint(tp + tn, total_population, method=method)
-    else:
+    if total_population == 0:
         print('Accuaracy cannot be calculated as the size of total population is zero')
     if not quiet: print(f'Accuaracy: {accuracy * 100:.{N_of_decimals}f}% (CI: {accuracy_lc * 100:.{N_of_decimals}f}% - {accuracy_uc * 100:.{N_of_decimals}f}%)')
-    ppv = np.nan
     if pp != 0:
-        ppv = tp/pp
-        ppv_lc, ppv_uc = proportion_confint(tp, pp, method=method)
         if not quiet: print(f'Positive Predictive Value / Precision (PPV): {ppv * 100:.{N_of_decimals}f}% (CI: {ppv_lc * 100:.{N_of_decimals}f}% - {ppv_uc * 100:.{N_of_decimals}f}%)')
     else:
         print('Positive Predictive Value / Precision (PPV) cannot be calculated as the number of predicted positives is zero')
-    npv = np.nan
     if pn != 0:
-        npv = tn/pn
-        npv_lc, npv_uc = proportion_confint(tn, pn, method=method)
         if not quiet: print(f'Negative Predictive Value (NPV): {npv * 100:.{N_of_decimals}f}% (CI: {npv_lc * 100:.{N_of_decimals}f}% - {npv_uc * 100:.{N_of_decimals}f}%)')
     else:
         print('Negative Predictive Value (NPV) cannot be calculated as the number of predicted negatives is zero')
-    false_omission_rate = np.nan
     if pn != 0:
-        false_omission_rate = fn/pn
-        false_omission_rate_lc, false_omission_rate_uc = proportion_confint(fn, pn, method=method)
         if not quiet: print(f'False Omission Rate (FOR): {false_omission_rate * 100:.{N_of_decimals}f}% (CI: {false_omission_rate_lc * 100:.{N_of_decimals}f}% - {false_omission_rate_uc * 100:.{N_of_decimals}f}%)')
     else:
         print('False Omission Rate (FOR) cannot be calculated as the number of predicted negatives is zero')
-    false_discovery_rate = np.nan
     if pp != 0:
-        false_discovery_rate = fp/pp
-        false_discovery_rate_lc, false_discovery_rate_uc = proportion_confint(fp, pp, method=method)
         if not quiet: print(f'False Discovery Rate (FDR): {false_discovery_rate * 100:.{N_of_decimals}f}% (CI: {false_discovery_rate_lc * 100:.{N_of_decimals}f}% - {false_discovery_rate_uc * 100:.{N_of_decimals}f}%)')
     else:
         print('False Discovery Rate (FDR) cannot be calculated as the number of predicted positives is zero')
@@ -620,31 +1169,19 @@ def acc_sens(gt,x,N_of_decimals = 2,method = 'wilson',quiet = False):
         print('Problem with False Omission Rate (FOR)')
     if np.round(false_discovery_rate,N_of_decimals) != np.round((1-ppv),N_of_decimals):
         print('Problem with False Discovery Rate (FDR)')
-    tpr = np.nan
     if p != 0:
-        tpr = tp/p
-        tpr_lc, tpr_uc = proportion_confint(tp, p, method=method)
         if not quiet: print(f'True Positive Rate / Sensitivity / Recall (TPR): {tpr * 100:.{N_of_decimals}f}% (CI: {tpr_lc * 100:.{N_of_decimals}f}% - {tpr_uc * 100:.{N_of_decimals}f}%)')
     else:
         print('True Positive Rate / Sensitivity / Recall (TPR) cannot be calculated as the number of positives is zero')
-    tnr = np.nan
     if n != 0:
-        tnr = tn/n
-        tnr_lc, tnr_uc = proportion_confint(tn, n, method=method)
         if not quiet: print(f'True Negative Rate / Spezificity (TNR): {tnr * 100:.{N_of_decimals}f}% (CI: {tnr_lc * 100:.{N_of_decimals}f}% - {tnr_uc * 100:.{N_of_decimals}f}%)')
     else:
         print('True Negative Rate / Spezificity (TNR) cannot be calculated as the number of negatives is zero')
-    fpr = np.nan
     if n != 0:
-        fpr = fp/n
-        fpr_lc, fpr_uc = proportion_confint(fp, n, method=method)
         if not quiet: print(f'False Positive Rate (FPR): {fpr * 100:.{N_of_decimals}f}% (CI: {fpr_lc * 100:.{N_of_decimals}f}% - {fpr_uc * 100:.{N_of_decimals}f}%)')
     else:
         print('False Positive Rate (FPR) cannot be calculated as the number of negatives is zero')
-    fnr = np.nan
     if p != 0:
-        fnr = fn/p
-        fnr_lc, fnr_uc = proportion_confint(fn, p, method=method)
         if not quiet: print(f'False Negative Rate (FNR): {fnr * 100:.{N_of_decimals}f}% (CI: {fnr_lc * 100:.{N_of_decimals}f}% - {fnr_uc * 100:.{N_of_decimals}f}%)')
     else:
         print('False Negative Rate (FNR) cannot be calculated as the number of positives is zero')
@@ -656,59 +1193,312 @@ def acc_sens(gt,x,N_of_decimals = 2,method = 'wilson',quiet = False):
         print('Problem with False Positive Rate')
     if np.round(fnr,N_of_decimals) != np.round((1-tpr),N_of_decimals):
         print('Problem with False Negative Rate')
-    informedness_youdenJ = np.nan
-    if (np.isnan(tpr) or np.isnan(tnr)) == False:
-        informedness_youdenJ = tpr + tnr -1
-    else:
+    if np.isnan(tpr) or np.isnan(tnr):
         print('Informedness / Youden\'s J statistic cannot be calculated as the True Positive Rate / Sensitivity / Recall (TPR) or the True Negative Rate / Spezificity (TNR) cannot be calculated')
     if not quiet: print(f'Informedness / Youden\'s J statistic: {informedness_youdenJ:.{N_of_decimals}f}')
-    prevalence_threshold = np.nan
-    if ((np.isnan(tpr) or np.isnan(fpr)) == False) and ((tpr - fpr) != 0):
-        prevalence_threshold = (np.sqrt(tpr*fpr) - fpr)/(tpr - fpr)
-    else:
+    if np.isnan(prevalence_threshold):
         print('Prevalence threshold cannot be calculated as the True Positive Rate / Sensitivity / Recall (TPR) or the False Positive Rate (FPR) cannot be calculated')
     if not quiet: print(f'Prevalence threshold: {prevalence_threshold:.{N_of_decimals}f}')
-    balanced_accuracy = np.nan
-    if (np.isnan(tpr) or np.isnan(tnr)) == False:
-        balanced_accuracy = (tpr + tnr)/2
-    else:
+    if np.isnan(tpr) or np.isnan(tnr):
         print('Balanced accuracy cannot be calculated as the True Positive Rate / Sensitivity / Recall (TPR) or the True Negative Rate / Spezificity (TNR) cannot be calculated')
     if not quiet: print(f'Balanced accuracy: {balanced_accuracy * 100:.{N_of_decimals}f}%')
-    f1_score = np.nan
-    if ((np.isnan(ppv) or np.isnan(tpr)) == False) and ((ppv + tpr) != 0):
-        f1_score = (2 * ppv * tpr)/(ppv + tpr)
-    else:
+    if np.isnan(f1_score):
         print('F1 score cannot be calculated as the True Positive Rate / Sensitivity / Recall (TPR) or the Positive Predictive Value / Precision (PPV) cannot be calculated')
-    if np.round(f1_score,N_of_decimals) != np.round(((2*tp)/(2*tp + fp + fn)),N_of_decimals):
+    if np.round(f1_score,N_of_decimals) != np.round(_safe_div(2*tp, 2*tp + fp + fn),N_of_decimals):
         print('Problem with F1 score')
     if not quiet: print(f'F1 score: {f1_score:.{N_of_decimals}f}')
-    LRpos = np.nan
-    if ((np.isnan(fpr) or np.isnan(tpr)) == False) and (fpr != 0):
-        LRpos = tpr/fpr
-    else:
+    if np.isnan(LRpos):
         print('Positive likelihood ratio score cannot be calculated as the True Positive Rate / Sensitivity / Recall (TPR) or the False Positive Rate (FPR) cannot be calculated')
     if not quiet: print(f'Positive likelihood ratio: {LRpos:.{N_of_decimals}f}')
-    LRneg = np.nan
-    if ((np.isnan(fnr) or np.isnan(tnr)) == False) and (tnr != 0):
-        LRneg = fnr/tnr
-    else:
+    if np.isnan(LRneg):
         print('Negative likelihood ratio score cannot be calculated as the True Negative Rate / Spezificity (TNR) or the False Negative Rate (FNR) cannot be calculated')
     if not quiet: print(f'Negative likelihood ratio: {LRneg:.{N_of_decimals}f}')
-    DiagOddsRatio = np.nan
-    if ((np.isnan(LRpos) or np.isnan(LRneg)) == False) and (LRneg != 0):
-        DiagOddsRatio = LRpos / LRneg
-    else:
+    if np.isnan(DiagOddsRatio):
         print('Diagnostics Odds Ratio (DOR) cannot be calculated as the positive or negative likelihood ratio cannot be calculated')
     if not quiet: print(f'Diagnostics Odds Ratio (DOR): {DiagOddsRatio:.{N_of_decimals}f}')
-    JaccardIndex = np.nan
-    if (tp + fn + fp) != 0:
-        JaccardIndex = tp/(tp + fn + fp)
-    else:
+    if np.isnan(JaccardIndex):
         print('Jaccard Index cannot be calculated')
     if not quiet: print(f'Jaccard Index: {JaccardIndex:.{N_of_decimals}f}')
-    res = np.array([total_population,p,n,pp,pn,tp,tn,fp,fn,prevalence,accuracy,ppv,npv,false_omission_rate,false_discovery_rate,tpr,tnr,fpr,fnr,informedness_youdenJ,prevalence_threshold,balanced_accuracy,f1_score,LRpos,LRneg,DiagOddsRatio,JaccardIndex])
     return np.round(res,N_of_decimals)
 
+
+def acc_sens_batch(gt, x, N_of_decimals=2, method='wilson'):
+    """Classification metrics of many raters or classifiers against one ground truth.
+
+    Vectorized counterpart of acc_sens: the 2x2 tables of all raters are built
+    with a single np.bincount and the 27 metrics plus their confidence
+    intervals are evaluated on whole arrays, without printing.
+
+    Parameters
+    ----------
+    gt : array-like, shape (n,)
+        Ground truth (0/1).
+    x : array-like, shape (n,) or (n_raters, n)
+        Predictions (0/1); one row per rater / classifier.
+    N_of_decimals : int, default 2
+        Rounding precision of the returned values.
+    method : str, default 'wilson'
+        Confidence-interval method for the proportions, as in acc_sens
+        ('wilson' and 'beta' (Clopper-Pearson) are computed in closed form).
+
+    Returns
+    -------
+    dict with keys:
+        labels  : list    – metric names in the order used by acc_sens
+        values  : ndarray – metrics, shape (27,) or (n_raters, 27)
+        ci_low  : ndarray – lower 95% confidence limits (NaN where undefined)
+        ci_high : ndarray – upper 95% confidence limits (NaN where undefined)
+    """
+    gt = np.asarray(gt)
+    x = np.asarray(x)
+    if gt.ndim != 1:
+        raise ValueError('gt must be one-dimensional.')
+    if x.ndim not in (1, 2):
+        raise ValueError('x must be an array of shape (n,) or (n_raters, n).')
+    values, ci_low, ci_high = _acc_sens_core(gt, x, method=method)
+    return {
+        'labels': list(ACC_SENS_LABELS),
+        'values': np.round(values, N_of_decimals),
+        'ci_low': np.round(ci_low, N_of_decimals),
+        'ci_high': np.round(ci_high, N_of_decimals),
+    }
+
+
+def acc_sens_thresholds(gt, scores, thresholds=None, positive_label=1, N_of_decimals=2, method='wilson'):
+    """Classification metrics of a continuous score at every cut-off.
+
+    A case is predicted positive when its score is >= the threshold (the
+    convention of sklearn's roc_curve).  The scores are sorted once and the
+    true/false positives at every threshold are read from cumulative sums, so
+    the whole table costs O(n log n) instead of one acc_sens call per cut-off.
+    The metric definitions are those of acc_sens.
+
+    Parameters
+    ----------
+    gt : array-like
+        Ground truth labels; cases equal to positive_label are positives,
+        all others negatives.
+    scores : array-like
+        Continuous predictions (higher = more likely positive); no NaN.
+    thresholds : array-like or None, default None
+        Cut-offs to evaluate.  When None every distinct score is used,
+        in descending order.
+    positive_label : default 1
+        Label of the positive class in gt.
+    N_of_decimals : int, default 2
+        Rounding precision of the returned values.
+    method : str, default 'wilson'
+        Confidence-interval method for the proportions, as in acc_sens.
+
+    Returns
+    -------
+    dict with keys:
+        thresholds : ndarray – evaluated cut-offs, shape (m,)
+        labels     : list    – metric names in the order used by acc_sens
+        values     : ndarray – metrics, shape (m, 27)
+        ci_low     : ndarray – lower 95% confidence limits (NaN where undefined)
+        ci_high    : ndarray – upper 95% confidence limits (NaN where undefined)
+    """
+    gt = np.asarray(gt)
+    scores = np.asarray(scores, dtype=float)
+    if gt.shape != scores.shape or gt.ndim != 1:
+        raise ValueError('gt and scores must be one-dimensional arrays of the same length.')
+    if np.any(np.isnan(scores)):
+        raise ValueError('scores must not contain NaN values.')
+
+    order = np.argsort(-scores, kind='mergesort')
+    s_desc = scores[order]
+    pos_desc = (gt[order] == positive_label).astype(float)
+    tp_cum = np.concatenate([[0.0], np.cumsum(pos_desc)])
+    fp_cum = np.concatenate([[0.0], np.cumsum(1.0 - pos_desc)])
+
+    if thresholds is None:
+        first = np.ones(len(s_desc), dtype=bool)
+        first[1:] = s_desc[1:] != s_desc[:-1]
+        thresholds = s_desc[first]
+    else:
+        thresholds = np.asarray(thresholds, dtype=float).ravel()
+
+    # number of scores >= t for every threshold t
+    k = np.searchsorted(-s_desc, -thresholds, side='right')
+    total_population = len(scores)
+    p = tp_cum[-1]
+    n = fp_cum[-1]
+    tp = tp_cum[k]
+    fp = fp_cum[k]
+    values, ci_low, ci_high = _acc_sens_from_counts(
+        total_population, p, n, k, total_population - k, tp, n - fp, fp, p - tp, method=method)
+    return {
+        'thresholds': thresholds,
+        'labels': list(ACC_SENS_LABELS),
+        'values': np.round(values, N_of_decimals),
+        'ci_low': np.round(ci_low, N_of_decimals),
+        'ci_high': np.round(ci_high, N_of_decimals),
+    }
+
+def acc_sens_multiclass(gt, x, labels=None, N_of_decimals=2, method='wilson', quiet=False):
+    """Multi-class confusion matrix with one-vs-rest and macro/micro metrics.
+
+    The K x K confusion matrix is built with a single np.bincount of
+    gt * K + x; per-class sensitivity, specificity, PPV and F1 and their
+    macro/micro averages are derived from it on whole arrays.
+
+    Sensitivity, specificity and PPV intervals are binomial intervals (method
+    as in acc_sens).  F1 intervals are obtained from the interval of the
+    Jaccard index J = tp / (tp + fp + fn) through F1 = 2J / (1 + J).  Macro
+    intervals are Wald intervals treating the per-class estimates as
+    independent; micro sensitivity, PPV and F1 all equal the accuracy.
+
+    Parameters
+    ----------
+    gt : array-like
+        Ground-truth class labels.
+    x : array-like
+        Predicted class labels (same length as gt).
+    labels : list or None, default None
+        Class labels in the desired order.  When None the sorted union of
+        the labels in gt and x is used.  Cases with other labels raise.
+    N_of_decimals : int, default 2
+        Rounding precision of printed and returned values.
+    method : str, default 'wilson'
+        Confidence-interval method for the proportions.
+    quiet : bool, default False
+        Suppress printed output.
+
+    Returns
+    -------
+    dict with keys:
+        labels           : list    – class labels (row/column order)
+        confusion_matrix : ndarray – counts, rows = ground truth, columns = prediction
+        per_class        : dict    – n, sensitivity, specificity, ppv, f1
+                                     (arrays of length K) and their *_ci (K x 2)
+        macro            : dict    – sensitivity, specificity, ppv, f1 and *_ci
+        micro            : dict    – sensitivity, specificity, ppv, f1 and *_ci
+        accuracy         : float
+        accuracy_ci      : tuple
+    """
+    gt = np.asarray(gt)
+    x = np.asarray(x)
+    if gt.shape != x.shape or gt.ndim != 1:
+        raise ValueError('Ground truth and evaluation parameter must be one-dimensional and of equal length.')
+    if labels is None:
+        classes = np.unique(np.concatenate([gt, x]))
+    else:
+        classes = np.asarray(labels)
+    K = len(classes)
+    if K < 2:
+        raise ValueError('At least 2 classes are required.')
+    order = np.argsort(classes, kind='mergesort')
+    sorted_classes = classes[order]
+    gt_pos = np.clip(np.searchsorted(sorted_classes, gt), 0, K - 1)
+    x_pos = np.clip(np.searchsorted(sorted_classes, x), 0, K - 1)
+    if np.any(sorted_classes[gt_pos] != gt) or np.any(sorted_classes[x_pos] != x):
+        raise ValueError('gt and x contain labels that are not in labels.')
+    gt_code = order[gt_pos]
+    x_code = order[x_pos]
+    cm = np.bincount(gt_code * K + x_code, minlength=K * K).reshape(K, K)
+
+    total = cm.sum()
+    tp = np.diag(cm).astype(float)
+    p = cm.sum(axis=1).astype(float)
+    pp = cm.sum(axis=0).astype(float)
+    fn = p - tp
+    fp = pp - tp
+    tn = total - tp - fn - fp
+
+    sens = _safe_div(tp, p)
+    spec = _safe_div(tn, tn + fp)
+    ppv = _safe_div(tp, pp)
+    f1 = _safe_div(2 * tp, 2 * tp + fp + fn)
+    lo, hi = _proportion_confint_arr(np.stack([tp, tn, tp, tp]), np.stack([p, tn + fp, pp, tp + fp + fn]), method=method)
+    sens_ci = np.stack([lo[0], hi[0]], axis=-1)
+    spec_ci = np.stack([lo[1], hi[1]], axis=-1)
+    ppv_ci = np.stack([lo[2], hi[2]], axis=-1)
+    f1_ci = np.stack([2 * lo[3] / (1 + lo[3]), 2 * hi[3] / (1 + hi[3])], axis=-1)
+
+    # macro averages with Wald intervals (per-class estimates treated as independent)
+    z = scipy.stats.norm.ppf(0.975)
+    jac = _safe_div(tp, tp + fp + fn)
+    var = np.stack([
+        _safe_div(sens * (1 - sens), p),
+        _safe_div(spec * (1 - spec), tn + fp),
+        _safe_div(ppv * (1 - ppv), pp),
+        np.power(2 / np.power(1 + jac, 2), 2) * _safe_div(jac * (1 - jac), tp + fp + fn),
+    ])
+    est = np.stack([sens, spec, ppv, f1])
+    macro = np.nanmean(est, axis=1)
+    valid = np.sum(~np.isnan(est), axis=1)
+    macro_se = np.sqrt(_safe_div(np.nansum(var, axis=1), np.power(valid, 2)))
+    macro_ci = np.stack([macro - z * macro_se, macro + z * macro_se], axis=-1)
+
+    # micro averages: pooled one-vs-rest counts
+    micro_lo, micro_hi = _proportion_confint_arr([tp.sum(), tn.sum()], [total, tn.sum() + fp.sum()], method=method)
+    accuracy = float(_safe_div(tp.sum(), total))
+    micro_spec = float(_safe_div(tn.sum(), tn.sum() + fp.sum()))
+    acc_ci = (micro_lo[0], micro_hi[0])
+    micro_spec_ci = (micro_lo[1], micro_hi[1])
+
+    def _r(v):
+        return np.round(v, N_of_decimals)
+
+    def _t(ci):
+        return (round(float(ci[0]), N_of_decimals), round(float(ci[1]), N_of_decimals))
+
+    if not quiet:
+        print(f'Size of total population: {total:.{0}f}')
+        print(f'Number of classes: {K}')
+        print('Confusion matrix (rows: ground truth, columns: prediction):')
+        print(pd.DataFrame(cm, index=classes, columns=classes).to_string())
+        print(f'Accuracy: {accuracy * 100:.{N_of_decimals}f}% (CI: {acc_ci[0] * 100:.{N_of_decimals}f}% - {acc_ci[1] * 100:.{N_of_decimals}f}%)')
+        for k in range(K):
+            print(f'Class {classes[k]} (n = {p[k]:.{0}f}): '
+                  f'Sensitivity {sens[k] * 100:.{N_of_decimals}f}% (CI: {sens_ci[k, 0] * 100:.{N_of_decimals}f}% - {sens_ci[k, 1] * 100:.{N_of_decimals}f}%), '
+                  f'PPV {ppv[k] * 100:.{N_of_decimals}f}% (CI: {ppv_ci[k, 0] * 100:.{N_of_decimals}f}% - {ppv_ci[k, 1] * 100:.{N_of_decimals}f}%), '
+                  f'F1 {f1[k]:.{N_of_decimals}f} (CI: {f1_ci[k, 0]:.{N_of_decimals}f} - {f1_ci[k, 1]:.{N_of_decimals}f})')
+        print(f'Macro sensitivity: {macro[0] * 100:.{N_of_decimals}f}% (CI: {macro_ci[0, 0] * 100:.{N_of_decimals}f}% - {macro_ci[0, 1] * 100:.{N_of_decimals}f}%)')
+        print(f'Macro PPV: {macro[2] * 100:.{N_of_decimals}f}% (CI: {macro_ci[2, 0] * 100:.{N_of_decimals}f}% - {macro_ci[2, 1] * 100:.{N_of_decimals}f}%)')
+        print(f'Macro F1 score: {macro[3]:.{N_of_decimals}f} (CI: {macro_ci[3, 0]:.{N_of_decimals}f} - {macro_ci[3, 1]:.{N_of_decimals}f})')
+        print(f'Micro sensitivity / PPV / F1 score (= accuracy): {accuracy:.{N_of_decimals}f}')
+
+    return {
+        'labels': classes.tolist(),
+        'confusion_matrix': cm,
+        'per_class': {
+            'n': p.astype(int),
+            'sensitivity': _r(sens),
+            'sensitivity_ci': _r(sens_ci),
+            'specificity': _r(spec),
+            'specificity_ci': _r(spec_ci),
+            'ppv': _r(ppv),
+            'ppv_ci': _r(ppv_ci),
+            'f1': _r(f1),
+            'f1_ci': _r(f1_ci),
+        },
+        'macro': {
+            'sensitivity': round(float(macro[0]), N_of_decimals),
+            'sensitivity_ci': _t(macro_ci[0]),
+            'specificity': round(float(macro[1]), N_of_decimals),
+            'specificity_ci': _t(macro_ci[1]),
+            'ppv': round(float(macro[2]), N_of_decimals),
+            'ppv_ci': _t(macro_ci[2]),
+            'f1': round(float(macro[3]), N_of_decimals),
+            'f1_ci': _t(macro_ci[3]),
+        },
+        'micro': {
+            'sensitivity': round(accuracy, N_of_decimals),
+            'sensitivity_ci': _t(acc_ci),
+            'specificity': round(micro_spec, N_of_decimals),
+            'specificity_ci': _t(micro_spec_ci),
+            'ppv': round(accuracy, N_of_decimals),
+            'ppv_ci': _t(acc_ci),
+            'f1': round(accuracy, N_of_decimals),
+            'f1_ci': _t(acc_ci),
+        },
+        'accuracy': round(accuracy, N_of_decimals),
+        'accuracy_ci': _t(acc_ci),
+    }
+
+
 '''
     acc = np.sum(((gt == 1) & (i == 1) & (modal == 1)) + ((gt == 0) & (i == 0) & (modal == 1))) / np.sum(modal == 1)
     sen = np.sum((gt == 1) & (i == 1) & (modal == 1))/ np.sum((gt == 1) & (modal == 1))
@@ -843,7 +1633,12 @@ def compare_proportions_ind_sens_precision(gt_x,x,gt_y,y,N_of_decimals = 2,Np_of
     return np.array([p_sens,p_precision])
 
 
-def ROC_analysis(true_base,pred_value,positive_label,nsamples):
+def ROC_analysis(true_base,pred_value,positive_label,nsamples,return_curve = False):
+    """ROC analysis with bootstrapped AUC confidence interval and Youden-optimal cut-off.
+
+    With return_curve = True a RocCurve of the same data is returned as well:
+    (result_list, RocCurve).
+    """
     fpr, tpr, thresholds = metrics.roc_curve(true_base, pred_value, pos_label=positive_label)
     sen = tpr
     spez = 1-fpr
@@ -862,11 +1657,107 @@ def ROC_analysis(true_base,pred_value,positive_label,nsamples):
         bootstrapped_scores.append(score)
     p = np.sum((np.array(bootstrapped_scores)-0.5) <= 0)
     maxyouden = np.argmax(sen+spez-1)
-    return [auc,np.percentile(bootstrapped_scores, (2.5, 97.5)),p,[sen[maxyouden],spez[maxyouden]],thresholds[maxyouden],thresholds,sen,spez]
+    res = [auc,np.percentile(bootstrapped_scores, (2.5, 97.5)),p,[sen[maxyouden],spez[maxyouden]],thresholds[maxyouden],thresholds,sen,spez]
+    if return_curve:
+        return res, RocCurve(true_base, pred_value, positive_label)
+    return res
+
+
+class RocCurve:
+    """Precomputed ROC curve for operating-point queries.
+
+    The scores are sorted once; the object keeps the distinct thresholds in
+    descending order together with the cumulative numbers of true and false
+    positives.  A case is predicted positive when its score is >= the
+    threshold.  Every query is a binary search (O(log n)) and accepts scalars
+    or arrays.  Only numpy arrays are stored, so the object can be pickled
+    and cached.
+
+    Attributes
+    ----------
+    thresholds : ndarray – distinct scores, descending
+    tp, fp     : ndarray – true / false positives at each threshold
+    n_pos, n_neg : int   – number of positive / negative cases
+    sens, spec : ndarray – sensitivity / specificity at each threshold
+    """
+
+    def __init__(self, true_base, pred_value, positive_label=1):
+        true_base = np.asarray(true_base)
+        pred_value = np.asarray(pred_value, dtype=float)
+        if true_base.shape != pred_value.shape or true_base.ndim != 1:
+            raise ValueError('true_base and pred_value must be one-dimensional arrays of the same length.')
+        if np.any(np.isnan(pred_value)):
+            raise ValueError('pred_value must not contain NaN values.')
+        order = np.argsort(-pred_value, kind='mergesort')
+        s_desc = pred_value[order]
+        pos_desc = true_base[order] == positive_label
+        # last position of every run of equal scores
+        last = np.ones(len(s_desc), dtype=bool)
+        last[:-1] = s_desc[1:] != s_desc[:-1]
+        self.thresholds = s_desc[last]
+        self.tp = np.cumsum(pos_desc)[last]
+        self.fp = np.cumsum(~pos_desc)[last]
+        self.n_pos = int(pos_desc.sum())
+        self.n_neg = int(len(pos_desc) - self.n_pos)
+        self.sens = self.tp / self.n_pos if self.n_pos > 0 else np.full(len(self.tp), np.nan)
+        self.spec = 1 - self.fp / self.n_neg if self.n_neg > 0 else np.full(len(self.fp), np.nan)
+
+    def __repr__(self):
+        return f'RocCurve(n_pos={self.n_pos}, n_neg={self.n_neg}, n_thresholds={len(self.thresholds)})'
+
+    def counts_at(self, t, inclusive=True):
+        """True/false positives and negatives at threshold(s) t.
+
+        With inclusive = True a case is positive when score >= t, otherwise
+        when score > t.  Returns (tp, fp, tn, fn).
+        """
+        t = np.asarray(t, dtype=float)
+        side = 'right' if inclusive else 'left'
+        k = np.searchsorted(-self.thresholds, -t, side=side)
+        tp = np.concatenate([[0], self.tp])[k]
+        fp = np.concatenate([[0], self.fp])[k]
+        return tp, fp, self.n_neg - fp, self.n_pos - tp
+
+    def sens_at(self, t):
+        """Sensitivity at threshold(s) t."""
+        tp, fp, tn, fn = self.counts_at(t)
+        return _safe_div(tp, self.n_pos)
+
+    def spec_at(self, t):
+        """Specificity at threshold(s) t."""
+        tp, fp, tn, fn = self.counts_at(t)
+        return _safe_div(tn, self.n_neg)
+
+    def ppv_at(self, t):
+        """Positive predictive value at threshold(s) t."""
+        tp, fp, tn, fn = self.counts_at(t)
+        return _safe_div(tp, tp + fp)
+
+    def npv_at(self, t):
+        """Negative predictive value at threshold(s) t."""
+        tp, fp, tn, fn = self.counts_at(t)
+        return _safe_div(tn, tn + fn)
+
+    def threshold_for_sens(self, s):
+        """Largest threshold with sensitivity >= s (NaN if none reaches s)."""
+        s = np.asarray(s, dtype=float)
+        idx = np.searchsorted(self.sens, s, side='left')
+        padded = np.concatenate([self.thresholds, [np.nan]])
+        return padded[idx]
+
+    def threshold_for_spec(self, s):
+        """Smallest threshold with specificity >= s.
+
+        Returns inf when only predicting every case negative reaches s.
+        """
+        s = np.asarray(s, dtype=float)
+        idx = np.searchsorted(-self.spec, -s, side='right')
+        padded = np.concatenate([[np.inf], self.thresholds])
+        return padded[idx]
 
 
 def ROC_fig(true_base,pred_value,positive_label,nsamples=1000,label2='',x=plt.gca(),title=''):
-    uuu = ROC_analysis(np.array(true_base), np.array(pred_value), positive_label,nsamples)
+    uuu, curve = ROC_analysis(np.array(true_base), np.array(pred_value), positive_label,nsamples,return_curve = True)
     lw = 2
     plt.plot(1-uuu[-1], uuu[-2], color='purple',
              lw=lw, label=label2)
@@ -885,14 +1776,17 @@ def ROC_fig(true_base,pred_value,positive_label,nsamples=1000,label2='',x=plt.gc
     x.set_title(title,fontsize=22)
     plt.legend(loc='lower right', ncol=1,fontsize=18)
     plt.tick_params(labelsize=18)
+    oc_spez = curve.threshold_for_spec(0.75)
     print("Spez")
-    print(np.sort(uuu[-3])[np.min(np.where(np.sort(uuu[-1]) >= 0.75)[0])])
+    print(oc_spez)
     print("Sens")
-    print(np.flip(np.sort(uuu[-3]))[np.min(np.where(np.sort(uuu[-2]) >= 0.75)[0])])
+    print(curve.threshold_for_sens(0.75))
+    tp, fp, tn, fn = curve.counts_at(oc_spez)
     print("NPV")
-    print((np.sum((true_base != positive_label)))/(np.sum((true_base != positive_label)) + np.sum((true_base == positive_label) & (pred_value < np.sort(uuu[-3])[np.min(np.where(np.sort(uuu[-1]) >= 0.75)[0])]))))
+    print(curve.n_neg/(curve.n_neg + fn))
+    tp, fp, tn, fn = curve.counts_at(oc_spez, inclusive = False)
     print("PPV")
-    print((np.sum((true_base == positive_label)))/(np.sum((true_base == positive_label)) + np.sum((true_base != positive_label) & (pred_value > np.sort(uuu[-3])[np.min(np.where(np.sort(uuu[-1]) >= 0.75)[0])]))))
+    print(curve.n_pos/(curve.n_pos + fp))
 
 def multivariate_linear_lasso(data,target,columns=[],target_name='target',N_of_decimals = 2,quiet = False):
     data = np.array(data).transpose()
@@ -959,6 +1853,348 @@ def mc_nemar_test(test1,test2,gt):
          [np.sum((test1 != gt) & (test2 == gt)), np.sum((test1 != gt) & (test2 != gt))]]
     print(mcnemar(data, exact=True))
 
+
+# ---- Inter-rater agreement: intraclass correlation and kappa ----
+
+def _icc_from_ratings(Y):
+    """ICC(1), ICC(2,1) and ICC(3,1) with their mean squares for (..., n, k) ratings.
+
+    The two-way ANOVA sums of squares are computed from row, column and grand
+    means, so a whole stack of bootstrap samples is evaluated at once.
+    Returns a dict of arrays with shape Y.shape[:-2].
+    """
+    n, k = Y.shape[-2], Y.shape[-1]
+    grand = Y.mean(axis=(-2, -1))
+    row_means = Y.mean(axis=-1)
+    col_means = Y.mean(axis=-2)
+    ss_total = np.sum((Y - grand[..., None, None]) ** 2, axis=(-2, -1))
+    ss_rows = k * np.sum((row_means - grand[..., None]) ** 2, axis=-1)
+    ss_cols = n * np.sum((col_means - grand[..., None]) ** 2, axis=-1)
+    ms_rows = ss_rows / (n - 1)
+    ms_cols = ss_cols / (k - 1)
+    ms_error = (ss_total - ss_rows - ss_cols) / ((n - 1) * (k - 1))
+    ms_within = (ss_total - ss_rows) / (n * (k - 1))
+    return {
+        'ms_rows': ms_rows,
+        'ms_cols': ms_cols,
+        'ms_error': ms_error,
+        'ms_within': ms_within,
+        'ICC1': _safe_div(ms_rows - ms_within, ms_rows + (k - 1) * ms_within),
+        'ICC2,1': _safe_div(ms_rows - ms_error, ms_rows + (k - 1) * ms_error + k * (ms_cols - ms_error) / n),
+        'ICC3,1': _safe_div(ms_rows - ms_error, ms_rows + (k - 1) * ms_error),
+    }
+
+
+def _bootstrap_chunks(n, n_boot, row_size, rng_seed=42, max_elements=2 ** 24):
+    """Yield arrays of resampled subject indices, chunked to bound memory."""
+    rng = np.random.RandomState(rng_seed)
+    chunk = int(np.clip(max_elements // np.maximum(n * row_size, 1), 1, n_boot))
+    done = 0
+    while done < n_boot:
+        b = min(chunk, n_boot - done)
+        yield rng.randint(0, n, size=(b, n))
+        done += b
+
+
+def icc(data, alpha=0.05, n_boot=0, rng_seed=42, N_of_decimals=2, quiet=False):
+    """Intraclass correlation coefficients ICC(1), ICC(2,1) and ICC(3,1).
+
+    Computed from the two-way ANOVA mean squares of an (n subjects x k
+    raters) matrix (Shrout & Fleiss 1979): ICC(1) one-way random effects,
+    ICC(2,1) two-way random effects / absolute agreement, ICC(3,1) two-way
+    mixed effects / consistency.  Subjects with a missing rating are
+    excluded.
+
+    Parameters
+    ----------
+    data : array-like or DataFrame, shape (n, k)
+        One row per subject, one column per rater.
+    alpha : float, default 0.05
+        Confidence intervals are (1 - alpha).
+    n_boot : int, default 0
+        Number of bootstrap samples (subjects resampled) for percentile
+        intervals; 0 skips the bootstrap.
+    rng_seed : int, default 42
+        Seed of the bootstrap.
+    N_of_decimals : int, default 2
+        Number of decimals of the printed values.
+    quiet : bool, default False
+        Suppress printed output.
+
+    Returns
+    -------
+    DataFrame indexed by 'ICC1', 'ICC2,1', 'ICC3,1' with the columns icc, F,
+    df1, df2, p (F-test against ICC = 0), ci_low, ci_high (analytic, F
+    distribution) and, if n_boot > 0, boot_ci_low and boot_ci_high.
+    """
+    Y = np.asarray(pd.DataFrame(data).to_numpy(dtype=float))
+    if Y.ndim != 2 or Y.shape[1] < 2:
+        raise ValueError('data must be a 2-D array with at least two columns (raters).')
+    Y = Y[~np.any(np.isnan(Y), axis=1)]
+    n, k = Y.shape
+    if n < 2:
+        raise ValueError('At least two subjects with complete ratings are required.')
+    res = _icc_from_ratings(Y)
+    msr, msc, mse, msw = res['ms_rows'], res['ms_cols'], res['ms_error'], res['ms_within']
+    icc2 = res['ICC2,1']
+
+    f1 = _safe_div(msr, msw)
+    f3 = _safe_div(msr, mse)
+    df_w = n * (k - 1)
+    df_e = (n - 1) * (k - 1)
+    F = np.array([f1, f3, f3])
+    df1 = np.array([n - 1, n - 1, n - 1], dtype=float)
+    df2 = np.array([df_w, df_e, df_e], dtype=float)
+    p = scipy.stats.f.sf(F, df1, df2)
+
+    ci_low = np.empty(3)
+    ci_high = np.empty(3)
+    for i, (f, d2) in enumerate(((f1, df_w), (f3, df_e))):
+        fl = f / scipy.stats.f.ppf(1 - alpha / 2, n - 1, d2)
+        fu = f * scipy.stats.f.ppf(1 - alpha / 2, d2, n - 1)
+        ci_low[2 * i] = (fl - 1) / (fl + k - 1)
+        ci_high[2 * i] = (fu - 1) / (fu + k - 1)
+    # ICC(2,1): Satterthwaite approximation of the denominator degrees of freedom
+    fj = _safe_div(msc, mse)
+    vn = (k - 1) * (n - 1) * (k * icc2 * fj + n * (1 + (k - 1) * icc2) - k * icc2) ** 2
+    vd = (n - 1) * k ** 2 * icc2 ** 2 * fj ** 2 + (n * (1 + (k - 1) * icc2) - k * icc2) ** 2
+    v = _safe_div(vn, vd)
+    f_u = scipy.stats.f.ppf(1 - alpha / 2, n - 1, v)
+    f_l = scipy.stats.f.ppf(1 - alpha / 2, v, n - 1)
+    ci_low[1] = n * (msr - f_u * mse) / (f_u * (k * msc + (k * n - k - n) * mse) + n * msr)
+    ci_high[1] = n * (f_l * msr - mse) / (k * msc + (k * n - k - n) * mse + n * f_l * msr)
+
+    names = ['ICC1', 'ICC2,1', 'ICC3,1']
+    out = pd.DataFrame({
+        'icc': [float(res[name]) for name in names],
+        'F': F,
+        'df1': df1,
+        'df2': df2,
+        'p': p,
+        'ci_low': ci_low,
+        'ci_high': ci_high,
+    }, index=pd.Index(names, name='type'))
+    if n_boot > 0:
+        boot = {name: [] for name in names}
+        for idx in _bootstrap_chunks(n, n_boot, k, rng_seed):
+            res_b = _icc_from_ratings(Y[idx])
+            for name in names:
+                boot[name].append(res_b[name])
+        out['boot_ci_low'] = [np.nanpercentile(np.concatenate(boot[name]), 100 * alpha / 2) for name in names]
+        out['boot_ci_high'] = [np.nanpercentile(np.concatenate(boot[name]), 100 * (1 - alpha / 2)) for name in names]
+    if not quiet:
+        print(f'Intraclass correlation ({n} subjects, {k} raters):')
+        for name in names:
+            row = out.loc[name]
+            print(f'{name}: {row["icc"]:.{N_of_decimals}f} (CI: {row["ci_low"]:.{N_of_decimals}f} - {row["ci_high"]:.{N_of_decimals}f}; ' + report_p_value(row['p']) + ')')
+    return out
+
+
+def _category_codes(data):
+    """Integer category codes (-1 for missing) and sorted categories of a rating matrix."""
+    df = pd.DataFrame(data)
+    values = df.to_numpy()
+    missing = df.isna().to_numpy()
+    categories = np.unique(values[~missing])
+    codes = np.full(values.shape, -1, dtype=np.int64)
+    codes[~missing] = np.searchsorted(categories, values[~missing])
+    return codes, categories
+
+
+def _kappa_weights(K, weights):
+    """Disagreement weight matrix as in sklearn's cohen_kappa_score, scaled to a maximum of 1."""
+    if weights is None:
+        return 1.0 - np.eye(K)
+    d = np.abs(np.arange(K)[:, None] - np.arange(K)[None, :]).astype(float) / max(K - 1, 1)
+    if weights == 'linear':
+        return d
+    if weights == 'quadratic':
+        return d ** 2
+    raise ValueError("weights must be None, 'linear' or 'quadratic'.")
+
+
+def _cohen_from_tables(C, W):
+    """Kappa, observed and chance agreement from (..., K, K) tables."""
+    n = C.sum(axis=(-2, -1))
+    P = C / np.where(n > 0, n, 1)[..., None, None]
+    E = P.sum(axis=-1)[..., :, None] * P.sum(axis=-2)[..., None, :]
+    dis_o = np.sum(W * P, axis=(-2, -1))
+    dis_e = np.sum(W * E, axis=(-2, -1))
+    kappa = 1 - _safe_div(dis_o, dis_e)
+    kappa = np.where(n > 0, kappa, np.nan)
+    return kappa, 1 - dis_o, 1 - dis_e, n
+
+
+def cohen_kappa(data, raters=None, weights=None, alpha=0.05, n_boot=0, rng_seed=42, N_of_decimals=2, quiet=False):
+    """Cohen's kappa for all pairs of raters at once.
+
+    The (n x r) rating matrix is one-hot encoded once and all r*r contingency
+    tables are obtained from a single matrix product.  Missing ratings are
+    excluded per pair.  With weights='linear' or 'quadratic' the weighted
+    kappa (categories in sorted order) is given, as in sklearn's
+    cohen_kappa_score.
+
+    Parameters
+    ----------
+    data : array-like or DataFrame, shape (n, r)
+        One row per subject, one column per rater (r >= 2).
+    raters : list of str or None, default None
+        Names of the raters.  Defaults to the DataFrame columns or 0..r-1.
+    weights : None, 'linear' or 'quadratic', default None
+        Weighting of disagreements.
+    alpha : float, default 0.05
+        Confidence intervals are (1 - alpha).
+    n_boot : int, default 0
+        Number of bootstrap samples (subjects resampled) for percentile
+        intervals; 0 skips the bootstrap.
+    rng_seed : int, default 42
+        Seed of the bootstrap.
+    N_of_decimals : int, default 2
+        Number of decimals of the printed values.
+    quiet : bool, default False
+        Suppress printed output.
+
+    Returns
+    -------
+    DataFrame with one row per rater pair (index rater1, rater2) and the
+    columns n, observed_agreement, expected_agreement, kappa, se (large
+    sample approximation sqrt(po(1-po)/n)/(1-pe)), ci_low, ci_high, and if
+    n_boot > 0 boot_ci_low and boot_ci_high.
+    """
+    if raters is None and isinstance(data, pd.DataFrame):
+        raters = [str(c) for c in data.columns]
+    codes, categories = _category_codes(data)
+    if codes.ndim != 2 or codes.shape[1] < 2:
+        raise ValueError('data must be a 2-D array with at least two columns (raters).')
+    n_sub, r = codes.shape
+    if raters is None:
+        raters = [str(i) for i in range(r)]
+    if len(raters) != r:
+        raise ValueError('Number of rater names does not match the number of columns.')
+    K = max(len(categories), 1)
+    W = _kappa_weights(K, weights)
+    onehot = np.zeros((n_sub, r, K))
+    sub_idx, rater_idx = np.nonzero(codes >= 0)
+    onehot[sub_idx, rater_idx, codes[sub_idx, rater_idx]] = 1
+    O = onehot.reshape(n_sub, r * K)
+    C_all = (O.T @ O).reshape(r, K, r, K).transpose(0, 2, 1, 3)
+    I, J = np.triu_indices(r, k=1)
+    C = C_all[I, J]
+    kappa, po, pe, n = _cohen_from_tables(C, W)
+    se = _safe_div(np.sqrt(_safe_div(po * (1 - po), n)), 1 - pe)
+    z = scipy.stats.norm.ppf(1 - alpha / 2)
+    out = pd.DataFrame({
+        'n': n.astype(int),
+        'observed_agreement': po,
+        'expected_agreement': pe,
+        'kappa': kappa,
+        'se': se,
+        'ci_low': kappa - z * se,
+        'ci_high': kappa + z * se,
+    }, index=pd.MultiIndex.from_arrays([[raters[i] for i in I], [raters[j] for j in J]], names=['rater1', 'rater2']))
+    if n_boot > 0:
+        pair_codes = np.where((codes[:, I] >= 0) & (codes[:, J] >= 0), codes[:, I] * K + codes[:, J], -1)
+        n_pairs = len(I)
+        offsets = np.arange(n_pairs) * K * K
+        boot = []
+        for idx in _bootstrap_chunks(n_sub, n_boot, n_pairs, rng_seed):
+            b = idx.shape[0]
+            pc = pair_codes[idx]
+            valid = pc >= 0
+            flat = (pc + offsets + (np.arange(b) * n_pairs * K * K)[:, None, None])[valid]
+            C_b = np.bincount(flat, minlength=b * n_pairs * K * K).reshape(b, n_pairs, K, K)
+            boot.append(_cohen_from_tables(C_b, W)[0])
+        boot = np.concatenate(boot, axis=0)
+        out['boot_ci_low'] = np.nanpercentile(boot, 100 * alpha / 2, axis=0)
+        out['boot_ci_high'] = np.nanpercentile(boot, 100 * (1 - alpha / 2), axis=0)
+    if not quiet:
+        for (r1, r2), row in out.iterrows():
+            print(f"{r1} vs {r2}: Cohen's kappa = {row['kappa']:.{N_of_decimals}f} (CI: {row['ci_low']:.{N_of_decimals}f} - {row['ci_high']:.{N_of_decimals}f}; n = {int(row['n'])})")
+    return out
+
+
+def _fleiss_from_counts(N):
+    """Fleiss' kappa and category proportions from (..., n, K) category counts."""
+    m = N.sum(axis=-1)
+    agree = _safe_div(np.sum(N * (N - 1), axis=-1), m * (m - 1))
+    p_bar = np.nanmean(agree, axis=-1)
+    p_j = N.sum(axis=-2) / m.sum(axis=-1)[..., None]
+    p_e = np.sum(p_j ** 2, axis=-1)
+    return _safe_div(p_bar - p_e, 1 - p_e), p_j
+
+
+def fleiss_kappa(data, alpha=0.05, n_boot=0, rng_seed=42, N_of_decimals=2, quiet=False):
+    """Fleiss' kappa for agreement of many raters on categorical ratings.
+
+    The subject x category count table is built with one bincount; subjects
+    rated by fewer than two raters are excluded.  The standard error is the
+    large-sample one of Fleiss, Nee & Landis (1979) and assumes the same
+    number of raters for each subject.
+
+    Parameters
+    ----------
+    data : array-like or DataFrame, shape (n, r)
+        One row per subject, one column per rater (missing ratings allowed).
+    alpha : float, default 0.05
+        Confidence intervals are (1 - alpha).
+    n_boot : int, default 0
+        Number of bootstrap samples (subjects resampled) for percentile
+        intervals; 0 skips the bootstrap.
+    rng_seed : int, default 42
+        Seed of the bootstrap.
+    N_of_decimals : int, default 2
+        Number of decimals of the printed values.
+    quiet : bool, default False
+        Suppress printed output.
+
+    Returns
+    -------
+    dict with kappa, se, z, p, ci_low, ci_high, n_subjects, n_raters,
+    categories, category_proportions, category_kappa (kappa of each category
+    against all others) and, if n_boot > 0, boot_ci_low and boot_ci_high.
+    """
+    codes, categories = _category_codes(data)
+    if codes.ndim != 2 or codes.shape[1] < 2:
+        raise ValueError('data must be a 2-D array with at least two columns (raters).')
+    K = max(len(categories), 1)
+    n_sub = codes.shape[0]
+    valid = codes >= 0
+    flat = (codes + K * np.arange(n_sub)[:, None])[valid]
+    N = np.bincount(flat, minlength=n_sub * K).reshape(n_sub, K).astype(float)
+    N = N[N.sum(axis=1) >= 2]
+    n = N.shape[0]
+    if n == 0:
+        raise ValueError('No subject was rated by at least two raters.')
+    kappa, p_j = _fleiss_from_counts(N)
+    m = N.sum(axis=1).mean()
+    q_j = 1 - p_j
+    pq = np.sum(p_j * q_j)
+    se = np.sqrt(2) / (pq * np.sqrt(n * m * (m - 1))) * np.sqrt(pq ** 2 - np.sum(p_j * q_j * (q_j - p_j)))
+    z_val = _safe_div(kappa, se)
+    z = scipy.stats.norm.ppf(1 - alpha / 2)
+    category_kappa = 1 - _safe_div(np.sum(N * (N.sum(axis=1, keepdims=True) - N), axis=0), n * m * (m - 1) * p_j * q_j)
+    res = {
+        'kappa': float(kappa),
+        'se': float(se),
+        'z': float(z_val),
+        'p': float(2 * scipy.stats.norm.sf(np.abs(z_val))),
+        'ci_low': float(kappa - z * se),
+        'ci_high': float(kappa + z * se),
+        'n_subjects': int(n),
+        'n_raters': float(m),
+        'categories': categories,
+        'category_proportions': p_j,
+        'category_kappa': category_kappa,
+    }
+    if n_boot > 0:
+        boot = [_fleiss_from_counts(N[idx])[0] for idx in _bootstrap_chunks(n, n_boot, K, rng_seed)]
+        boot = np.concatenate(boot)
+        res['boot_ci_low'] = float(np.nanpercentile(boot, 100 * alpha / 2))
+        res['boot_ci_high'] = float(np.nanpercentile(boot, 100 * (1 - alpha / 2)))
+    if not quiet:
+        print(f"Fleiss' kappa ({n} subjects, {m:g} raters per subject on average): {res['kappa']:.{N_of_decimals}f} (CI: {res['ci_low']:.{N_of_decimals}f} - {res['ci_high']:.{N_of_decimals}f}; " + report_p_value(res['p']) + ')')
+    return res
+
 def get_table_desc(var):
     print(np.sum(np.isnan(var)))
     print(get_desc(var[np.where(tzu.mri_mi == 1)[0]].dropna()))
@@ -1123,6 +2359,106 @@ def size_noninf(cv,theta0,margin,alpha,targetpower,steps = 2, bk = 2):
         power = power_noninf(alpha, lmargin, diffm,sem=se*np.sqrt(bk/n), df=n-1)
     return n
 
+def _power_noninf_arr(alpha, lmargin, diffm, sem, df, method='shifted_t'):
+    """Array version of power_noninf; method='noncentral_t' uses the noncentral t distribution."""
+    tval = scipy.stats.t.ppf(1 - alpha, df)
+    tau = _safe_div(diffm - lmargin, sem)
+    tau = np.where(lmargin > 0, -tau, tau)
+    if method == 'shifted_t':
+        return 1 - scipy.stats.t.cdf(tval, df, loc=tau)
+    if method == 'noncentral_t':
+        return scipy.stats.nct.sf(tval, df, tau)
+    raise ValueError("method must be 'shifted_t' or 'noncentral_t'.")
+
+def size_noninf_bisect(cv, theta0, margin, alpha=0.025, targetpower=0.8, steps=2, bk=2, method='shifted_t', max_n=10**7):
+    """Sample size for non-inferiority by bracketing and bisection.
+
+    Gives the same n as size_noninf (the first n = n0, n0 + steps, ... with
+    power >= targetpower, starting from sampleN0_noninf), but brackets the
+    solution by doubling and bisects on the grid of steps instead of
+    stepping one by one.  All arguments broadcast, so many scenarios are
+    solved at once.  Scenarios whose power does not reach targetpower
+    below max_n (e.g. theta0 on the wrong side of the margin) give NaN.
+    The search starts at n >= 2 so that the t distribution has at least
+    one degree of freedom.
+    method='noncentral_t' evaluates the power with the noncentral t
+    distribution instead of the shifted t of power_noninf.
+    """
+    cv, theta0, margin = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (cv, theta0, margin)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n0 = bk * np.power(cv, 2) * np.power(scipy.stats.norm.ppf(targetpower) + scipy.stats.norm.ppf(1 - alpha), 2) / np.power(theta0 - margin, 2)
+        n0 = steps * np.round(n0 / steps)
+    n_min = steps * np.ceil(2 / steps)
+    n0 = np.where(np.isfinite(n0), np.clip(n0, n_min, max_n), np.nan)
+
+    def _power(n):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return _power_noninf_arr(alpha, margin, theta0, cv * np.sqrt(bk / n), n - 1, method)
+
+    result = np.where(_power(n0) >= targetpower, n0, np.nan)
+    todo = np.isnan(result) & ~np.isnan(n0)
+    # bracket: hi_k steps above n0 with power >= target, lo_k steps with power < target
+    lo_k = np.zeros(n0.shape)
+    hi_k = np.ones(n0.shape)
+    ok = _power(n0 + steps * hi_k) >= targetpower
+    while np.any(todo & ~ok):
+        grow = todo & ~ok & (n0 + steps * hi_k * 2 <= max_n)
+        if not np.any(grow):
+            break
+        lo_k = np.where(grow, hi_k, lo_k)
+        hi_k = np.where(grow, hi_k * 2, hi_k)
+        ok = np.where(grow, _power(n0 + steps * hi_k) >= targetpower, ok)
+    todo &= ok
+    while np.any(todo & (hi_k - lo_k > 1)):
+        mid = np.floor((lo_k + hi_k) / 2)
+        passed = _power(n0 + steps * mid) >= targetpower
+        active = todo & (hi_k - lo_k > 1)
+        hi_k = np.where(active & passed, mid, hi_k)
+        lo_k = np.where(active & ~passed, mid, lo_k)
+    result = np.where(todo, n0 + steps * hi_k, result)
+    return result[()] if result.ndim == 0 else result
+
+def power_surface_noninf(margins, theta0s, cvs, ns=None, alpha=0.025, targetpower=0.8, steps=2, bk=2, method='shifted_t'):
+    """Power and required sample size of non-inferiority over a grid of scenarios.
+
+    Every combination of margin, theta0 (expected difference) and cv is
+    evaluated with array-valued t distribution calls.  With ns the power at
+    each of the given sample sizes is added.
+
+    Parameters
+    ----------
+    margins, theta0s, cvs : array-like
+        Values of the non-inferiority margin, the expected difference and
+        the coefficient of variation (standard deviation) to combine.
+    ns : array-like or None, default None
+        Sample sizes at which the power is evaluated.
+    alpha, targetpower, steps, bk :
+        As in size_noninf.
+    method : str, default 'shifted_t'
+        'shifted_t' (as power_noninf) or 'noncentral_t'.
+
+    Returns
+    -------
+    DataFrame in long format with the columns margin, theta0, cv, n_required
+    (size_noninf_bisect; NaN if not reachable) and, if ns is given, n and
+    power (one row per scenario and n).
+    """
+    M, T, C = np.meshgrid(np.atleast_1d(np.asarray(margins, dtype=float)),
+                          np.atleast_1d(np.asarray(theta0s, dtype=float)),
+                          np.atleast_1d(np.asarray(cvs, dtype=float)), indexing='ij')
+    M, T, C = M.ravel(), T.ravel(), C.ravel()
+    n_req = size_noninf_bisect(C, T, M, alpha, targetpower, steps, bk, method)
+    res = pd.DataFrame({'margin': M, 'theta0': T, 'cv': C, 'n_required': n_req})
+    if ns is None:
+        return res
+    ns = np.atleast_1d(np.asarray(ns, dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        power = _power_noninf_arr(alpha, M[:, None], T[:, None], C[:, None] * np.sqrt(bk / ns[None, :]), ns[None, :] - 1, method)
+    res = res.loc[res.index.repeat(len(ns))].reset_index(drop=True)
+    res['n'] = np.tile(ns, len(M))
+    res['power'] = power.ravel()
+    return res
+
 # mögliche parameter
 '''alpha=0.025
 targetpower=0.8
@@ -1199,6 +2535,360 @@ def non_superiority_wilcoxon_abs(x,y, relad, alpha):
         sig = 1
     return tstat, sig, pval
 
+def non_inferiority_batch(df, reference_cols, candidate_cols, relad, alpha=0.025, test='non-inferiority', method='both', adjust='holm', N_of_decimals=2, quiet=False):
+    """Non-inferiority / non-superiority tests for many endpoint pairs at once.
+
+    Frame-level variant of non_inferiority_ttest, non_superiority_ttest,
+    non_inferiority_wilcoxon, non_superiority_wilcoxon and
+    non_superiority_wilcoxon_abs: the paired t statistics and the
+    signed-rank statistics of all reference/candidate column pairs are
+    computed vectorized and the p-values are adjusted for multiplicity.
+    Rows with NaN in one column of a pair are excluded for that pair.
+
+    Parameters
+    ----------
+    df : DataFrame
+        One row per measurement.
+    reference_cols, candidate_cols : list of str
+        Reference (x) and candidate (y) column of each endpoint pair.
+    relad : float or array-like
+        Relative allowable difference, one value for all pairs or one per
+        pair.
+    alpha : float, default 0.025
+        Significance level (H0 is rejected for p <= alpha).
+    test : str, default 'non-inferiority'
+        'non-inferiority' (H0: y < x - delta), 'non-superiority'
+        (H0: y > x + delta) or 'non-superiority-abs' (H0: |y - x| > |delta|).
+    method : str, default 'both'
+        'ttest', 'wilcoxon' or 'both'.
+    adjust : str, default 'holm'
+        Multiple testing correction passed to statsmodels' multipletests
+        (e.g. 'holm', 'bonferroni', 'fdr_bh'), applied across the pairs.
+    N_of_decimals : int, default 2
+        Number of decimals of the printed values.
+    quiet : bool, default False
+        Suppress printed output.
+
+    Returns
+    -------
+    DataFrame indexed by (reference, candidate) with n and relad and per
+    test (prefix t_ / W_) the statistic, p, p_adj, sig (p <= alpha) and
+    sig_adj (adjusted p <= alpha).  Statistics and p-values equal the
+    single-pair functions.
+    """
+    reference_cols = list(reference_cols)
+    candidate_cols = list(candidate_cols)
+    if len(reference_cols) != len(candidate_cols):
+        raise ValueError('reference_cols and candidate_cols must have the same length.')
+    if test not in ('non-inferiority', 'non-superiority', 'non-superiority-abs'):
+        raise ValueError("test must be 'non-inferiority', 'non-superiority' or 'non-superiority-abs'.")
+    if method not in ('ttest', 'wilcoxon', 'both'):
+        raise ValueError("method must be 'ttest', 'wilcoxon' or 'both'.")
+    X = df[reference_cols].to_numpy(dtype=float)
+    Y = df[candidate_cols].to_numpy(dtype=float)
+    relad = np.broadcast_to(np.asarray(relad, dtype=float), (len(reference_cols),))
+    delta = X * relad
+    if test == 'non-inferiority':
+        D = (X - delta) - Y
+        alternative = 'less'
+    elif test == 'non-superiority':
+        D = (X + delta) - Y
+        alternative = 'greater'
+    else:
+        D = np.abs(delta) - np.abs(Y - X)
+        alternative = 'greater'
+    n = np.sum(~np.isnan(D), axis=0)
+    res = pd.DataFrame({'n': n, 'relad': relad},
+                       index=pd.MultiIndex.from_arrays([reference_cols, candidate_cols], names=['reference', 'candidate']))
+
+    def _add(prefix, stat, p):
+        res[prefix + 'stat'] = stat
+        res[prefix + 'p'] = p
+        p_adj = np.full(p.shape, np.nan)
+        ok = ~np.isnan(p)
+        if np.any(ok):
+            p_adj[ok] = multipletests(p[ok], method=adjust)[1]
+        res[prefix + 'p_adj'] = p_adj
+        res[prefix + 'sig'] = (p <= alpha).astype(int)
+        res[prefix + 'sig_adj'] = (p_adj <= alpha).astype(int)
+
+    if method in ('ttest', 'both'):
+        mean_d = _safe_div(np.nansum(D, axis=0), n)
+        sd_d = np.sqrt(_safe_div(np.nansum((D - mean_d) ** 2, axis=0), n - 1))
+        t = _safe_div(mean_d, _safe_div(sd_d, np.sqrt(n)))
+        with np.errstate(invalid='ignore'):
+            p = scipy.stats.t.cdf(t, n - 1) if alternative == 'less' else scipy.stats.t.sf(t, n - 1)
+        _add('t_', t, p)
+    if method in ('wilcoxon', 'both'):
+        stat, p = _signed_rank_test(D.T, alternative)
+        _add('W_', stat, p)
+
+    if not quiet:
+        print(f'{test.capitalize()} testing of {len(reference_cols)} endpoint pairs ({adjust} adjusted, alpha = {alpha}):')
+        for prefix, name in (('t_', 't-test'), ('W_', 'Wilcoxon test')):
+            if prefix + 'p' in res:
+                print(f'{name}: {int(res[prefix + "sig"].sum())} significant unadjusted, {int(res[prefix + "sig_adj"].sum())} significant after adjustment')
+    return res
+
+
+# ---- Monte Carlo power of the Wilcoxon non-inferiority / non-superiority tests ----
+
+_SIGNRANK_COUNTS = {}
+
+def _signrank_counts(n):
+    """Number of sign assignments giving each value 0..n(n+1)/2 of W+ (cached)."""
+    if n not in _SIGNRANK_COUNTS:
+        c = np.zeros(n * (n + 1) // 2 + 1)
+        c[0] = 1
+        for j in range(1, n + 1):
+            c[j:] = c[j:] + c[:-j].copy()
+        _SIGNRANK_COUNTS[n] = c
+    return _SIGNRANK_COUNTS[n]
+
+
+def _signed_rank_test(d, alternative='two-sided'):
+    """Wilcoxon signed-rank test on every row of d (R, n), as scipy.stats.wilcoxon.
+
+    Zeros are dropped (zero_method='wilcox'), no continuity correction and
+    the same choice of method as scipy's method='auto': the exact null
+    distribution for n <= 50 without ties or zeros, the complete sign-flip
+    permutation distribution for n <= 13 with ties or zeros, the tie
+    corrected normal approximation otherwise.  NaN entries are ignored.
+    Returns (statistic, p) where statistic is min(W+, W-) for a two-sided
+    test and W+ otherwise.
+    """
+    d = np.atleast_2d(np.asarray(d, dtype=float))
+    R = d.shape[0]
+    length = np.sum(~np.isnan(d), axis=1)
+    zeros = np.sum(d == 0, axis=1)
+    nz = np.where(d == 0, np.nan, d)
+    ranks, tie_term = _rank_columns(np.abs(nz).T)
+    ranks = ranks.T
+    count = length - zeros
+    r_plus = np.nansum(np.where(nz > 0, ranks, 0.0), axis=1)
+    r_minus = count * (count + 1) / 2 - r_plus
+    se = np.sqrt((count * (count + 1) * (2 * count + 1) - tie_term / 2) / 24)
+    z = _safe_div(r_plus - count * (count + 1) / 4, se)
+    p = _p_from_z(z, alternative)
+
+    tied = (tie_term > 0) | (zeros > 0)
+    exact = (length <= 50) & ~tied & (count > 0)
+    for m in np.unique(count[exact]):
+        rows = exact & (count == m)
+        c = _signrank_counts(int(m))
+        cdf = np.cumsum(c) / c.sum()
+        sf = 1 - np.concatenate([[0], cdf[:-1]])
+        w = r_plus[rows].astype(int)
+        if alternative == 'less':
+            p[rows] = cdf[w]
+        elif alternative == 'greater':
+            p[rows] = sf[w]
+        else:
+            p[rows] = np.clip(2 * np.minimum(sf[w], cdf[w]), 0, 1)
+    perm = (length <= 13) & tied & (length > 0)
+    for m in np.unique(length[perm]):
+        rows = np.flatnonzero(perm & (length == m))
+        signs = ((np.arange(2 ** int(m))[:, None] >> np.arange(int(m))[None, :]) & 1).astype(float)
+        # zeros and missing values contribute nothing whatever their sign
+        rk = np.where(np.isnan(ranks[rows]), 0.0, ranks[rows])
+        order = np.argsort(np.isnan(d[rows]), axis=1, kind='stable')[:, :int(m)]
+        null = np.take_along_axis(rk, order, axis=1) @ signs.T
+        obs = r_plus[rows][:, None]
+        gamma = np.abs(1e-14 * obs)
+        p_less = np.mean(null <= obs + gamma, axis=1)
+        p_greater = np.mean(null >= obs - gamma, axis=1)
+        if alternative == 'less':
+            p[rows] = p_less
+        elif alternative == 'greater':
+            p[rows] = p_greater
+        else:
+            p[rows] = np.clip(2 * np.minimum(p_less, p_greater), 0, 1)
+    p = np.where((count > 0) | perm, p, np.nan)
+    statistic = np.minimum(r_plus, r_minus) if alternative == 'two-sided' else r_plus
+    return statistic, p
+
+
+def _simulate_pairs(rng, size, n, generator):
+    """Replicate datasets as one (size, n, 2) array of (x, y) pairs."""
+    kind = generator[0]
+    if kind == 'pilot':
+        pilot = generator[1]
+        return pilot[rng.integers(0, pilot.shape[0], size=(size, n))]
+    if kind == 'sampler':
+        x, y = generator[1](rng, (size, n))
+        return np.stack([x, y], axis=-1)
+    mean, sd, rho = generator[1], generator[2], generator[3]
+    cov = np.array([[sd[0] ** 2, rho * sd[0] * sd[1]], [rho * sd[0] * sd[1], sd[1] ** 2]])
+    data = rng.multivariate_normal(mean, cov, size=(size, n))
+    return np.exp(data) if kind == 'lognormal' else data
+
+
+def _wilcoxon_power_chunk(seed, size, n, relad, alpha, test, generator):
+    """Number of rejections of the non-inferiority / non-superiority test in one chunk."""
+    rng = np.random.default_rng(seed)
+    data = _simulate_pairs(rng, size, n, generator)
+    x, y = data[..., 0], data[..., 1]
+    if test == 'non-inferiority':
+        p = _signed_rank_test(x * (1 - relad) - y, alternative='less')[1]
+    else:
+        p = _signed_rank_test(x * (1 + relad) - y, alternative='greater')[1]
+    return int(np.sum(p <= alpha))
+
+
+def power_wilcoxon_noninf(n, relad, alpha=0.025, test='non-inferiority', pilot=None, distribution='normal', mean=(0, 0), sd=(1, 1), rho=0.0, sampler=None, n_sim=10000, chunk_size=1000, target_se=None, n_jobs=1, rng_seed=42, quiet=False):
+    """Simulated power of non_inferiority_wilcoxon / non_superiority_wilcoxon.
+
+    Replicate datasets of n pairs (x, y) are generated chunk-wise as one
+    (chunk_size, n, 2) array, the signed-rank test of every replicate is
+    evaluated with vectorized ranking (same p-values as scipy.stats.wilcoxon)
+    and the rejection rate at alpha is the power.
+
+    Parameters
+    ----------
+    n : int
+        Number of pairs per dataset.
+    relad : float
+        Relative margin as in non_inferiority_wilcoxon.
+    alpha : float, default 0.025
+        Significance level (H0 is rejected for p <= alpha).
+    test : str, default 'non-inferiority'
+        'non-inferiority' or 'non-superiority'.
+    pilot : array-like (m, 2) or tuple (x, y), optional
+        Pilot data; pairs are resampled with replacement.  Takes precedence
+        over the distribution arguments.
+    distribution : str, default 'normal'
+        'normal' or 'lognormal' (bivariate normal of the logarithms).
+    mean, sd, rho :
+        Means, standard deviations and correlation of (x, y) (of log(x),
+        log(y) for 'lognormal').
+    sampler : callable, optional
+        Custom generator sampler(rng, shape) -> (x, y), each of the given
+        shape; must be picklable (module level) if n_jobs > 1.
+    n_sim : int, default 10000
+        Maximum number of simulated datasets.
+    chunk_size : int, default 1000
+        Datasets per chunk.
+    target_se : float or None, default None
+        Stop early once the Monte Carlo standard error of the power is
+        below target_se (checked after each chunk, at least two chunks).
+    n_jobs : int, default 1
+        Number of worker processes.  The result does not depend on n_jobs:
+        chunk i always uses the i-th seed and chunks are consumed in order.
+    rng_seed : int, default 42
+        Seed of the simulation.
+    quiet : bool, default False
+        Suppress printed output.
+
+    Returns
+    -------
+    dict with power, mc_se, ci_low, ci_high (Wilson interval of the
+    simulation), n_sim (datasets used), rejections and stopped_early.
+    """
+    if test not in ('non-inferiority', 'non-superiority'):
+        raise ValueError("test must be 'non-inferiority' or 'non-superiority'.")
+    if pilot is not None:
+        if isinstance(pilot, tuple) and len(pilot) == 2:
+            pilot = np.column_stack([np.asarray(pilot[0], dtype=float), np.asarray(pilot[1], dtype=float)])
+        pilot = np.asarray(pilot, dtype=float)
+        if pilot.ndim != 2 or pilot.shape[1] != 2:
+            raise ValueError('pilot must be an (m, 2) array or a tuple (x, y).')
+        generator = ('pilot', pilot[~np.any(np.isnan(pilot), axis=1)])
+    elif sampler is not None:
+        generator = ('sampler', sampler)
+    elif distribution in ('normal', 'lognormal'):
+        generator = (distribution, tuple(mean), tuple(sd), rho)
+    else:
+        raise ValueError("distribution must be 'normal' or 'lognormal'.")
+
+    n_chunks = int(np.ceil(n_sim / chunk_size))
+    sizes = [min(chunk_size, n_sim - i * chunk_size) for i in range(n_chunks)]
+    seeds = np.random.SeedSequence(rng_seed).spawn(n_chunks)
+    args = [(seeds[i], sizes[i], int(n), relad, alpha, test, generator) for i in range(n_chunks)]
+
+    def _done(rejections, m, i):
+        if target_se is None or i < 2:
+            return False
+        p_adj = (rejections + 0.5) / (m + 1)
+        return np.sqrt(p_adj * (1 - p_adj) / m) <= target_se
+
+    rejections = 0
+    m = 0
+    stopped_early = False
+    if n_jobs == 1:
+        for i, a in enumerate(args):
+            rejections += _wilcoxon_power_chunk(*a)
+            m += a[1]
+            if _done(rejections, m, i + 1) and i + 1 < n_chunks:
+                stopped_early = True
+                break
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            futures = [pool.submit(_wilcoxon_power_chunk, *a) for a in args]
+            for i, fut in enumerate(futures):
+                rejections += fut.result()
+                m += args[i][1]
+                if _done(rejections, m, i + 1) and i + 1 < n_chunks:
+                    stopped_early = True
+                    for f in futures[i + 1:]:
+                        f.cancel()
+                    break
+
+    power = rejections / m
+    ci_low, ci_high = proportion_confint(rejections, m, alpha=0.05, method='wilson')
+    res = {
+        'power': power,
+        'mc_se': float(np.sqrt(power * (1 - power) / m)),
+        'ci_low': float(ci_low),
+        'ci_high': float(ci_high),
+        'n_sim': m,
+        'rejections': rejections,
+        'stopped_early': stopped_early,
+    }
+    if not quiet:
+        print(f'Simulated power of the {test} Wilcoxon test with n = {int(n)}: {power:.3f} (MC standard error: {res["mc_se"]:.4f}; {m} datasets)')
+    return res
+
+
+def size_wilcoxon_noninf(relad, targetpower=0.8, n_start=10, steps=2, n_max=10000, quiet=False, **sim_kwargs):
+    """Sample size of the Wilcoxon non-inferiority / non-superiority test by simulation.
+
+    The smallest n on the grid n_start + k*steps whose simulated power
+    (power_wilcoxon_noninf with the keyword arguments sim_kwargs) reaches
+    targetpower is found by doubling and bisection.  The same seed is used
+    for every n (common random numbers), which keeps the simulated power
+    curve monotone in practice.
+
+    Returns a dict with n (NaN if targetpower is not reached below n_max),
+    power (simulation result at n) and evaluated ({n: power}).
+    """
+    sim_kwargs['quiet'] = True
+    evaluated = {}
+
+    def _power(k):
+        n = n_start + steps * k
+        if n not in evaluated:
+            evaluated[n] = power_wilcoxon_noninf(n, relad, **sim_kwargs)
+        return evaluated[n]['power']
+
+    lo, hi = -1, 0
+    while _power(hi) < targetpower:
+        lo = hi
+        hi = max(1, 2 * hi)
+        if n_start + steps * hi > n_max:
+            if not quiet: print(f'The target power of {targetpower} is not reached with n <= {n_max}.')
+            return {'n': np.nan, 'power': np.nan, 'evaluated': {n: r['power'] for n, r in evaluated.items()}}
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if _power(mid) >= targetpower:
+            hi = mid
+        else:
+            lo = mid
+    n = n_start + steps * hi
+    if not quiet: print(f'Required sample size: n = {n} (simulated power: {evaluated[n]["power"]:.3f})')
+    return {'n': n, 'power': evaluated[n]['power'], 'evaluated': {k: r['power'] for k, r in sorted(evaluated.items())}}
+
+
 # plots
 def rconf_int_plot(data,labels, x,title='',x_label='',y_label=''):
     maxy = data.shape[0]
@@ -1318,13 +3008,94 @@ def bland_altman_bias_and_limits(data1, data2,N_of_decimals = 2, quiet = False):
     diff      = (data1 - data2)                   # Difference between data1 and data2
     md        = np.mean(diff)                   # Mean of the difference
     sd        = np.std(diff,ddof = 1, axis=0)            # Standard deviation of the difference
-    popt, pcov = scipy.optimize.curve_fit(func_fit, mean, diff)
+    popt = _ols_line(mean, diff)[:2]
     if not quiet: print(f'The mean and upper and lower limit of error is: {md:.{N_of_decimals}f} \u00B1 {1.96*sd:.{N_of_decimals}f}')
     if not quiet: print(f'The constant bias is: {popt[1]:.{N_of_decimals}f}')
     if not quiet: print(f'The proportional bias is: {popt[0]:.{N_of_decimals}f}')
     return np.array([md, 1.96*sd,popt[0],popt[1]])
 
 
+def bland_altman_batch(data, raters=None, quiet=False, N_of_decimals=2):
+    """Bland-Altman agreement for all pairs of raters or methods at once.
+
+    Vectorized counterpart of bland_altman_bias_and_limits for multi-reader
+    studies: every pair (i, j), i < j, of the columns of an (n x r) matrix is
+    evaluated in one call.  Differences are column i minus column j.  Rows
+    with NaN in either column of a pair are excluded for that pair.
+
+    Parameters
+    ----------
+    data : array-like or DataFrame, shape (n, r)
+        One row per subject, one column per rater or method.
+    raters : list of str or None, default None
+        Names of the raters.  Defaults to the DataFrame columns or 0..r-1.
+    quiet : bool, default False
+        Suppress printed output.
+    N_of_decimals : int, default 2
+        Number of decimals of the printed values.
+
+    Returns
+    -------
+    DataFrame with one row per rater pair (index rater1, rater2) and the
+    columns n, bias, sd, loa_lower, loa_upper, bias_ci_low, bias_ci_high,
+    loa_lower_ci_low, loa_lower_ci_high, loa_upper_ci_low, loa_upper_ci_high
+    (as drawn by bland_altman_plot), proportional_bias, constant_bias,
+    proportional_bias_p (t-test of the slope of difference on mean) and
+    within_subject_coefficient_of_variation.
+    """
+    if isinstance(data, pd.DataFrame):
+        if raters is None:
+            raters = [str(c) for c in data.columns]
+        data = data.to_numpy(dtype=float)
+    X = np.asarray(data, dtype=float)
+    if X.ndim != 2 or X.shape[1] < 2:
+        raise ValueError('data must be a 2-D array with at least two columns (raters).')
+    if raters is None:
+        raters = [str(i) for i in range(X.shape[1])]
+    if len(raters) != X.shape[1]:
+        raise ValueError('Number of rater names does not match the number of columns.')
+    I, J = np.triu_indices(X.shape[1], k=1)
+    A = X[:, I].T
+    B = X[:, J].T
+    diff = A - B
+    mean = (A + B) / 2
+    w = ~np.isnan(diff)
+    n = np.sum(w, axis=1)
+    md = _safe_div(np.nansum(diff, axis=1), n)
+    var = _safe_div(np.nansum((diff - md[:, None]) ** 2, axis=1), n - 1)
+    sd = np.sqrt(var)
+    with np.errstate(invalid='ignore'):
+        t_hi = scipy.stats.t.ppf(0.975, n - 1)
+    se_bias = np.sqrt(_safe_div(var, n))
+    se_loas = np.sqrt(_safe_div(3 * var, n))
+    slope, intercept, se_slope, _ = _ols_line(mean, diff)
+    with np.errstate(invalid='ignore'):
+        slope_p = 2 * scipy.stats.t.sf(np.abs(_safe_div(slope, se_slope)), n - 2)
+    s2m2 = _safe_div(np.power(diff, 2) / 2, np.power(mean, 2))
+    wscv = np.sqrt(np.nansum(s2m2, axis=1))
+    res = pd.DataFrame({
+        'n': n,
+        'bias': md,
+        'sd': sd,
+        'loa_lower': md - 1.96 * sd,
+        'loa_upper': md + 1.96 * sd,
+        'bias_ci_low': md - t_hi * se_bias,
+        'bias_ci_high': md + t_hi * se_bias,
+        'loa_lower_ci_low': md - 1.96 * sd - t_hi * se_loas,
+        'loa_lower_ci_high': md - 1.96 * sd + t_hi * se_loas,
+        'loa_upper_ci_low': md + 1.96 * sd - t_hi * se_loas,
+        'loa_upper_ci_high': md + 1.96 * sd + t_hi * se_loas,
+        'proportional_bias': slope,
+        'constant_bias': intercept,
+        'proportional_bias_p': slope_p,
+        'within_subject_coefficient_of_variation': wscv,
+    }, index=pd.MultiIndex.from_arrays([[raters[i] for i in I], [raters[j] for j in J]], names=['rater1', 'rater2']))
+    if not quiet:
+        for (r1, r2), row in res.iterrows():
+            print(f'{r1} vs {r2}: bias {row["bias"]:.{N_of_decimals}f} ± {1.96*row["sd"]:.{N_of_decimals}f} (LoA: {row["loa_lower"]:.{N_of_decimals}f} - {row["loa_upper"]:.{N_of_decimals}f}), proportional bias {row["proportional_bias"]:.{N_of_decimals}f} (' + report_p_value(row["proportional_bias_p"]) + ')')
+    return res
+
+
 
 
 
@@ -1796,7 +3567,7 @@ def poisson_negbin_rate_change(
     time_as: str = "categorical",    # "categorical" or "trend"
     exposure_col: str | None = None,
     model: str = "poisson",          # "poisson" or "negbin"
-    fixed_effects: bool = False,     # True = add CTS fixed effects via C(id_col)
+    fixed_effects: bool | str = False,  # True = C(id_col) dummies, "absorb" = absorbed unit effects
     cluster_se: bool = True,         # cluster-robust SE on CTS
     N_of_decimals: int = 3,
     Np_of_decimals: int = 3,
@@ -1831,6 +3602,12 @@ def poisson_negbin_rate_change(
         Enters as log-offset (Poisson) or multiplicative exposure (NegBin).
     model : str, default "poisson"
         "poisson" or "negbin" (Negative Binomial NB2).
+    fixed_effects : bool or "absorb", default False
+        True adds unit fixed effects as C(id_col) dummies.  "absorb" (Poisson
+        only) profiles the unit effects out instead of building one dummy
+        column per unit; rate ratios, cluster-robust SEs and the LRT are the
+        same as with dummies, but the cost no longer grows with the number
+        of units.  fit is then an AbsorbedPoissonResults.
 
     Returns
     -------
@@ -1895,29 +3672,49 @@ def poisson_negbin_rate_change(
         d["_time_num"] = d[time_col].map(tp_map).astype(float)
         time_term = "_time_num"
 
-    # --- formula --------------------------------------------------------------
-    dep_var = f"Q('{count_col}')" if " " in count_col else count_col
-    if fixed_effects:
-        formula = f"{dep_var} ~ {time_term} + C({id_col})"
-    else:
-        formula = f"{dep_var} ~ {time_term}"
-
-    # --- fit full model -------------------------------------------------------
-    fit = _fit_count_model(
-        formula=formula, data=d, model=model,
-        offset=d["_offset"], id_col=id_col, cluster_se=cluster_se,
-    )
-
-    # --- fit null model (no time effect) for omnibus LRT ----------------------
-    if fixed_effects:
-        formula_null = f"{dep_var} ~ C({id_col})"
+    # --- design matrices -----------------------------------------------------
+    # Encoded once from the categorical codes (no formula parsing) and shared
+    # by the full and the null model.  Column names follow patsy so that the
+    # fitted parameters keep their usual labels.
+    d = d.dropna(subset=[c for c in (count_col, id_col) if c is not None])
+    y = d[count_col].to_numpy(dtype=float)
+    X_time, time_names = _time_design(d, time_as, str_timepoints if time_as == "categorical" else None, time_term)
+
+    # --- fit full model and null model (no time effect) for omnibus LRT -----
+    if fixed_effects == "absorb":
+        if model.lower() != "poisson":
+            raise ValueError("fixed_effects='absorb' is only available for model='poisson'; use fixed_effects=True for negbin.")
+        fit = _fit_poisson_absorbed(y, X_time, d["_offset"], d[id_col], time_names, cluster_se=cluster_se)
+        fit_null = _fit_poisson_absorbed(y, X_time[:, :0], d["_offset"], d[id_col], [], cluster_se=cluster_se)
     else:
-        formula_null = f"{dep_var} ~ 1"
+        null_names = ["Intercept"]
+        X_null = [np.ones((len(d), 1))]
+        if fixed_effects:
+            unit_codes, units = pd.factorize(d[id_col], sort=True)
+            null_names += [f"C({id_col})[T.{u}]" for u in units[1:]]
+            X_null.append((unit_codes[:, None] == np.arange(1, len(units))[None, :]).astype(float))
+        X_null = np.hstack(X_null)
+        # patsy order: intercept, categorical terms in formula order, numeric terms
+        if time_as == "categorical":
+            exog = pd.DataFrame(np.hstack([X_null[:, :1], X_time, X_null[:, 1:]]),
+                                columns=null_names[:1] + time_names + null_names[1:], index=d.index)
+        else:
+            exog = pd.DataFrame(np.hstack([X_null, X_time]), columns=null_names + time_names, index=d.index)
+        fit = _fit_count_model(
+            formula=None, data=d, model=model,
+            offset=d["_offset"], id_col=id_col, cluster_se=cluster_se,
+            endog=y, exog=exog,
+        )
 
-    fit_null = _fit_count_model(
-        formula=formula_null, data=d, model=model,
-        offset=d["_offset"], id_col=id_col, cluster_se=cluster_se,
-    )
+        # warm start from the full model: intercept / unit effects (and alpha for NB2)
+        start_params = fit.params[null_names].to_numpy()
+        if "alpha" in fit.params.index:
+            start_params = np.append(start_params, fit.params["alpha"])
+        fit_null = _fit_count_model(
+            formula=None, data=d, model=model,
+            offset=d["_offset"], id_col=id_col, cluster_se=cluster_se,
+            endog=y, exog=exog[null_names], start_params=start_params,
+        )
 
     # Likelihood-ratio test: -2 * (ll_null - ll_full) ~ chi2(df)
     if time_as == "categorical":
@@ -1985,30 +3782,34 @@ def poisson_negbin_rate_change(
         return rr, fit
 
 
-def _fit_count_model(formula, data, model, offset, id_col=None, cluster_se=False):
-    """Internal helper: fit Poisson or NegBin GLM/discrete model."""
+def _fit_count_model(formula, data, model, offset, id_col=None, cluster_se=False, endog=None, exog=None, start_params=None):
+    """Internal helper: fit Poisson or NegBin GLM/discrete model.
+
+    Either from a patsy formula on data or, when exog is given, directly
+    from the response endog and the design matrix exog (no formula
+    parsing).  start_params warm-starts the optimiser.
+    """
 
     use_cluster = cluster_se and id_col is not None
+    fit_kwargs = {"start_params": start_params} if start_params is not None else {}
+    if use_cluster:
+        fit_kwargs.update(cov_type="cluster", cov_kwds={"groups": data[id_col]})
 
     if model.lower() == "poisson":
         fam = sm.families.Poisson()
-        if use_cluster:
-            fit = smf.glm(formula=formula, data=data, family=fam, offset=offset).fit(
-                cov_type="cluster", cov_kwds={"groups": data[id_col]}
-            )
+        if exog is not None:
+            mod = sm.GLM(endog, exog, family=fam, offset=offset)
         else:
-            fit = smf.glm(formula=formula, data=data, family=fam, offset=offset).fit()
-        return fit
+            mod = smf.glm(formula=formula, data=data, family=fam, offset=offset)
+        return mod.fit(**fit_kwargs)
 
     elif model.lower() in ("negbin", "negativebinomial", "nb"):
         exposure = np.exp(offset.values)
-        if use_cluster:
-            fit = smf.negativebinomial(formula=formula, data=data, exposure=exposure).fit(
-                cov_type="cluster", cov_kwds={"groups": data[id_col]}, disp=0
-            )
+        if exog is not None:
+            mod = sm.NegativeBinomial(endog, exog, exposure=exposure)
         else:
-            fit = smf.negativebinomial(formula=formula, data=data, exposure=exposure).fit(disp=0)
-        return fit
+            mod = smf.negativebinomial(formula=formula, data=data, exposure=exposure)
+        return mod.fit(disp=0, **fit_kwargs)
 
     else:
         raise ValueError("model must be 'poisson' or 'negbin'.")
@@ -2025,6 +3826,380 @@ def quick_overdispersion_check_poisson(fit):
         return np.nan
 
 
+class AbsorbedPoissonResults:
+    """Result of a Poisson model whose unit fixed effects were absorbed.
+
+    Mirrors the attributes of a statsmodels GLM result that
+    poisson_negbin_rate_change and its callers use: params, bse, tvalues,
+    pvalues and cov_params (time terms only; the unit effects are in fe),
+    llf, pearson_chi2, df_resid, nobs and fittedvalues.
+    """
+
+    def __init__(self, params, cov, llf, pearson_chi2, df_resid, nobs, fe, fittedvalues):
+        names = list(params.index)
+        self.params = params
+        self.cov = pd.DataFrame(cov, index=names, columns=names)
+        self.bse = pd.Series(np.sqrt(np.diag(cov)) if len(names) else [], index=names, dtype=float)
+        self.tvalues = self.params / self.bse
+        self.pvalues = pd.Series(2 * scipy.stats.norm.sf(np.abs(self.tvalues.to_numpy(dtype=float))), index=names)
+        self.llf = llf
+        self.pearson_chi2 = pearson_chi2
+        self.df_resid = df_resid
+        self.nobs = nobs
+        self.fe = fe
+        self.fittedvalues = fittedvalues
+
+    def cov_params(self):
+        return self.cov
+
+    def __repr__(self):
+        return f'AbsorbedPoissonResults(nobs={self.nobs}, units={len(self.fe)}, llf={self.llf:.4f})'
+
+
+def _fit_poisson_absorbed(y, X, offset, groups, names, cluster_se=True, tol=1e-10, maxiter=100):
+    """Poisson regression with one-way unit fixed effects absorbed (PPML).
+
+    For Poisson the unit effects have the closed form
+    alpha_g = log(sum_g y) - log(sum_g exp(x b + offset)), so they are
+    profiled out and Newton steps on b use the within-unit (mu-weighted)
+    demeaned design; no dummy matrix is built.  Coefficients, model-based
+    and cluster-robust covariance (clustered on the units, with the same
+    small-sample factor as the dummy-variable GLM) and the log-likelihood
+    equal those of the model with C(id) dummies.  Units with only zero
+    counts carry no information on b (their effect is -inf).
+    """
+    y = np.asarray(y, dtype=float)
+    X = np.asarray(X, dtype=float).reshape(len(y), -1)
+    offset = np.asarray(offset, dtype=float)
+    codes, units = pd.factorize(groups, sort=True)
+    G = len(units)
+    k = X.shape[1]
+    y_g = np.bincount(codes, weights=y, minlength=G)
+    keep = y_g[codes] > 0
+    beta = np.zeros(k)
+
+    def _mu(beta):
+        eta = X @ beta + offset
+        eta_max = np.full(G, -np.inf)
+        np.maximum.at(eta_max, codes, eta)
+        e = np.exp(eta - eta_max[codes])
+        with np.errstate(divide='ignore'):
+            alpha = np.log(y_g) - np.log(np.bincount(codes, weights=e, minlength=G)) - eta_max
+        mu = np.where(keep, np.exp(eta + np.where(np.isfinite(alpha), alpha, 0.0)[codes]), 0.0)
+        return mu, alpha
+
+    def _demeaned(mu):
+        w_g = np.bincount(codes, weights=mu, minlength=G)
+        xbar = np.column_stack([_safe_div(np.bincount(codes, weights=mu * X[:, j], minlength=G), w_g) for j in range(k)]) if k else np.zeros((G, 0))
+        return np.where(keep[:, None], X - np.nan_to_num(xbar)[codes], 0.0)
+
+    mu, alpha = _mu(beta)
+    for _ in range(maxiter if k else 0):
+        Xt = _demeaned(mu)
+        H = Xt.T @ (mu[:, None] * Xt)
+        step = np.linalg.solve(H, Xt.T @ (y - mu))
+        beta = beta + step
+        mu, alpha = _mu(beta)
+        if np.max(np.abs(step)) < tol:
+            break
+
+    Xt = _demeaned(mu)
+    H_inv = np.linalg.inv(Xt.T @ (mu[:, None] * Xt)) if k else np.zeros((0, 0))
+    if cluster_se and k:
+        scores = Xt * (y - mu)[:, None]
+        S = np.column_stack([np.bincount(codes, weights=scores[:, j], minlength=G) for j in range(k)])
+        n_obs = len(y)
+        k_full = k + G
+        c = G / (G - 1) * (n_obs - 1) / (n_obs - k_full)
+        cov = c * H_inv @ (S.T @ S) @ H_inv
+    else:
+        cov = H_inv
+    pos = mu > 0
+    llf = float(np.sum(y[pos] * np.log(mu[pos]) - mu[pos]) - np.sum(scipy.special.gammaln(y + 1)))
+    pearson_chi2 = float(np.sum((y[pos] - mu[pos]) ** 2 / mu[pos]))
+    return AbsorbedPoissonResults(
+        params=pd.Series(beta, index=names, dtype=float),
+        cov=cov,
+        llf=llf,
+        pearson_chi2=pearson_chi2,
+        df_resid=len(y) - k - G,
+        nobs=len(y),
+        fe=pd.Series(alpha, index=units),
+        fittedvalues=mu,
+    )
+
+
+def _time_design(d, time_as, str_timepoints=None, time_term=None):
+    """Time columns of the count models as an array with patsy-style names.
+
+    categorical: one treatment dummy per non-reference timepoint, named like
+    the patsy term (time_term + '[T.label]'); trend: the '_time_num' column.
+    """
+    if time_as == "categorical":
+        codes = d["_time_cat"].cat.codes.to_numpy()
+        X = (codes[:, None] == np.arange(1, len(str_timepoints))[None, :]).astype(float)
+        names = [f"{time_term}[T.{tp}]" for tp in str_timepoints[1:]]
+        return X, names
+    return d["_time_num"].to_numpy(dtype=float)[:, None], ["_time_num"]
+
+
+_RATE_BATCH_DATA = {}
+
+
+def _rate_batch_init(df, settings):
+    """Process-pool initializer: keep the data once per worker (read-only)."""
+    _RATE_BATCH_DATA["df"] = df
+    _RATE_BATCH_DATA["settings"] = settings
+
+
+def _rate_batch_task(outcome, stratum):
+    """Fit one (outcome, stratum) model of poisson_negbin_rate_change_batch; returns tidy rows."""
+    df = _RATE_BATCH_DATA["df"]
+    st = _RATE_BATCH_DATA["settings"]
+    sub = df if stratum is None else df.loc[df[st["strata_col"]] == stratum]
+    base = {"outcome": outcome, "stratum": stratum}
+    try:
+        kwargs = dict(st["kwargs"], quiet=True)
+        res, fit = poisson_negbin_rate_change(sub, st["time_col"], outcome, model="poisson", **kwargs)
+        dispersion = quick_overdispersion_check_poisson(fit)
+        chosen = st["model"]
+        if chosen == "auto":
+            use_negbin = dispersion > st["overdispersion_threshold"] and kwargs.get("fixed_effects") != "absorb"
+            chosen = "negbin" if use_negbin else "poisson"
+        if chosen == "negbin":
+            res, fit = poisson_negbin_rate_change(sub, st["time_col"], outcome, model="negbin", **kwargs)
+    except Exception as e:
+        return [dict(base, error=str(e))]
+    base.update(model=chosen, dispersion=dispersion, n_obs=int(fit.nobs))
+    if "_meta" in res:
+        meta = res["_meta"]
+        terms = [(label, rr) for label, rr in res.items() if label != "_meta"]
+    else:
+        meta = res
+        terms = [("trend", res)]
+    base.update(lrt_chi2=meta["omnibus_lrt_chi2"], lrt_df=meta["omnibus_lrt_df"], lrt_p=meta["omnibus_lrt_p"])
+    return [dict(base, term=label, RR=rr["RR"], CI_low=rr["CI_low"], CI_high=rr["CI_high"], p=rr["p"], error=None)
+            for label, rr in terms]
+
+
+def poisson_negbin_rate_change_batch(
+    df: pd.DataFrame,
+    time_col: str,
+    count_cols: list,
+    strata_col: str | None = None,
+    model: str = "auto",               # "auto", "poisson" or "negbin"
+    overdispersion_threshold: float = 1.5,
+    n_jobs: int = 1,
+    **kwargs,
+):
+    """
+    Runs poisson_negbin_rate_change for many outcomes and strata.
+
+    Every combination of count column and stratum (value of strata_col, or
+    the whole data when strata_col is None) is fitted, optionally in a
+    process pool that receives the data only once per worker.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Data as for poisson_negbin_rate_change.
+    time_col : str
+        Column that identifies the time-point.
+    count_cols : list of str
+        Count columns (outcomes) to analyse.
+    strata_col : str or None, default None
+        Column whose values define separate analyses.
+    model : str, default "auto"
+        "poisson", "negbin" or "auto": a Poisson model is fitted first and
+        replaced by Negative Binomial when quick_overdispersion_check_poisson
+        exceeds overdispersion_threshold (not with fixed_effects="absorb",
+        which is Poisson only).
+    overdispersion_threshold : float, default 1.5
+        Pearson chi2 / df_resid above which "auto" switches to negbin.
+    n_jobs : int, default 1
+        Number of worker processes.
+    **kwargs
+        Further arguments of poisson_negbin_rate_change (id_col, timepoints,
+        time_as, exposure_col, fixed_effects, cluster_se, N_of_decimals, ...).
+
+    Returns
+    -------
+    DataFrame with one row per (outcome, stratum, term): model, dispersion
+    (of the Poisson fit), n_obs, term (timepoint label or "trend"), RR,
+    CI_low, CI_high, p, lrt_chi2, lrt_df, lrt_p and error (message if the
+    model could not be fitted, otherwise None).
+    """
+    if model not in ("auto", "poisson", "negbin"):
+        raise ValueError("model must be 'auto', 'poisson' or 'negbin'.")
+    kwargs.pop("quiet", None)
+    if strata_col is None:
+        strata = [None]
+    else:
+        strata = sorted(df[strata_col].dropna().unique())
+    tasks = [(outcome, stratum) for outcome in count_cols for stratum in strata]
+    keep = [time_col] + list(count_cols) + [c for c in (strata_col, kwargs.get("id_col"), kwargs.get("exposure_col")) if c is not None]
+    data = df[list(dict.fromkeys(keep))]
+    settings = {
+        "time_col": time_col,
+        "strata_col": strata_col,
+        "model": model,
+        "overdispersion_threshold": overdispersion_threshold,
+        "kwargs": kwargs,
+    }
+    if n_jobs == 1:
+        _rate_batch_init(data, settings)
+        rows = [_rate_batch_task(*t) for t in tasks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_rate_batch_init, initargs=(data, settings)) as pool:
+            rows = list(pool.map(_rate_batch_task, *zip(*tasks)))
+    columns = ["outcome", "stratum", "model", "dispersion", "n_obs", "term", "RR", "CI_low", "CI_high", "p",
+               "lrt_chi2", "lrt_df", "lrt_p", "error"]
+    return pd.DataFrame([r for rs in rows for r in rs], columns=columns)
+
+
+_PERIOD_ALIASES = {"day": "D", "week": "W", "month": "M", "quarter": "Q", "year": "Y"}
+
+
+def _event_chunks(events, columns, chunksize):
+    """Yield DataFrame chunks of an event log given as DataFrame, CSV/Parquet path or iterable."""
+    if isinstance(events, pd.DataFrame):
+        if chunksize is None:
+            yield events[columns]
+        else:
+            for start in range(0, len(events), chunksize):
+                yield events.iloc[start:start + chunksize][columns]
+    elif isinstance(events, str):
+        if events.lower().endswith((".parquet", ".pq")):
+            try:
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise ImportError("Reading Parquet event logs requires pyarrow.") from e
+            for batch in pq.ParquetFile(events).iter_batches(batch_size=chunksize or 1_000_000, columns=columns):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(events, usecols=columns, chunksize=chunksize or 1_000_000)
+    else:
+        for chunk in events:
+            yield chunk[columns]
+
+
+def aggregate_event_counts(
+    events,
+    time_col: str,
+    id_col: str | None = None,
+    freq: str = "month",
+    periods: list | None = None,
+    units: list | None = None,
+    exposure=None,
+    exposure_col: str = "exposure",
+    count_col: str = "count",
+    chunksize: int | None = None,
+):
+    """
+    Aggregates an event log (one row per event) to counts per unit and period.
+
+    The output has one row per (unit, period) including zero-count cells and
+    is the frame poisson_negbin_rate_change expects, e.g.
+    poisson_negbin_rate_change(agg, time_col, count_col, id_col=id_col,
+    exposure_col=exposure_col).  The log is read chunk-wise, so it never has
+    to fit in memory; only the count table is kept.
+
+    Parameters
+    ----------
+    events : DataFrame, str or iterable of DataFrames
+        Event rows, a path to a CSV or Parquet file (read in chunks), or any
+        iterable of DataFrame chunks.
+    time_col : str
+        Column with the event timestamp (anything pd.to_datetime accepts).
+        In the output it holds the period label (e.g. '2024-03', '2024Q1').
+    id_col : str or None, default None
+        Column that identifies the unit (e.g. hospital).  When None, counts
+        are per period only.
+    freq : str, default "month"
+        "day", "week", "month", "quarter", "year" or a pandas period alias.
+    periods : list or None, default None
+        Periods to report.  When None, all periods from the first to the last
+        event (gaps included).  Events outside are dropped.
+    units : list or None, default None
+        Units to report, e.g. to include units without any event.  When None,
+        all units that occur in the log.
+    exposure : None, "days" or DataFrame, default None
+        "days" attaches the length of each period in days.  A DataFrame must
+        contain exposure_col and id_col and/or time_col (timestamps or
+        period labels) and is merged on the columns it has.
+    exposure_col : str, default "exposure"
+        Name of the exposure column.
+    count_col : str, default "count"
+        Name of the count column in the output.
+    chunksize : int or None, default None
+        Rows per chunk (default 1,000,000 for files; DataFrames in one piece).
+
+    Returns
+    -------
+    DataFrame with columns [id_col,] time_col, count_col [, exposure_col],
+    sorted by unit and period.
+    """
+    freq = _PERIOD_ALIASES.get(freq, freq)
+    columns = [time_col] + ([id_col] if id_col is not None else [])
+
+    parts = []
+    for chunk in _event_chunks(events, columns, chunksize):
+        per = pd.to_datetime(chunk[time_col]).dt.to_period(freq)
+        ordinals = pd.Series(per.array.asi8, index=chunk.index)
+        valid = per.notna()
+        keys = [ordinals[valid]]
+        if id_col is not None:
+            keys.insert(0, chunk.loc[valid, id_col].astype("category"))
+        parts.append(chunk.loc[valid].groupby(keys, observed=True, sort=False).size())
+    if parts:
+        counts = pd.concat(parts).groupby(level=list(range(parts[0].index.nlevels))).sum()
+    else:
+        counts = pd.Series(dtype="int64")
+
+    # --- grid of periods (and units) with zero fill ----------------------------
+    if periods is None:
+        if counts.empty:
+            raise ValueError("No events found and no periods given.")
+        ords = counts.index.get_level_values(-1)
+        first, last = pd.PeriodIndex.from_ordinals([ords.min(), ords.max()], freq=freq)
+        period_index = pd.period_range(first, last, freq=freq)
+    else:
+        period_index = pd.PeriodIndex([pd.Period(p, freq=freq) for p in periods])
+    if id_col is not None:
+        if units is None:
+            units = sorted(counts.index.get_level_values(0).unique())
+        grid = pd.MultiIndex.from_product([units, period_index.asi8], names=[id_col, time_col])
+    else:
+        grid = pd.Index(period_index.asi8, name=time_col)
+    counts.index = counts.index.set_names(grid.names)
+    out = counts.reindex(grid, fill_value=0).astype("int64").rename(count_col).reset_index()
+    label = dict(zip(period_index.asi8, period_index.astype(str)))
+    out[time_col] = out[time_col].map(label)
+
+    # --- exposure ---------------------------------------------------------------
+    if isinstance(exposure, str) and exposure == "days":
+        days = dict(zip(period_index.astype(str), (period_index.end_time.normalize() - period_index.start_time).days + 1))
+        out[exposure_col] = out[time_col].map(days).astype(float)
+    elif isinstance(exposure, pd.DataFrame):
+        if exposure_col not in exposure.columns:
+            raise ValueError(f"exposure must contain the column '{exposure_col}'.")
+        on = [c for c in (id_col, time_col) if c is not None and c in exposure.columns]
+        if not on:
+            raise ValueError("exposure must contain id_col and/or time_col to merge on.")
+        exp = exposure[on + [exposure_col]].copy()
+        if time_col in on:
+            t = exp[time_col]
+            if pd.api.types.is_datetime64_any_dtype(t):
+                exp[time_col] = t.dt.to_period(freq).astype(str)
+            else:
+                exp[time_col] = [str(pd.Period(v, freq=freq)) for v in t]
+        out = out.merge(exp, on=on, how="left")
+    elif exposure is not None:
+        raise ValueError("exposure must be None, 'days' or a DataFrame.")
+    return out
+
+
 def _laney_baseline(x_base, n_base, k, clip_limits, n_point=None):
     """Compute pbar, sigma_z, and limits from a baseline subset.
 
@@ -9,16 +9,17 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from statsmed.statsmed import (
-    stdnorm_test, get_desc, corr_two_gr, corr_scatter_figure,
+    stdnorm_test, get_desc, corr_two_gr, corr_matrix, corr_scatter_figure,
     comp_two_gr_continuous,
     bland_altman_plot, bland_altman_bias_and_limits,
-    acc_sens, acceptance_rate,
+    acc_sens, acc_sens_multiclass, acceptance_rate,
     compare_proportions_dep, compare_proportions_ind_sens_precision,
     ROC_fig,
     multivariate_linear_lasso, multivariate_logistic_lasso,
     mc_nemar_test,
     non_inferiority_ttest, non_superiority_ttest,
     non_inferiority_wilcoxon, non_superiority_wilcoxon, non_superiority_wilcoxon_abs,
+    non_inferiority_batch,
     poisson_negbin_rate_change,
 )
 
@@ -89,6 +90,25 @@ def run_correlation(df, params):
     return text, _fig_to_base64()
 
 
+def run_corr_matrix(df, params):
+    cols = params["columns"]
+    if len(cols) < 2:
+        return "Error: select at least two columns.", None
+    method = params.get("method", "auto")
+    out = {}
+    text = _capture(lambda: out.update(corr_matrix(df[cols].astype(float), cols, method=method)))
+    r = out["r"] if "r" in out else out[method]["r"]
+    size = max(6, min(0.4 * len(cols), 20))
+    fig, ax = plt.subplots(figsize=(size + 1, size))
+    im = ax.imshow(r.values, cmap='RdBu_r', vmin=-1, vmax=1)
+    ax.set_xticks(range(len(cols)))
+    ax.set_xticklabels(cols, rotation=90)
+    ax.set_yticks(range(len(cols)))
+    ax.set_yticklabels(cols)
+    fig.colorbar(im, ax=ax, label='r')
+    return text, _fig_to_base64()
+
+
 def run_comparison(df, params):
     raw = df[[params["x"], params["y"]]]
     n_before = len(raw)
@@ -122,6 +142,23 @@ def run_acc_sens(df, params):
     return text, None
 
 
+def run_acc_sens_multiclass(df, params):
+    raw = df[[params["gt"], params["x"]]]
+    n_before = len(raw)
+    sub = raw.dropna()
+    gt = sub[params["gt"]].values
+    x = sub[params["x"]].values
+    if gt.dtype.kind in 'iufb' and x.dtype.kind in 'iufb':
+        gt, x = gt.astype(float), x.astype(float)
+        # dropna() turns integer columns with gaps into floats; report labels as 1, 2, not 1.0, 2.0.
+        if np.all(np.isfinite(gt)) and np.all(np.isfinite(x)) and np.all(gt % 1 == 0) and np.all(x % 1 == 0):
+            gt, x = gt.astype(np.int64), x.astype(np.int64)
+    else:
+        gt, x = gt.astype(str), x.astype(str)
+    text = _nan_note(n_before, len(sub)) + _capture(acc_sens_multiclass, gt, x)
+    return text, None
+
+
 def run_acceptance_rate(df, params):
     col = df[params["x"]]
     n_before = len(col)
@@ -252,6 +289,20 @@ def run_non_sup(df, params):
     return _nan_note(n_before, len(sub)) + _format_noninf(label, tstat, sig, pval, relad, alpha), None
 
 
+def run_non_inf_batch(df, params):
+    refs = params["reference"]
+    cands = params["candidate"]
+    if len(refs) != len(cands) or not refs:
+        return "Error: select the same number (at least one) of reference and test columns; they are paired in order.", None
+    sub = df[refs + cands].astype(float)
+    out = {}
+    text = _capture(lambda: out.update(res=non_inferiority_batch(
+        sub, refs, cands, params["relad"], alpha=params["alpha"],
+        test=params.get("test", "non-inferiority"), method=params.get("method", "both"))))
+    res = out["res"]
+    return text + "\n" + res.round(4).to_string(), None
+
+
 def run_multivar_linear(df, params):
     target_col = params["target"]
     feature_cols = params["features"]
@@ -320,6 +371,19 @@ TESTS = {
         ],
         "run": run_correlation,
     },
+    "corr_matrix": {
+        "label": "Correlation Matrix",
+        "description": _docstring(corr_matrix),
+        "inputs": [
+            {"name": "columns", "label": "Columns", "type": "multi_column"},
+            {"name": "method", "label": "Method", "type": "select", "options": [
+                {"value": "auto", "label": "Auto (by normality)"},
+                {"value": "pearson", "label": "Pearson"},
+                {"value": "spearman", "label": "Spearman"},
+            ], "default": "auto"},
+        ],
+        "run": run_corr_matrix,
+    },
     "comparison": {
         "label": "Compare Two Groups",
         "description": _docstring(comp_two_gr_continuous),
@@ -348,6 +412,15 @@ TESTS = {
         ],
         "run": run_acc_sens,
     },
+    "acc_sens_multiclass": {
+        "label": "Multi-class Accuracy",
+        "description": _docstring(acc_sens_multiclass),
+        "inputs": [
+            {"name": "gt", "label": "Ground truth (class labels)", "type": "column"},
+            {"name": "x", "label": "Predictions (class labels)", "type": "column"},
+        ],
+        "run": run_acc_sens_multiclass,
+    },
     "acceptance_rate": {
         "label": "Acceptance rate",
         "description": "Proportion of 1s (accepted) with confidence interval for binary column.",
@@ -437,6 +510,27 @@ TESTS = {
         ],
         "run": run_non_sup,
     },
+    "non_inf_batch": {
+        "label": "Non-Inferiority / Non-Superiority (many endpoints)",
+        "description": _docstring(non_inferiority_batch),
+        "inputs": [
+            {"name": "reference", "label": "Reference columns", "type": "multi_column"},
+            {"name": "candidate", "label": "Test columns (same order)", "type": "multi_column"},
+            {"name": "test", "label": "Test", "type": "select", "options": [
+                {"value": "non-inferiority", "label": "Non-inferiority"},
+                {"value": "non-superiority", "label": "Non-superiority"},
+                {"value": "non-superiority-abs", "label": "Non-superiority (absolute)"},
+            ], "default": "non-inferiority"},
+            {"name": "method", "label": "Method", "type": "select", "options": [
+                {"value": "both", "label": "T-test and Wilcoxon"},
+                {"value": "ttest", "label": "T-test"},
+                {"value": "wilcoxon", "label": "Wilcoxon"},
+            ], "default": "both"},
+            {"name": "relad", "label": "Relative allowable difference", "type": "number", "default": 0.1},
+            {"name": "alpha", "label": "Alpha", "type": "number", "default": 0.025},
+        ],
+        "run": run_non_inf_batch,
+    },
     "multivar_linear": {
         "label": "Multivariate Linear Regression (Lasso)",
         "description": "Linear regression with L1 regularization and cross-validated alpha.",